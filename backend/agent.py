@@ -1,9 +1,10 @@
 from typing import TypedDict, Annotated, Sequence
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from config import Config
+from metrics import timed_function
+from routing import ModelRouter
 import operator
+import time
 
 class AgentState(TypedDict):
     candidate_name: str
@@ -17,11 +18,7 @@ class AgentState(TypedDict):
 
 class DocumentRequestAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.7,
-            openai_api_key=Config.OPENAI_API_KEY
-        )
+        self.router = ModelRouter(company_history=None)
         self.graph = self._build_graph()
     
     def _build_graph(self):
@@ -47,6 +44,7 @@ class DocumentRequestAgent:
         
         return workflow.compile()
     
+    @timed_function('agent.analyze_candidate')
     def analyze_candidate(self, state: AgentState) -> AgentState:
         messages = state.get("messages", [])
         messages.append(f"Analyzing candidate: {state['candidate_name']}")
@@ -65,6 +63,7 @@ class DocumentRequestAgent:
     def route_request_type(self, state: AgentState) -> str:
         return state["request_type"]
     
+    @timed_function('agent.generate_email_request')
     def generate_email_request(self, state: AgentState) -> AgentState:
         
         prompt = ChatPromptTemplate.from_messages([
@@ -104,13 +103,16 @@ BODY:
 """)
         ])
         
-        chain = prompt | self.llm
+        route = self.router.route_document_request("email").route
+        chain = prompt | self.router.model(route, temperature=0.7)
+        started = time.perf_counter()
         response = chain.invoke({
             "name": state["candidate_name"] or "Candidate",
             "email": state["candidate_email"] or "",
             "company": state["candidate_company"] or "your organization",
             "designation": state["candidate_designation"] or "the position"
         })
+        self.router.record('document_request', route, started)
         
         state["request_message"] = response.content
         messages = state.get("messages", [])
@@ -119,6 +121,7 @@ BODY:
         
         return state
     
+    @timed_function('agent.generate_sms_request')
     def generate_sms_request(self, state: AgentState) -> AgentState:
         
         prompt = ChatPromptTemplate.from_messages([
@@ -141,11 +144,14 @@ Return only the SMS text, no formatting.
 """)
         ])
         
-        chain = prompt | self.llm
+        route = self.router.route_document_request("sms").route
+        chain = prompt | self.router.model(route, temperature=0.7)
+        started = time.perf_counter()
         response = chain.invoke({
             "name": state["candidate_name"] or "Candidate",
             "phone": state["candidate_phone"] or ""
         })
+        self.router.record('document_request', route, started)
         
         state["request_message"] = response.content
         messages = state.get("messages", [])
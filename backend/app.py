@@ -1,36 +1,295 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import NotFound, HTTPException
+import math
 import os
-import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import and_, update
+from sqlalchemy.orm import undefer
 
 from config import Config
-from models import db, Candidate, Document, DocumentRequest
+from models import db, Candidate, CandidateSkill, Document, DocumentRequest, CONFIDENCE_FIELDS, REQUEST_QUEUED, REQUEST_SENT, confidence_score, skill_keys
 from resume_parser import ResumeParser
 from agent import DocumentRequestAgent
+from llm import LLMUnavailableError
+from cache import ResponseCache, SharedResponseCache, CANDIDATE_LIST_KEY, candidate_key, compute_etag
+from image_pipeline import ImageNormalizer
+from file_store import FileStore
+from deletion import delete_candidates
+from delivery import KIND_REQUEST, DeliveryWorker, build_limiters, build_transports, queue_message, recipient_for
+from serialization import candidate_payloads, payload_version
+from candidate_query import DEFAULT_LIMIT as DEFAULT_QUERY_LIMIT, MAX_LIMIT as MAX_QUERY_LIMIT, QueryError, confidence_threshold, query_candidates
+from request_lifecycle import claim_reminders, documents_received, mark_opened, worklist
+from sections import SECTION_NAMES, segment
+from embeddings import build_embedder, embed_candidate
+from similarity import SimilarityIndex, similar_candidates
+from shared_store import SharedStore
+from maintenance import MaintenanceScheduler
+from metrics import timed
+import compression
+import events
+import metrics
+import migrations
+import serialization
+import usage
+from file_serving import send_document, resolve_path, get_thumbnail, THUMBNAIL_EXTENSIONS
 
-def create_app(config_class=Config):
+def start_background_workers(app):
+    """Start the per-process background threads (file and delivery outboxes, maintenance, shared event log tail).
+    
+    Threads do not survive fork(), so a preloading server calls this in each
+    worker instead (see gunicorn.conf.py).
+    """
+    if app.config['FILE_OUTBOX_WORKER']:
+        app.extensions['file_store'].start()
+    if app.config['DELIVERY_WORKER']:
+        app.extensions['delivery_worker'].start()
+    if 'maintenance_scheduler' in app.extensions:
+        app.extensions['maintenance_scheduler'].start()
+    app.extensions['event_bus'].start()
+
+def create_app(config_class=Config, check_schema=True):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
     CORS(app)
     db.init_app(app)
+    serialization.init_app(app)
+    shared_store = SharedStore(app.config['SHARED_STATE_PATH']) if app.config['SHARED_STATE'] == 'sqlite' else None
+    events.init_app(app, db, shared_store)
+    if app.config['COMPRESSION_ENABLED']:
+        compression.init_app(app)
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app, db)
+    usage.init_app(app)
     
     os.makedirs(app.config['RESUMES_FOLDER'], exist_ok=True)
     os.makedirs(app.config['DOCUMENTS_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['THUMBNAILS_FOLDER'], exist_ok=True)
+    
+    file_store = FileStore(
+        app,
+        app.config['STAGING_FOLDER'],
+        poll_interval=app.config['FILE_OUTBOX_POLL_SECONDS'],
+        staging_max_age=app.config['STAGING_MAX_AGE_HOURS'] * 3600
+    )
+    app.extensions['file_store'] = file_store
     
     resume_parser = ResumeParser()
     document_agent = DocumentRequestAgent()
+    app.extensions['resume_parser'] = resume_parser
+    app.extensions['document_agent'] = document_agent
+    embedder = build_embedder()
+    similarity_index = SimilarityIndex(
+        app.config['EMBEDDING_INDEX_FOLDER'],
+        embedder.name,
+        embedder.dim,
+        nprobe=app.config['EMBEDDING_NPROBE'],
+        rebuild_threshold=app.config['EMBEDDING_REBUILD_THRESHOLD']
+    )
+    app.extensions['similarity_index'] = similarity_index
+    if shared_store is not None:
+        response_cache = SharedResponseCache(shared_store, app.config['RESPONSE_CACHE_SIZE'],
+                                             app.config['RESPONSE_CACHE_TTL'])
+    else:
+        response_cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'])
+    app.extensions['response_cache'] = response_cache
+    
+    def on_document_normalized(document, old_filename):
+        response_cache.invalidate(document.candidate_id)
+    
+    image_normalizer = ImageNormalizer(
+        app,
+        file_store,
+        max_workers=app.config['IMAGE_NORMALIZE_WORKERS'],
+        on_update=on_document_normalized
+    )
+    app.extensions['image_normalizer'] = image_normalizer
+    
+    delivery_worker = DeliveryWorker(
+        app,
+        build_transports(app.config),
+        build_limiters(app.config),
+        poll_interval=app.config['DELIVERY_POLL_SECONDS'],
+        batch_size=app.config['DELIVERY_BATCH_SIZE'],
+        max_attempts=app.config['DELIVERY_MAX_ATTEMPTS'],
+        retry_base=app.config['DELIVERY_RETRY_BASE_SECONDS'],
+        retry_max=app.config['DELIVERY_RETRY_MAX_SECONDS'],
+        lease_seconds=app.config['DELIVERY_LEASE_SECONDS']
+    )
+    app.extensions['delivery_worker'] = delivery_worker
     
     def allowed_file(filename, allowed_extensions):
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in allowed_extensions
     
+    def llm_unavailable_response(error):
+        response = jsonify({"error": f"AI service is temporarily unavailable, please retry shortly: {str(error)}"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, int(round(error.retry_after))))
+        return response
+    
+    def cached_json_response(key, load, candidate_id=None):
+        """Serve a JSON body from the response cache, answering If-None-Match with 304.
+        
+        `load` is only called on a cache miss and returns (payload, versions).
+        Entries are checked against payload_version() of the candidate (or of
+        all candidates), so writes by other processes are noticed as well.
+        """
+        version = compute_etag(payload_version(db.session, candidate_id))
+        entry = response_cache.get(key, version)
+        if entry is None:
+            # Read before loading: if a write invalidates the key meanwhile, the body is served but not stored
+            generation = response_cache.generation(key)
+            payload, versions = load()
+            entry = (compute_etag(versions), app.json.dumps_bytes(payload))
+            response_cache.set(key, *entry, generation=generation, version=version)
+        
+        etag, body = entry
+        response = Response(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    
+    @app.route('/api/events', methods=['GET'])
+    def event_stream():
+        """Server-sent change events; resumes after Last-Event-ID (header or ?last_event_id=)"""
+        if not app.config['EVENTS_ENABLED']:
+            return jsonify({"error": "Event stream is disabled"}), 404
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            subscription, backlog = app.extensions['event_bus'].subscribe(last_event_id)
+        except events.TooManySubscribers:
+            # Not an error status: EventSource gives up on those, but reconnects after a stream that ends
+            response = Response(f"retry: {int(app.config['EVENTS_BUSY_RETRY_SECONDS'] * 1000)}\n\n",
+                                mimetype='text/event-stream')
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        body = events.stream(
+            subscription,
+            backlog,
+            app.json.dumps,
+            keepalive=app.config['EVENTS_KEEPALIVE_SECONDS'],
+            max_seconds=app.config['EVENTS_MAX_STREAM_SECONDS']
+        )
+        response = Response(body, mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass events through unbuffered
+        return response
+    
     @app.route('/api/health', methods=['GET'])
     def health():
         return jsonify({"status": "ok", "message": "Server is running"}), 200
     
+    def save_resume_upload(file):
+        """Validate an uploaded resume and write it to the staging directory.
+        
+        Returns (unique_filename, staged_path, None) or (None, None, (error_payload, status)).
+        """
+        # Validate file selection
+        if file.filename == '':
+            return None, None, ({"error": "No file selected"}, 400)
+        
+        # Validate file format
+        if not allowed_file(file.filename, app.config['ALLOWED_RESUME_EXTENSIONS']):
+            return None, None, ({"error": "Invalid file format. Only PDF and DOCX allowed"}, 400)
+        
+        # Validate file size (check if file is empty)
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
+        file.seek(0)  # Reset file pointer
+        
+        if file_size == 0:
+            return None, None, ({"error": "Uploaded file is empty"}, 400)
+        
+        if file_size > app.config['MAX_CONTENT_LENGTH']:
+            return None, None, ({"error": f"File size exceeds maximum allowed size of {app.config['MAX_CONTENT_LENGTH'] / (1024*1024)}MB"}, 400)
+        
+        # Stage the file; it is moved into RESUMES_FOLDER only once the candidate row commits
+        filename = secure_filename(file.filename)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')  # Add microseconds for uniqueness
+        unique_filename = f"{timestamp}_{filename}"
+        with timed('file.save'):
+            staged_path = file_store.stage(file, suffix=os.path.splitext(filename)[1])
+        return unique_filename, staged_path, None
+    
+    def create_candidate_from_parse(parsed_data, unique_filename, staged_path, resume_text=None, resume_sections=None):
+        """Duplicate-check a parsed resume and store the candidate (with its text and section offsets).
+        
+        Returns (payload, status); the staged file is discarded on rejection.
+        """
+        # Validate that at least some data was extracted
+        data = parsed_data.get('data', {})
+        name = data.get('name')
+        email = data.get('email')
+        phone = data.get('phone')
+        
+        # Check if extraction was minimally successful
+        if not name and not email and not phone:
+            file_store.discard(staged_path)
+            return {
+                "error": "Failed to extract any candidate information from resume. Please ensure the resume contains readable text with at least name, email, or phone number."
+            }, 400
+        
+        # Check for duplicate candidate based on email or phone
+        duplicate = None
+        if email:
+            with timed('db.duplicate_check'):
+                duplicate = Candidate.query.filter_by(email=email).first()
+            if duplicate:
+                file_store.discard(staged_path)
+                return {
+                    "error": f"A candidate with email '{email}' already exists (ID: {duplicate.id})",
+                    "duplicate_candidate_id": duplicate.id
+                }, 409  # 409 Conflict
+        
+        if not duplicate and phone:
+            with timed('db.duplicate_check'):
+                duplicate = Candidate.query.filter_by(phone=phone).first()
+            if duplicate:
+                file_store.discard(staged_path)
+                return {
+                    "error": f"A candidate with phone '{phone}' already exists (ID: {duplicate.id})",
+                    "duplicate_candidate_id": duplicate.id
+                }, 409  # 409 Conflict
+        
+        # Create candidate record with extracted data
+        file_path = os.path.join(app.config['RESUMES_FOLDER'], unique_filename)
+        candidate = Candidate(
+            name=name,
+            email=email,
+            phone=phone,
+            company=data.get('company'),
+            designation=data.get('designation'),
+            skills=data.get('skills', []),
+            confidence_scores=parsed_data.get('confidence_scores', {}),
+            resume_filename=unique_filename,
+            resume_path=file_path,
+            resume_text=resume_text,
+            resume_sections=resume_sections,
+            extraction_status='completed'
+        )
+        candidate.skill_index = [CandidateSkill(skill=key) for key in skill_keys(candidate.skills)]
+        
+        db.session.add(candidate)
+        try:
+            with timed('resume.embed'):
+                embed_candidate(db.session, embedder, candidate)
+        except Exception as e:
+            # Not worth failing the upload over: the embeddings maintenance task fills it in later
+            app.logger.warning("Could not embed resume %s: %s", unique_filename, e)
+        promote = file_store.promote(staged_path, file_path)
+        with timed('db.commit'):
+            db.session.commit()
+        file_store.apply([promote])
+        response_cache.invalidate(candidate.id)
+        
+        return {
+            "message": "Resume uploaded and parsed successfully",
+            "candidate": candidate.to_dict()
+        }, 201
+    
     @app.route('/api/candidates/upload', methods=['POST'])
     def upload_resume():
         """Upload and parse resume with edge case handling"""
@@ -39,111 +298,35 @@ def create_app(config_class=Config):
             if 'resume' not in request.files:
                 return jsonify({"error": "No resume file provided"}), 400
             
-            file = request.files['resume']
-            
-            # Validate file selection
-            if file.filename == '':
-                return jsonify({"error": "No file selected"}), 400
-            
-            # Validate file format
-            if not allowed_file(file.filename, app.config['ALLOWED_RESUME_EXTENSIONS']):
-                return jsonify({"error": "Invalid file format. Only PDF and DOCX allowed"}), 400
-            
-            # Validate file size (check if file is empty)
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)  # Reset file pointer
-            
-            if file_size == 0:
-                return jsonify({"error": "Uploaded file is empty"}), 400
-            
-            if file_size > app.config['MAX_CONTENT_LENGTH']:
-                return jsonify({"error": f"File size exceeds maximum allowed size of {app.config['MAX_CONTENT_LENGTH'] / (1024*1024)}MB"}), 400
-            
-            # Save file temporarily
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')  # Add microseconds for uniqueness
-            unique_filename = f"{timestamp}_{filename}"
-            file_path = os.path.join(app.config['RESUMES_FOLDER'], unique_filename)
-            file.save(file_path)
+            unique_filename, staged_path, error = save_resume_upload(request.files['resume'])
+            if error:
+                return jsonify(error[0]), error[1]
             
             # Parse resume first before creating database record
             try:
-                parsed_data = resume_parser.parse_resume(file_path)
-                
-                # Validate that at least some data was extracted
-                data = parsed_data.get('data', {})
-                name = data.get('name')
-                email = data.get('email')
-                phone = data.get('phone')
-                
-                # Check if extraction was minimally successful
-                if not name and not email and not phone:
-                    # Delete the uploaded file
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                    return jsonify({
-                        "error": "Failed to extract any candidate information from resume. Please ensure the resume contains readable text with at least name, email, or phone number."
-                    }), 400
-                
-                # Check for duplicate candidate based on email or phone
-                duplicate = None
-                if email:
-                    duplicate = Candidate.query.filter_by(email=email).first()
-                    if duplicate:
-                        # Delete the uploaded file
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                        return jsonify({
-                            "error": f"A candidate with email '{email}' already exists (ID: {duplicate.id})",
-                            "duplicate_candidate_id": duplicate.id
-                        }), 409  # 409 Conflict
-                
-                if not duplicate and phone:
-                    duplicate = Candidate.query.filter_by(phone=phone).first()
-                    if duplicate:
-                        # Delete the uploaded file
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                        return jsonify({
-                            "error": f"A candidate with phone '{phone}' already exists (ID: {duplicate.id})",
-                            "duplicate_candidate_id": duplicate.id
-                        }), 409  # 409 Conflict
-                
-                # Create candidate record with extracted data
-                candidate = Candidate(
-                    name=name,
-                    email=email,
-                    phone=phone,
-                    company=data.get('company'),
-                    designation=data.get('designation'),
-                    skills=json.dumps(data.get('skills', [])),
-                    confidence_scores=json.dumps(parsed_data.get('confidence_scores', {})),
-                    resume_filename=unique_filename,
-                    resume_path=file_path,
-                    extraction_status='completed'
-                )
-                
-                db.session.add(candidate)
-                db.session.commit()
-                
-                return jsonify({
-                    "message": "Resume uploaded and parsed successfully",
-                    "candidate": candidate.to_dict()
-                }), 201
+                text = resume_parser.load_text(staged_path)
+                sections = segment(text)
+                parsed_data = resume_parser.parse_resume_with_llm(text, sections=sections)
+                payload, status = create_candidate_from_parse(parsed_data, unique_filename, staged_path, text, sections)
+                if status == 201:
+                    usage.attribute_to_candidate(payload['candidate']['id'])
+                return jsonify(payload), status
                 
             except ValueError as ve:
-                # Delete the uploaded file on parsing error
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                # Discard the staged file on parsing error
+                file_store.discard(staged_path)
                 return jsonify({
                     "error": f"Invalid resume format: {str(ve)}"
                 }), 400
+            
+            except LLMUnavailableError as e:
+                file_store.discard(staged_path)
+                return llm_unavailable_response(e)
                 
             except Exception as e:
-                # Delete the uploaded file on any error
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                # Discard the staged file on any error
+                db.session.rollback()
+                file_store.discard(staged_path)
                 return jsonify({
                     "error": f"Failed to parse resume: {str(e)}"
                 }), 500
@@ -151,24 +334,178 @@ def create_app(config_class=Config):
         except Exception as e:
             return jsonify({"error": f"Server error: {str(e)}"}), 500
     
-    @app.route('/api/candidates', methods=['GET'])
-    def get_candidates():
+    @app.route('/api/candidates/bulk-upload', methods=['POST'])
+    def bulk_upload_resumes():
+        """Upload many resumes; short ones are parsed together in batched LLM requests"""
         try:
-            candidates = Candidate.query.order_by(Candidate.created_at.desc()).all()
+            files = request.files.getlist('resumes')
+            if not files:
+                return jsonify({"error": "No resume files provided"}), 400
+            
+            if len(files) > app.config['BULK_UPLOAD_MAX_FILES']:
+                return jsonify({"error": f"Too many files. Maximum is {app.config['BULK_UPLOAD_MAX_FILES']} per request"}), 400
+            
+            results = [None] * len(files)
+            stored = {}
+            texts = {}
+            sections = {}
+            for index, file in enumerate(files):
+                unique_filename, staged_path, error = save_resume_upload(file)
+                if error:
+                    results[index] = {"filename": file.filename, "status": error[1], **error[0]}
+                    continue
+                try:
+                    texts[str(index)] = resume_parser.load_text(staged_path)
+                    sections[str(index)] = segment(texts[str(index)])
+                    stored[str(index)] = (unique_filename, staged_path)
+                except Exception as e:
+                    file_store.discard(staged_path)
+                    results[index] = {"filename": file.filename, "status": 400, "error": f"Invalid resume format: {str(e)}"}
+            
+            parsed = resume_parser.parse_resumes_batch(texts, sections) if texts else {}
+            
+            for key, (unique_filename, staged_path) in stored.items():
+                index = int(key)
+                outcome = parsed.get(key)
+                if isinstance(outcome, Exception):
+                    file_store.discard(staged_path)
+                    status = 503 if isinstance(outcome, LLMUnavailableError) else 400
+                    results[index] = {"filename": files[index].filename, "status": status, "error": f"Failed to parse resume: {str(outcome)}"}
+                    continue
+                try:
+                    payload, status = create_candidate_from_parse(outcome, unique_filename, staged_path,
+                                                                  texts[key], sections[key])
+                except Exception as e:
+                    db.session.rollback()
+                    file_store.discard(staged_path)
+                    payload, status = {"error": f"Failed to save candidate: {str(e)}"}, 500
+                results[index] = {"filename": files[index].filename, "status": status, **payload}
+            
+            created = sum(1 for r in results if r["status"] == 201)
             return jsonify({
-                "candidates": [c.to_dict() for c in candidates]
+                "message": f"{created} of {len(files)} resumes uploaded and parsed successfully",
+                "results": results
             }), 200
+            
+        except Exception as e:
+            return jsonify({"error": f"Server error: {str(e)}"}), 500
+    
+    def confidence_filters():
+        """Parse ?confidence_field=email&confidence_below=0.6 (and/or confidence_at_least) into conditions"""
+        below = request.args.get('confidence_below')
+        at_least = request.args.get('confidence_at_least')
+        if below is None and at_least is None:
+            return [], None
+        field = request.args.get('confidence_field')
+        if field not in CONFIDENCE_FIELDS:
+            return None, f"'confidence_field' must be one of: {', '.join(CONFIDENCE_FIELDS)}"
+        score = confidence_score(field)
+        conditions = []
+        try:
+            if below is not None:
+                conditions.append(score < confidence_threshold(below))
+            if at_least is not None:
+                conditions.append(score >= confidence_threshold(at_least))
+        except QueryError as e:
+            return None, str(e)
+        return conditions, None
+    
+    @app.route('/api/candidates', methods=['GET'])
+    def get_candidates():
+        try:
+            conditions, error = confidence_filters()
+            if error:
+                return jsonify({"error": error}), 400
+            if conditions:
+                # Review queues: filtered lists are cheap index lookups and are not cached
+                candidates, _ = candidate_payloads(db.session, app.json, conditions)
+                return jsonify({"candidates": candidates}), 200
+            
+            def load():
+                candidates, versions = candidate_payloads(db.session, app.json)
+                return {"candidates": candidates}, versions
+            
+            return cached_json_response(CANDIDATE_LIST_KEY, load)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+    
+    @app.route('/api/candidates/query', methods=['GET'])
+    def search_candidates():
+        """Filtered, sorted and paged candidates, e.g. ?q=status:completed skill:python sort:-created&limit=50"""
+        limit = max(1, min(request.args.get('limit', DEFAULT_QUERY_LIMIT, type=int), MAX_QUERY_LIMIT))
+        try:
+            with timed('db.query_candidates'):
+                page = query_candidates(db.session, app.json, request.args.get('q', ''), limit,
+                                        request.args.get('cursor'))
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": str(e)}), 500
+        return jsonify(page), 200
     
     @app.route('/api/candidates/<int:id>', methods=['GET'])
     def get_candidate(id):
         try:
-            candidate = Candidate.query.get_or_404(id)
-            return jsonify(candidate.to_dict()), 200
+            def load():
+                candidates, versions = candidate_payloads(db.session, app.json, [Candidate.id == id])
+                if not candidates:
+                    raise NotFound()
+                return candidates[0], versions[0]
+            
+            return cached_json_response(candidate_key(id), load, candidate_id=id)
         except Exception as e:
             return jsonify({"error": str(e)}), 404
     
+    @app.route('/api/candidates/<int:id>/sections', methods=['GET'])
+    def get_candidate_sections(id):
+        """Resume sections with offsets and text, e.g. ?names=skills,experience (default: all)"""
+        names = [name.strip() for name in request.args.get('names', '').split(',') if name.strip()] or list(SECTION_NAMES)
+        unknown = [name for name in names if name not in SECTION_NAMES]
+        if unknown:
+            return jsonify({"error": f"Unknown sections: {', '.join(unknown)}. Use: {', '.join(SECTION_NAMES)}"}), 400
+        
+        candidate = db.session.get(Candidate, id, options=[undefer(Candidate.resume_text)])
+        if candidate is None:
+            return jsonify({"error": "Candidate not found"}), 404
+        text, offsets = candidate.resume_text, candidate.resume_sections
+        if text is None:
+            # Stored before segmentation existed: extract and segment the resume file once
+            try:
+                text = resume_parser.load_text(candidate.resume_path or '')
+            except Exception as e:
+                return jsonify({"error": f"Resume text unavailable: {str(e)}"}), 404
+            offsets = segment(text)
+            # updated_at is kept: sections are not part of the candidate payloads or their ETags
+            db.session.execute(update(Candidate).where(Candidate.id == id).values(
+                resume_text=text, resume_sections=offsets, updated_at=Candidate.updated_at
+            ))
+            db.session.commit()
+        
+        offsets = offsets or {}
+        return jsonify({
+            "candidate_id": id,
+            "segmented": bool(offsets),
+            "sections": {
+                name: [{"start": start, "end": end, "text": text[start:end].strip()} for start, end in offsets[name]]
+                for name in names if name in offsets
+            }
+        }), 200
+    
+    @app.route('/api/candidates/<int:id>/similar', methods=['GET'])
+    def get_similar_candidates(id):
+        """Candidates with the most similar profiles (role, skills, experience), e.g. ?limit=10"""
+        limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+        candidate = db.session.get(Candidate, id, options=[undefer(Candidate.resume_text)])
+        if candidate is None:
+            return jsonify({"error": "Candidate not found"}), 404
+        try:
+            results, tail_size = similar_candidates(db.session, embedder, similarity_index, candidate, limit)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": f"Similarity search failed: {str(e)}"}), 500
+        similarity_index.maybe_rebuild(app, tail_size)
+        return jsonify({"candidate_id": id, "model": embedder.name, "results": results}), 200
+    
     @app.route('/api/candidates/<int:id>/request-documents', methods=['POST'])
     def request_documents(id):
         """Generate AI document request with validation"""
@@ -201,16 +538,28 @@ def create_app(config_class=Config):
                 "designation": candidate.designation
             }
             
-            result = document_agent.request_documents(candidate_data)
+            with timed('agent.request_documents'):
+                result = document_agent.request_documents(candidate_data)
             
+            # Sent by the delivery worker when the channel has a transport; otherwise delivered elsewhere
+            channel = result['request_type']
+            recipient = recipient_for(channel, candidate.email, candidate.phone)
+            deliver = channel in delivery_worker.channels and bool(recipient)
             doc_request = DocumentRequest(
                 candidate_id=candidate.id,
                 request_message=result['request_message'],
-                request_type=result['request_type'],
-                status='sent'
+                request_type=channel,
+                status=REQUEST_QUEUED if deliver else REQUEST_SENT
             )
             db.session.add(doc_request)
+            if deliver:
+                db.session.flush()
+                queue_message(db.session, candidate.id, channel, recipient, result['request_message'], KIND_REQUEST,
+                              request_id=doc_request.id)
             db.session.commit()
+            response_cache.invalidate(candidate.id)
+            if deliver:
+                delivery_worker.notify()
             
             return jsonify({
                 "message": "Document request generated successfully",
@@ -218,12 +567,15 @@ def create_app(config_class=Config):
                 "agent_logs": result.get('messages', [])
             }), 201
             
+        except LLMUnavailableError as e:
+            return llm_unavailable_response(e)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
     @app.route('/api/candidates/<int:id>/submit-documents', methods=['POST'])
     def submit_documents(id):
         """Submit candidate documents with validation"""
+        staged_paths = []
         try:
             candidate = Candidate.query.get_or_404(id)
             
@@ -232,13 +584,22 @@ def create_app(config_class=Config):
                 return jsonify({"error": "No documents provided. Please upload PAN or Aadhaar."}), 400
             
             uploaded_docs = []
+            new_documents = []
+            file_ops = []
+            
+            def reject(message):
+                # Nothing was committed: drop staged files and pending rows
+                db.session.rollback()
+                for path in staged_paths:
+                    file_store.discard(path)
+                return jsonify({"error": message}), 400
             
             # Handle PAN document
             if 'pan' in request.files:
                 pan_file = request.files['pan']
                 if pan_file.filename != '':
                     if not allowed_file(pan_file.filename, app.config['ALLOWED_DOCUMENT_EXTENSIONS']):
-                        return jsonify({"error": "Invalid PAN file format. Only PDF, JPG, JPEG, PNG allowed"}), 400
+                        return reject("Invalid PAN file format. Only PDF, JPG, JPEG, PNG allowed")
                     
                     # Check file size
                     pan_file.seek(0, os.SEEK_END)
@@ -246,10 +607,10 @@ def create_app(config_class=Config):
                     pan_file.seek(0)
                     
                     if file_size == 0:
-                        return jsonify({"error": "PAN file is empty"}), 400
+                        return reject("PAN file is empty")
                     
                     if file_size > app.config['MAX_CONTENT_LENGTH']:
-                        return jsonify({"error": f"PAN file size exceeds maximum allowed"}), 400
+                        return reject("PAN file size exceeds maximum allowed")
                     
                     # Check if PAN already exists for this candidate
                     existing_pan = Document.query.filter_by(
@@ -258,17 +619,20 @@ def create_app(config_class=Config):
                     ).first()
                     
                     if existing_pan:
-                        # Delete old PAN file
-                        if os.path.exists(existing_pan.file_path):
-                            os.remove(existing_pan.file_path)
+                        # Old PAN file and previews are removed after the commit
+                        file_ops.append(file_store.unlink(existing_pan.file_path))
+                        file_ops.append(file_store.unlink_thumbnails(existing_pan.filename))
                         # Delete old record
                         db.session.delete(existing_pan)
                     
                     filename = secure_filename(pan_file.filename)
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')  # Microseconds: served as immutable, names must not repeat
                     unique_filename = f"PAN_{id}_{timestamp}_{filename}"
                     file_path = os.path.join(app.config['DOCUMENTS_FOLDER'], unique_filename)
-                    pan_file.save(file_path)
+                    with timed('file.save'):
+                        staged_path = file_store.stage(pan_file, suffix=os.path.splitext(filename)[1])
+                    staged_paths.append(staged_path)
+                    file_ops.append(file_store.promote(staged_path, file_path))
                     
                     doc = Document(
                         candidate_id=id,
@@ -277,6 +641,7 @@ def create_app(config_class=Config):
                         file_path=file_path
                     )
                     db.session.add(doc)
+                    new_documents.append(doc)
                     uploaded_docs.append('PAN')
             
             # Handle Aadhaar document
@@ -284,7 +649,7 @@ def create_app(config_class=Config):
                 aadhaar_file = request.files['aadhaar']
                 if aadhaar_file.filename != '':
                     if not allowed_file(aadhaar_file.filename, app.config['ALLOWED_DOCUMENT_EXTENSIONS']):
-                        return jsonify({"error": "Invalid Aadhaar file format. Only PDF, JPG, JPEG, PNG allowed"}), 400
+                        return reject("Invalid Aadhaar file format. Only PDF, JPG, JPEG, PNG allowed")
                     
                     # Check file size
                     aadhaar_file.seek(0, os.SEEK_END)
@@ -292,10 +657,10 @@ def create_app(config_class=Config):
                     aadhaar_file.seek(0)
                     
                     if file_size == 0:
-                        return jsonify({"error": "Aadhaar file is empty"}), 400
+                        return reject("Aadhaar file is empty")
                     
                     if file_size > app.config['MAX_CONTENT_LENGTH']:
-                        return jsonify({"error": f"Aadhaar file size exceeds maximum allowed"}), 400
+                        return reject("Aadhaar file size exceeds maximum allowed")
                     
                     # Check if Aadhaar already exists for this candidate
                     existing_aadhaar = Document.query.filter_by(
@@ -304,17 +669,20 @@ def create_app(config_class=Config):
                     ).first()
                     
                     if existing_aadhaar:
-                        # Delete old Aadhaar file
-                        if os.path.exists(existing_aadhaar.file_path):
-                            os.remove(existing_aadhaar.file_path)
+                        # Old Aadhaar file and previews are removed after the commit
+                        file_ops.append(file_store.unlink(existing_aadhaar.file_path))
+                        file_ops.append(file_store.unlink_thumbnails(existing_aadhaar.filename))
                         # Delete old record
                         db.session.delete(existing_aadhaar)
                     
                     filename = secure_filename(aadhaar_file.filename)
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
                     unique_filename = f"AADHAAR_{id}_{timestamp}_{filename}"
                     file_path = os.path.join(app.config['DOCUMENTS_FOLDER'], unique_filename)
-                    aadhaar_file.save(file_path)
+                    with timed('file.save'):
+                        staged_path = file_store.stage(aadhaar_file, suffix=os.path.splitext(filename)[1])
+                    staged_paths.append(staged_path)
+                    file_ops.append(file_store.promote(staged_path, file_path))
 
                     doc = Document(
                         candidate_id=id,
@@ -323,12 +691,23 @@ def create_app(config_class=Config):
                         file_path=file_path
                     )
                     db.session.add(doc)
+                    new_documents.append(doc)
                     uploaded_docs.append('Aadhaar')
             
             if not uploaded_docs:
-                return jsonify({"error": "No valid documents provided"}), 400
+                return reject("No valid documents provided")
             
+            # Open requests move to opened, or fulfilled once every required document is on file
+            documents_received(db.session, id)
             db.session.commit()
+            file_store.apply(file_ops)
+            response_cache.invalidate(id)
+            
+            # Compress/normalize images in the background
+            for doc in new_documents:
+                image_normalizer.submit(doc.id)
+            # Inline normalization may have renamed files through another session
+            db.session.expire_all()
             
             return jsonify({
                 "message": f"Documents uploaded successfully: {', '.join(uploaded_docs)}",
@@ -337,44 +716,217 @@ def create_app(config_class=Config):
             
         except Exception as e:
             db.session.rollback()
+            for path in staged_paths:
+                file_store.discard(path)
             return jsonify({"error": f"Failed to upload documents: {str(e)}"}), 500
     
+    @app.route('/api/document-requests/<int:id>/opened', methods=['POST'])
+    def mark_request_opened(id):
+        """Record that the candidate opened a request (sent -> opened; later calls are no-ops)"""
+        doc_request = db.session.get(DocumentRequest, id)
+        if doc_request is None:
+            return jsonify({"error": "Document request not found"}), 404
+        try:
+            if mark_opened(db.session, id):
+                db.session.commit()
+                response_cache.invalidate(doc_request.candidate_id)
+                db.session.refresh(doc_request)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+        return jsonify({"request": doc_request.to_dict()}), 200
+    
+    @app.route('/api/document-requests/worklists/<name>', methods=['GET'])
+    def get_request_worklist(name):
+        """A page of overdue, reminders (due a reminder) or per-status requests, e.g. ?limit=50&cursor=..."""
+        limit = max(1, min(request.args.get('limit', DEFAULT_QUERY_LIMIT, type=int), MAX_QUERY_LIMIT))
+        try:
+            with timed('db.request_worklist'):
+                page = worklist(db.session, name, limit, request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        return jsonify(page), 200
+    
+    @app.route('/api/document-requests/reminders', methods=['POST'])
+    def claim_request_reminders():
+        """Claim a batch of requests due a reminder, e.g. {"limit": 50}; each is returned once and queued for delivery"""
+        body = request.get_json(silent=True) or {}
+        limit = body.get('limit', DEFAULT_QUERY_LIMIT)
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+            return jsonify({"error": "'limit' must be a positive integer"}), 400
+        try:
+            with timed('db.claim_reminders'):
+                reminders = claim_reminders(db.session, min(limit, MAX_QUERY_LIMIT),
+                                            channels=delivery_worker.channels)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": f"Failed to claim reminders: {str(e)}"}), 500
+        for candidate_id in {reminder['candidate_id'] for reminder in reminders}:
+            response_cache.invalidate(candidate_id)
+        if any(reminder['queued'] for reminder in reminders):
+            delivery_worker.notify()
+        return jsonify({"reminders": reminders}), 200
+    
     @app.route('/api/documents/<path:filename>', methods=['GET'])
     def get_document(filename):
+        """Serve a document with Range, ETag and Last-Modified support"""
         try:
-            return send_from_directory(app.config['DOCUMENTS_FOLDER'], filename)
+            return send_document(
+                app.config['DOCUMENTS_FOLDER'],
+                filename,
+                max_age=app.config['DOCUMENT_CACHE_MAX_AGE'],
+                sendfile_mode=app.config['DOCUMENT_SENDFILE_MODE'],
+                accel_prefix=app.config['DOCUMENT_ACCEL_PREFIX']
+            )
+        except NotFound:
+            return jsonify({"error": "Document not found"}), 404
+        except HTTPException:
+            # e.g. 416 for unsatisfiable ranges
+            raise
         except Exception as e:
             return jsonify({"error": str(e)}), 404
     
+    @app.route('/api/thumbnails/<path:filename>', methods=['GET'])
+    def get_document_thumbnail(filename):
+        """Serve a cached preview thumbnail of an image document"""
+        try:
+            size = request.args.get('size', app.config['THUMBNAIL_DEFAULT_SIZE'], type=int)
+            if size not in app.config['THUMBNAIL_SIZES']:
+                return jsonify({
+                    "error": f"Invalid thumbnail size. Allowed sizes: {', '.join(map(str, app.config['THUMBNAIL_SIZES']))}"
+                }), 400
+            
+            if not allowed_file(filename, THUMBNAIL_EXTENSIONS):
+                return jsonify({"error": "Thumbnails are only available for image documents"}), 415
+            
+            source_path = resolve_path(app.config['DOCUMENTS_FOLDER'], filename)
+            with timed('file.thumbnail'):
+                thumb_path = get_thumbnail(source_path, app.config['THUMBNAILS_FOLDER'], os.path.basename(source_path), size)
+            return send_document(
+                app.config['THUMBNAILS_FOLDER'],
+                os.path.basename(thumb_path),
+                max_age=app.config['DOCUMENT_CACHE_MAX_AGE']
+            )
+        except NotFound:
+            return jsonify({"error": "Document not found"}), 404
+        except Exception as e:
+            return jsonify({"error": f"Failed to generate thumbnail: {str(e)}"}), 500
+    
+    @app.route('/api/stats/image-compression', methods=['GET'])
+    def image_compression_stats():
+        """Bytes saved by the document image normalization stage"""
+        return jsonify(image_normalizer.stats()), 200
+    
+    @app.route('/api/stats/delivery', methods=['GET'])
+    def delivery_stats():
+        """Outbound message queue depth, and this process's delivery throughput and latency per channel"""
+        try:
+            return jsonify(delivery_worker.stats()), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+    
     @app.route('/api/candidates/<int:id>', methods=['DELETE'])
     def delete_candidate(id):
-        """Delete a candidate and associated files"""
+        """Delete a candidate and associated records; files are removed in the background"""
         try:
-            candidate = Candidate.query.get_or_404(id)
+            result = delete_candidates(db.session, Candidate.id == id)
+            if not result['deleted']:
+                return jsonify({"error": "Candidate not found"}), 404
+            file_store.notify()
             
-            # Delete resume file
-            if candidate.resume_path and os.path.exists(candidate.resume_path):
-                os.remove(candidate.resume_path)
+            return jsonify({
+                "message": f"Candidate {id} deleted successfully"
+            }), 200
             
-            # Delete document files
-            for document in candidate.documents:
-                if document.file_path and os.path.exists(document.file_path):
-                    os.remove(document.file_path)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": f"Failed to delete candidate: {str(e)}"}), 500
+    
+    @app.route('/api/candidates/bulk-delete', methods=['POST'])
+    def bulk_delete_candidates():
+        """Delete all candidates matching a filter, e.g. {"extraction_status": "failed", "older_than_days": 30}"""
+        try:
+            body = request.get_json(silent=True) or {}
+            conditions = []
             
-            # Delete database record (cascade will delete related records)
-            db.session.delete(candidate)
-            db.session.commit()
+            if 'ids' in body:
+                ids = body['ids']
+                if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                    return jsonify({"error": "'ids' must be a list of integers"}), 400
+                conditions.append(Candidate.id.in_(ids))
+            
+            if 'extraction_status' in body:
+                conditions.append(Candidate.extraction_status == str(body['extraction_status']))
+            
+            if 'older_than_days' in body:
+                days = body['older_than_days']
+                # A negative age would match candidates created a moment ago; nan/inf are not ages
+                if isinstance(days, bool) or not isinstance(days, (int, float)) \
+                        or not math.isfinite(days) or days < 0:
+                    return jsonify({"error": "'older_than_days' must be a non-negative number"}), 400
+                try:
+                    cutoff = datetime.utcnow() - timedelta(days=days)
+                except OverflowError:
+                    return jsonify({"error": "'older_than_days' is too large"}), 400
+                conditions.append(Candidate.created_at < cutoff)
+            
+            if not conditions:
+                return jsonify({
+                    "error": "Provide at least one filter: ids, extraction_status or older_than_days"
+                }), 400
+            
+            dry_run = body.get('dry_run', False)
+            if not isinstance(dry_run, bool):
+                # bool("false") is True: only a JSON boolean is unambiguous
+                return jsonify({"error": "'dry_run' must be true or false"}), 400
+            result = delete_candidates(
+                db.session,
+                and_(*conditions),
+                batch_size=app.config['BULK_DELETE_BATCH_SIZE'],
+                dry_run=dry_run,
+                collect_ids=False
+            )
+            if not dry_run and result['deleted']:
+                file_store.notify()
             
             return jsonify({
-                "message": f"Candidate {id} deleted successfully"
+                "dry_run": dry_run,
+                "matched": result['matched'],
+                "deleted": result['deleted']
             }), 200
             
         except Exception as e:
             db.session.rollback()
-            return jsonify({"error": f"Failed to delete candidate: {str(e)}"}), 500
+            return jsonify({"error": f"Failed to delete candidates: {str(e)}"}), 500
 
-    with app.app_context():
-        db.create_all()
+    # check_schema=False is for callers that apply migrations themselves (init_db.py)
+    if check_schema:
+        with app.app_context():
+            if app.config['AUTO_MIGRATE']:
+                migrations.upgrade(db.engine)
+            else:
+                pending = migrations.pending_migrations(db.engine)
+                if pending:
+                    # Queries read columns the old schema lacks: fail here rather than with 500s on every request
+                    raise RuntimeError(
+                        f"Database schema is behind by {len(pending)} migration(s) "
+                        f"({', '.join(m.version for m in pending)}); run `python db_manager.py migrate` "
+                        "or set AUTO_MIGRATE=true"
+                    )
+    
+    if app.config['MAINTENANCE_ENABLED']:
+        app.extensions['maintenance_scheduler'] = MaintenanceScheduler(
+            app,
+            lambda: db.session,
+            interval=app.config['MAINTENANCE_INTERVAL_HOURS'] * 3600,
+            dry_run=app.config['MAINTENANCE_DRY_RUN'],
+            batch_size=app.config['MAINTENANCE_BATCH_SIZE']
+        )
+    
+    if not app.config['DEFER_BACKGROUND_WORKERS']:
+        start_background_workers(app)
     
     return app
 
@@ -0,0 +1,356 @@
+"""
+End-to-end API benchmark for TraqCheck
+
+Runs create_app against a temp-file SQLite database with the offline LLM,
+seeds N candidates per scale and measures latency percentiles and
+throughput for every API operation.
+
+    python benchmarks/api_benchmark.py --scales 1000 10000 100000
+    python benchmarks/api_benchmark.py --save-baseline benchmarks/baseline.json
+    python benchmarks/api_benchmark.py --compare benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+# Must be set before config is imported
+os.environ['LLM_PROVIDER'] = 'offline'
+os.environ.setdefault('OPENAI_API_KEY', 'offline')
+os.environ['OCR_WORKERS'] = '0'
+os.environ['IMAGE_NORMALIZE_WORKERS'] = '0'
+
+import docx
+from PIL import Image
+
+from app import create_app
+from config import Config
+from models import db, Candidate, Document, DocumentRequest
+import migrations
+
+FIRST_NAMES = ['Aarav', 'Priya', 'Rahul', 'Ananya', 'Vikram', 'Sneha', 'Arjun', 'Kavya', 'Rohan', 'Isha']
+LAST_NAMES = ['Sharma', 'Patel', 'Iyer', 'Reddy', 'Gupta', 'Nair', 'Singh', 'Das', 'Menon', 'Joshi']
+COMPANIES = ['Infosys', 'Acme Corp', 'Globex', 'Initech', 'Umbrella Labs', 'Stark Industries']
+SKILLS = ['Python', 'SQL', 'React', 'AWS', 'Docker', 'Kubernetes', 'Java', 'Go', 'Flask', 'Kafka']
+# Dashboard filters for the query endpoint, cycled through
+QUERIES = [
+    'status:completed sort:-created',
+    'skill:kafka,go company:glo',
+    'has:documents sort:name',
+    'skill:python skill:sql -has:pending-request',
+    'confidence.email:<0.5 sort:-updated',
+]
+
+
+def make_config(root):
+    upload_folder = os.path.join(root, 'uploads')
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(root, 'benchmark.db')
+        UPLOAD_FOLDER = upload_folder
+        RESUMES_FOLDER = os.path.join(upload_folder, 'resumes')
+        DOCUMENTS_FOLDER = os.path.join(upload_folder, 'documents')
+        THUMBNAILS_FOLDER = os.path.join(upload_folder, 'thumbnails')
+        OCR_CACHE_FOLDER = os.path.join(upload_folder, 'ocr_cache')
+        EMBEDDING_INDEX_FOLDER = os.path.join(upload_folder, 'embedding_index')
+        DELIVERY_SINK_FOLDER = os.path.join(upload_folder, 'outbox')
+        DELIVERY_EMAIL_TRANSPORT = DELIVERY_SMS_TRANSPORT = 'file'
+
+    return BenchmarkConfig
+
+
+# --- synthetic resumes -------------------------------------------------------
+
+def resume_lines(index, paragraphs):
+    rng = random.Random(index)
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    lines = [
+        name,
+        f"bench.{index}@example.com | +91 9{index:09d}",
+        f"Senior Software Engineer at {rng.choice(COMPANIES)}",
+        "Skills: " + ", ".join(rng.sample(SKILLS, 4)),
+    ]
+    for p in range(paragraphs):
+        lines.append(f"Project {p}: built and operated services handling millions of requests per day "
+                     f"with {rng.choice(SKILLS)} and {rng.choice(SKILLS)}.")
+    return lines
+
+
+def make_pdf(lines):
+    """Minimal single-font PDF with a real text layer"""
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    pages = [lines[i:i + 45] for i in range(0, len(lines), 45)] or [[]]
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_lines in pages:
+        stream = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"({escape(l)}) '" for l in page_lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{i} 0 obj\n{obj}\nendobj\n".encode('latin-1'))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_docx(lines):
+    document = docx.Document()
+    for line in lines:
+        document.add_paragraph(line)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def make_resume(index):
+    # Mix of small/medium/large PDF and DOCX resumes
+    paragraphs = (2, 20, 120)[index % 3]
+    lines = resume_lines(index, paragraphs)
+    if index % 2:
+        return f"resume_{index}.docx", make_docx(lines)
+    return f"resume_{index}.pdf", make_pdf(lines)
+
+
+def make_document_image():
+    out = io.BytesIO()
+    Image.new('RGB', (1200, 800), (230, 230, 230)).save(out, format='JPEG', quality=85)
+    return out.getvalue()
+
+
+# --- seeding -----------------------------------------------------------------
+
+def seed(app, count, chunk_size=5000):
+    """Bulk insert candidates; every 10th gets a document and a request"""
+    now = datetime.utcnow()
+    with app.app_context():
+        for start in range(0, count, chunk_size):
+            rows = []
+            for i in range(start, min(start + chunk_size, count)):
+                rng = random.Random(i)
+                created = now - timedelta(minutes=count - i)
+                rows.append({
+                    'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    'email': f"seed.{i}@example.com",
+                    'phone': f"+91 8{i:09d}",
+                    'company': rng.choice(COMPANIES),
+                    'designation': 'Software Engineer',
+                    'skills': rng.sample(SKILLS, 3),
+                    'resume_filename': f"seed_{i}.pdf",
+                    'resume_path': os.path.join(app.config['RESUMES_FOLDER'], f"seed_{i}.pdf"),
+                    'extraction_status': 'completed',
+                    'confidence_scores': {'name': 0.9, 'email': round(rng.uniform(0.3, 1.0), 2)},
+                    'created_at': created,
+                    'updated_at': created,
+                })
+            db.session.execute(db.insert(Candidate), rows)
+            db.session.commit()
+        # Skill filter rows, written the way migration 0009 backfills them
+        migrations.backfill_skills(db.engine)
+
+        ids = [row[0] for row in db.session.execute(db.select(Candidate.id).where(Candidate.id % 10 == 0))]
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            db.session.execute(db.insert(Document), [
+                {'candidate_id': cid, 'document_type': 'pan', 'filename': f"PAN_{cid}.jpg",
+                 'file_path': os.path.join(app.config['DOCUMENTS_FOLDER'], f"PAN_{cid}.jpg"),
+                 'uploaded_at': now} for cid in chunk])
+            db.session.execute(db.insert(DocumentRequest), [
+                {'candidate_id': cid, 'request_message': 'Please share PAN and Aadhaar', 'request_type': 'email',
+                 'status': 'sent', 'created_at': now} for cid in chunk])
+            db.session.commit()
+
+
+# --- measurement -------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(samples, errors):
+    values = sorted(samples)
+    total = sum(values)
+    return {
+        'count': len(values),
+        'errors': errors,
+        'p50_ms': round(percentile(values, 50) * 1000, 3) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 3) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 3) if values else None,
+        'mean_ms': round(total / len(values) * 1000, 3) if values else None,
+        'throughput_rps': round(len(values) / total, 2) if total else None,
+    }
+
+
+def measure(iterations, call, expected_status):
+    samples, errors = [], 0
+    for i in range(iterations):
+        start = time.perf_counter()
+        response = call(i)
+        elapsed = time.perf_counter() - start
+        if response.status_code in expected_status:
+            samples.append(elapsed)
+        else:
+            errors += 1
+    return summarize(samples, errors)
+
+
+def run_scale(scale, iterations, keep_files=False):
+    root = tempfile.mkdtemp(prefix=f"traqcheck_bench_{scale}_")
+    try:
+        app = create_app(make_config(root))
+        client = app.test_client()
+        response_cache = app.extensions['response_cache']
+
+        started = time.perf_counter()
+        seed(app, scale)
+        seed_seconds = time.perf_counter() - started
+
+        rng = random.Random(scale)
+        ids = rng.sample(range(1, scale + 1), min(scale, iterations * 3))
+        profile_ids, request_ids, delete_ids = ids[0::3], ids[1::3], ids[2::3]
+        resumes = [make_resume(scale + i) for i in range(iterations)]
+        document_image = make_document_image()
+
+        # Cold list requests rebuild every row, so keep them bounded at large scales
+        list_cold_iterations = max(1, iterations * 1000 // scale)
+
+        def list_cold(i):
+            response_cache.clear()
+            return client.get('/api/candidates')
+
+        results = {
+            'upload': measure(iterations, lambda i: client.post(
+                '/api/candidates/upload',
+                data={'resume': (io.BytesIO(resumes[i][1]), resumes[i][0])},
+                content_type='multipart/form-data'), {201}),
+            'list_cold': measure(list_cold_iterations, list_cold, {200}),
+            'list': measure(iterations, lambda i: client.get('/api/candidates'), {200, 304}),
+            'query': measure(iterations, lambda i: client.get(
+                '/api/candidates/query', query_string={'q': QUERIES[i % len(QUERIES)], 'limit': 50}), {200}),
+            'profile': measure(len(profile_ids), lambda i: client.get(f'/api/candidates/{profile_ids[i]}'), {200}),
+            'request_documents': measure(len(request_ids), lambda i: client.post(
+                f'/api/candidates/{request_ids[i]}/request-documents'), {201}),
+            'submit_documents': measure(len(request_ids), lambda i: client.post(
+                f'/api/candidates/{request_ids[i]}/submit-documents',
+                data={'pan': (io.BytesIO(document_image), 'pan.jpg')},
+                content_type='multipart/form-data'), {201}),
+            'delete': measure(len(delete_ids), lambda i: client.delete(f'/api/candidates/{delete_ids[i]}'), {200}),
+        }
+
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+        return {'seed_seconds': round(seed_seconds, 2), 'operations': results}
+    finally:
+        if not keep_files:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def compare(current, baseline, tolerance):
+    """Return (p95 regressions beyond `tolerance` (fractional), results the baseline has no p95 for)"""
+    regressions, missing = [], []
+    for scale, result in current['results'].items():
+        base_ops = baseline.get('results', {}).get(scale, {}).get('operations', {})
+        for op, stats in result['operations'].items():
+            base = base_ops.get(op)
+            if not base or not base.get('p95_ms'):
+                missing.append(f"scale={scale} {op}: not in the baseline")
+                continue
+            if not stats.get('p95_ms'):
+                missing.append(f"scale={scale} {op}: every request failed")
+                continue
+            if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(f"scale={scale} {op}: p95 {stats['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+    return regressions, missing
+
+
+def print_table(report):
+    print(f"\n{'scale':>8} {'operation':<18} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+    for scale, result in report['results'].items():
+        for op, s in result['operations'].items():
+            print(f"{scale:>8} {op:<18} {s['count']:>5} {s['errors']:>4} {s['p50_ms'] or '-':>9} "
+                  f"{s['p95_ms'] or '-':>9} {s['p99_ms'] or '-':>9} {s['throughput_rps'] or '-':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TraqCheck API benchmark")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="Number of seeded candidates per run")
+    parser.add_argument('--iterations', type=int, default=50, help="Requests per operation")
+    parser.add_argument('--output', help="Write the JSON report to this path")
+    parser.add_argument('--save-baseline', help="Write the JSON report as the new baseline")
+    parser.add_argument('--compare', help="Baseline JSON to compare p95 latencies against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 regression (0.25 = 25%%)")
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+        },
+        'results': {}
+    }
+    for scale in args.scales:
+        print(f"Running scale {scale}...", flush=True)
+        report['results'][str(scale)] = run_scale(scale, args.iterations)
+
+    print_table(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nReport written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions, missing = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regressions detected:")
+            for line in regressions:
+                print(f"  - {line}")
+        if missing:
+            # Uncovered results would otherwise pass unchecked; refresh the baseline with --save-baseline
+            print("\n❌ Not compared:")
+            for line in missing:
+                print(f"  - {line}")
+        if regressions or missing:
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
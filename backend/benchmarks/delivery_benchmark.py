@@ -0,0 +1,110 @@
+"""
+Outbound delivery benchmark: draining a bulk-onboarding burst from the outbox
+
+Queues --messages request emails at once (as bulk onboarding does) in a
+temporary SQLite database and drains them with the delivery code the worker
+runs, against a local SMTP sink (benchmarks/smtp_sink.py) and the file sink.
+For each scenario it reports:
+
+    throughput   delivered messages per second over the whole drain
+    latency      p50/p95/p99 of queued -> handed to the transport
+    connections  SMTP connections opened (one per batch when reused)
+
+    python benchmarks/delivery_benchmark.py --messages 5000 --batch-size 100
+    python benchmarks/delivery_benchmark.py --messages 2000 --sink-latency-ms 2 --rate-per-minute 60000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import create_engine, delete, insert, select
+from sqlalchemy.orm import Session
+
+import migrations
+from delivery import EMAIL, KIND_REQUEST, PENDING, FileSinkTransport, SMTPTransport, drain_channel
+from models import Candidate, OutboundMessage
+from resilience import TokenBucket
+from smtp_sink import SMTPSink
+
+BODY = ("Dear Candidate,\n\nWe are conducting the background verification requested by your organization. "
+        "Please upload your PAN and Aadhaar using the secure link.\n\nRegards,\nTraqCheck Verification Team\n")
+
+
+def queue_burst(session, count, chunk=5000):
+    """One candidate and one pending request email per message, all queued at the same moment"""
+    session.execute(delete(OutboundMessage))
+    if not session.execute(select(Candidate.id).limit(1)).first():
+        for start in range(0, count, chunk):
+            session.execute(insert(Candidate), [
+                {'name': f'Candidate {i}', 'email': f'candidate.{i}@example.com', 'extraction_status': 'completed'}
+                for i in range(start, min(start + chunk, count))
+            ])
+    ids = list(session.execute(select(Candidate.id).order_by(Candidate.id).limit(count)).scalars())
+    now = datetime.utcnow()
+    for start in range(0, count, chunk):
+        session.execute(insert(OutboundMessage), [
+            {'candidate_id': cid, 'kind': KIND_REQUEST, 'channel': EMAIL, 'recipient': f'candidate.{cid}@example.com',
+             'subject': 'Documents for your background verification', 'body': BODY, 'status': PENDING,
+             'attempts': 0, 'next_attempt_at': now, 'created_at': now}
+            for cid in ids[start:start + chunk]
+        ])
+    session.commit()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(session, name, transport, args, sink=None):
+    queue_burst(session, args.messages)
+    limiter = TokenBucket(args.rate_per_minute, capacity=max(1.0, args.rate_per_minute / 60)) \
+        if args.rate_per_minute else None
+    connections = sink.connections if sink else 0
+    started = time.perf_counter()
+    report = drain_channel(session, EMAIL, transport, limiter, batch_size=args.batch_size)
+    seconds = time.perf_counter() - started
+    latencies = report['latencies']
+    print(f"{name:<34} {report['sent']:>7} {report['sent'] / seconds:>9.0f} "
+          f"{statistics.median(latencies):>8.2f} {percentile(latencies, 0.95):>8.2f} {percentile(latencies, 0.99):>8.2f} "
+          f"{(sink.connections - connections) if sink else '-':>6}  {report['retried'] + report['failed']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TraqCheck outbound delivery benchmark")
+    parser.add_argument('--messages', type=int, default=5000, help="Messages queued in the burst")
+    parser.add_argument('--batch-size', type=int, default=100, help="Messages claimed per round")
+    parser.add_argument('--rate-per-minute', type=float, default=0, help="Channel rate limit (0: unlimited)")
+    parser.add_argument('--sink-latency-ms', type=float, default=0, help="SMTP sink delay per accepted message")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='traqcheck_delivery_')
+    engine = create_engine('sqlite:///' + os.path.join(root, 'delivery.db'))
+    sink = SMTPSink(latency=args.sink_latency_ms / 1000).start()
+    sender = 'TraqCheck Verification <verification@traqcheck.local>'
+    try:
+        migrations.upgrade(engine)
+        print(f"{args.messages} messages, batches of {args.batch_size}, "
+              f"rate {'unlimited' if not args.rate_per_minute else f'{args.rate_per_minute:.0f}/min'}")
+        print(f"{'scenario':<34} {'sent':>7} {'msg/s':>9} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'conns':>6}  errors")
+        with Session(engine) as session:
+            run(session, 'smtp, connection per batch', SMTPTransport(
+                '127.0.0.1', sink.port, sender, messages_per_connection=args.batch_size), args, sink)
+            run(session, 'smtp, connection per message', SMTPTransport(
+                '127.0.0.1', sink.port, sender, messages_per_connection=1), args, sink)
+            run(session, 'file sink', FileSinkTransport(os.path.join(root, 'outbox'), EMAIL, sender), args)
+    finally:
+        sink.stop()
+        engine.dispose()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
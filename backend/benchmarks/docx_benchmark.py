@@ -0,0 +1,116 @@
+"""
+DOCX extraction benchmark: python-docx object model vs the streaming extractor
+
+Generates table-heavy resumes (skills matrices and project tables with
+horizontally and vertically merged cells) and reports, per document size,
+the extraction time, peak Python memory and output size of:
+
+    python-docx   the previous extract_text_from_docx (full Document, paragraphs then every cell)
+    streaming     docx_text.extract_docx_text (iterparse over word/document.xml)
+    budget        streaming with DOCX_MAX_CHARS, which stops parsing at the limit
+
+Also checks that the streaming output contains the same distinct lines as
+the python-docx output, minus the duplicates from merged cells.
+
+    python benchmarks/docx_benchmark.py --tables 10 100 500 --repeat 3
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import docx
+
+from config import Config
+from docx_text import extract_docx_text
+
+SKILLS = ['Python', 'SQL', 'React', 'AWS', 'Docker', 'Kubernetes', 'Java', 'Go', 'Flask', 'Kafka']
+
+
+def python_docx_text(file_path):
+    """The extractor this benchmark replaces, kept verbatim (including the quadratic `text +=`)"""
+    text = ""
+    doc = docx.Document(file_path)
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            text += paragraph.text + "\n"
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                if cell.text.strip():
+                    text += cell.text + "\n"
+    return text.strip()
+
+
+def make_resume(path, tables, rows=12, cols=6):
+    document = docx.Document()
+    document.add_paragraph("Priya Sharma")
+    document.add_paragraph("priya.sharma@example.com | +91 98765 43210")
+    document.add_paragraph("Senior Software Engineer at Globex")
+    for t in range(tables):
+        document.add_paragraph(f"Project {t}: platform migration and data pipelines")
+        table = document.add_table(rows=rows, cols=cols)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"{SKILLS[(r + c) % len(SKILLS)]} t{t} r{r} c{c}"
+        # Merged header across the row and a vertically merged first column, as resume templates do
+        table.cell(0, 0).merge(table.cell(0, cols - 1)).text = f"Project {t} skills matrix"
+        table.cell(1, 0).merge(table.cell(rows - 1, 0)).text = f"Stack {t}"
+    document.save(path)
+
+
+def measure(call, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = call()
+        samples.append(time.perf_counter() - started)
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(samples), peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TraqCheck DOCX extraction benchmark")
+    parser.add_argument('--tables', type=int, nargs='+', default=[10, 100, 500], help="Tables per resume")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per extractor (median is reported)")
+    parser.add_argument('--max-chars', type=int, default=Config.DOCX_MAX_CHARS, help="Budget for the budget run")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='traqcheck_docx_')
+    try:
+        print(f"{'tables':>6} {'file KB':>8} {'extractor':<12} {'ms':>9} {'peak MB':>8} {'chars':>9} {'lines':>7}")
+        for tables in args.tables:
+            path = os.path.join(root, f"resume_{tables}.docx")
+            make_resume(path, tables)
+            runs = [
+                ('python-docx', lambda: python_docx_text(path)),
+                ('streaming', lambda: extract_docx_text(path)),
+                ('budget', lambda: extract_docx_text(path, args.max_chars)),
+            ]
+            outputs = {}
+            for name, call in runs:
+                seconds, peak, text = measure(call, args.repeat)
+                outputs[name] = text
+                print(f"{tables:>6} {os.path.getsize(path) / 1024:>8.0f} {name:<12} {seconds * 1000:>9.1f} "
+                      f"{peak / 1e6:>8.1f} {len(text):>9} {text.count(chr(10)) + 1:>7}")
+            legacy_lines = set(outputs['python-docx'].splitlines())
+            streamed_lines = set(outputs['streaming'].splitlines())
+            if legacy_lines != streamed_lines:
+                print(f"  MISMATCH: {len(legacy_lines - streamed_lines)} lines missing, "
+                      f"{len(streamed_lines - legacy_lines)} extra")
+                sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Load test of the gunicorn profile across worker/thread layouts
+
+Seeds a temp-file SQLite database, then for each layout starts
+`gunicorn -c gunicorn.conf.py wsgi:app` with the offline LLM (plus a
+simulated upstream latency, so LLM calls are I/O-bound as in production) and
+drives it with concurrent clients for a fixed time. Reports throughput and
+latency per layout, and checks that a delete served by one worker is never
+followed by a stale list from another (shared response cache).
+
+    python benchmarks/load_test.py --layouts 1x1 1x8 2x4 4x4 --clients 32 --duration 10
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api_benchmark import make_config, percentile, seed
+
+from app import create_app
+from models import db
+
+# (weight, method, path template, expected statuses)
+MIX = (
+    (6, 'GET', '/api/candidates', {200}),
+    (2, 'GET', '/api/candidates/{id}', {200}),
+    (2, 'POST', '/api/candidates/{id}/request-documents', {201}),
+)
+
+
+def prepare(root, candidates):
+    app = create_app(make_config(root))
+    seed(app, candidates)
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def start_server(root, port, workers, threads, llm_latency_ms):
+    env = dict(
+        os.environ,
+        DATABASE_URL='sqlite:///' + os.path.join(root, 'benchmark.db'),
+        UPLOAD_FOLDER=os.path.join(root, 'uploads'),
+        LLM_PROVIDER='offline',
+        OPENAI_API_KEY='offline',
+        LLM_OFFLINE_LATENCY_MS=str(llm_latency_ms),
+        OCR_WORKERS='0',
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(threads),
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_ACCESS_LOG='',
+        SHARED_STATE_PATH=os.path.join(root, f'shared_{workers}x{threads}.db'),
+        AUTO_MIGRATE='true',
+        DELIVERY_EMAIL_TRANSPORT='file',
+        DELIVERY_SMS_TRANSPORT='file',
+    )
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                               cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            status, _ = request(port, 'GET', '/api/health')
+            if status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"gunicorn did not start: {process.stderr.read().decode()[-2000:]}")
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def request(port, method, path, connection=None):
+    conn = connection or http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    conn.request(method, path)
+    response = conn.getresponse()
+    body = response.read()
+    if connection is None:
+        conn.close()
+    return response.status, body
+
+
+def run_load(port, clients, duration, candidates):
+    weights = [m[0] for m in MIX]
+    samples = {path: [] for _, _, path, _ in MIX}
+    errors = {path: 0 for _, _, path, _ in MIX}
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client(index):
+        rng = random.Random(index)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while time.time() < stop_at:
+            _, method, path, expected = rng.choices(MIX, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, _ = request(port, method, path.format(id=rng.randint(1, candidates)), conn)
+            except (OSError, http.client.HTTPException):
+                status = None
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status in expected:
+                    samples[path].append(elapsed)
+                else:
+                    errors[path] += 1
+        conn.close()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    everything = sorted(s for values in samples.values() for s in values)
+    llm = sorted(samples['/api/candidates/{id}/request-documents'])
+    return {
+        'requests': len(everything),
+        'errors': sum(errors.values()),
+        'rps': round(len(everything) / wall, 1),
+        'p50_ms': round(percentile(everything, 50) * 1000, 1) if everything else None,
+        'p95_ms': round(percentile(everything, 95) * 1000, 1) if everything else None,
+        'llm_p95_ms': round(percentile(llm, 95) * 1000, 1) if llm else None,
+    }
+
+
+def check_shared_cache(port, candidate_id, reads=40):
+    """Delete through one connection, then list through many: no worker may serve the stale list"""
+    request(port, 'GET', '/api/candidates')  # make sure the list is cached
+    status, _ = request(port, 'DELETE', f'/api/candidates/{candidate_id}')
+    if status != 200:
+        return False
+    for _ in range(reads):
+        _, body = request(port, 'GET', '/api/candidates')
+        if any(c['id'] == candidate_id for c in json.loads(body)['candidates']):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TraqCheck gunicorn load test")
+    parser.add_argument('--layouts', nargs='+', default=['1x1', '1x8', '2x4', '4x4'],
+                        help="WORKERSxTHREADS layouts to compare")
+    parser.add_argument('--clients', type=int, default=32, help="Concurrent client connections")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds of load per layout")
+    parser.add_argument('--candidates', type=int, default=500, help="Seeded candidates")
+    parser.add_argument('--llm-latency-ms', type=float, default=300, help="Simulated LLM latency")
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--output', help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='traqcheck_load_')
+    report = {'meta': vars(args), 'results': {}}
+    try:
+        prepare(root, args.candidates)
+        for index, layout in enumerate(args.layouts):
+            workers, threads = (int(n) for n in layout.lower().split('x'))
+            print(f"Layout {layout}...", flush=True)
+            process = start_server(root, args.port, workers, threads, args.llm_latency_ms)
+            try:
+                result = run_load(args.port, args.clients, args.duration, args.candidates)
+                result['shared_cache_consistent'] = check_shared_cache(args.port, args.candidates - index)
+            finally:
+                stop_server(process)
+            report['results'][layout] = result
+
+        print(f"\n{'layout':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'llm p95':>8} {'errors':>7} {'consistent':>11}")
+        for layout, r in report['results'].items():
+            print(f"{layout:<8} {r['rps']:>8} {r['p50_ms'] or '-':>8} {r['p95_ms'] or '-':>8} "
+                  f"{r['llm_p95_ms'] or '-':>8} {r['errors']:>7} {str(r['shared_cache_consistent']):>11}")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        if not all(r['shared_cache_consistent'] for r in report['results'].values()):
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
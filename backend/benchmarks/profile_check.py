@@ -0,0 +1,149 @@
+"""
+Check of the gunicorn profile's multi-worker guarantees
+
+Fails (exit 1) unless:
+
+    shared cache    an entry invalidated in one process is gone from the
+                    cache of another, and an event published in one reaches
+                    the event bus of another (same SharedStore file)
+    event streams   with every stream thread of every worker busy, further
+                    streams are turned away and API requests are still
+                    answered promptly
+    consistency     after a delete through one connection, no worker serves
+                    the stale candidate list (load_test.check_shared_cache)
+
+The first check runs in forked processes; the others start
+`gunicorn -c gunicorn.conf.py wsgi:app` with --workers workers.
+
+    python benchmarks/profile_check.py
+    python benchmarks/profile_check.py --workers 4 --threads 2 --streams 2
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cache import SharedResponseCache, candidate_key
+from events import SharedEventBus
+from load_test import check_shared_cache, prepare, request, start_server, stop_server
+from shared_store import SharedStore
+
+
+def _other_process(path, results):
+    store = SharedStore(path)
+    cache = SharedResponseCache(store)
+    results['seen_by_other'] = cache.get(candidate_key(1)) is not None
+    cache.invalidate(1)
+    SharedEventBus(store).publish('candidate.deleted', {'id': 1})
+
+
+def check_shared_state(root):
+    """Set in this process, invalidate and publish in a forked one, read back here"""
+    path = os.path.join(root, 'shared_check.db')
+    store = SharedStore(path)
+    cache = SharedResponseCache(store)
+    bus = SharedEventBus(store)
+    subscription, _ = bus.subscribe()
+    cache.set(candidate_key(1), '"v1"', b'{}')
+    with multiprocessing.Manager() as manager:
+        results = manager.dict()
+        child = multiprocessing.get_context('fork').Process(target=_other_process, args=(path, results))
+        child.start()
+        child.join(30)
+        seen_by_other = results.get('seen_by_other', False)
+    bus.poll()
+    published = subscription.get(timeout=1)
+    return {
+        'entry visible in the other process': seen_by_other,
+        'invalidation visible in this process': cache.get(candidate_key(1)) is None,
+        'event from the other process delivered': published is not None and published.type == 'candidate.deleted',
+    }
+
+
+def open_stream(port, wait=2.0):
+    """(connection, 'held' | 'refused' | 'waiting'): waiting means no thread picked the stream up"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=wait)
+    conn.request('GET', '/api/events')
+    try:
+        response = conn.getresponse()
+    except socket.timeout:
+        return conn, 'waiting'
+    # A refused stream is a short body with a length; a held one is streamed without
+    if response.status == 200 and response.getheader('Content-Length') is None:
+        return conn, 'held'
+    response.read()
+    conn.close()
+    return conn, 'refused'
+
+
+def check_streams(port, workers, streams, api_requests=8, budget=3.0):
+    """Open more streams than all workers hold, then time API requests while they stay open"""
+    opened = [open_stream(port) for _ in range(workers * streams + 4)]
+    states = [state for _, state in opened]
+    timings = []
+
+    def api_call():
+        started = time.perf_counter()
+        status, _ = request(port, 'GET', '/api/candidates?limit=5')
+        timings.append((status, time.perf_counter() - started))
+
+    pool = [threading.Thread(target=api_call) for _ in range(api_requests)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join(budget * 10)
+    for conn, _ in opened:
+        conn.close()
+    slowest = max((elapsed for _, elapsed in timings), default=None)
+    held = states.count('held')
+    return {
+        f'at most {workers * streams} streams held': held <= workers * streams,
+        'extra streams turned away, none left waiting': 'refused' in states and 'waiting' not in states,
+        f'API requests answered within {budget:.0f}s while streams are open':
+            len(timings) == api_requests and all(status == 200 for status, _ in timings) and slowest < budget,
+    }, held, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TraqCheck gunicorn profile check")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=2, help="GUNICORN_THREADS (API threads per worker)")
+    parser.add_argument('--streams', type=int, default=2, help="EVENTS_MAX_STREAMS (stream threads per worker)")
+    parser.add_argument('--candidates', type=int, default=50)
+    parser.add_argument('--port', type=int, default=5098)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='traqcheck_profile_')
+    checks = {}
+    try:
+        checks.update(check_shared_state(root))
+        prepare(root, args.candidates)
+        os.environ['EVENTS_MAX_STREAMS'] = str(args.streams)
+        process = start_server(root, args.port, args.workers, args.threads, llm_latency_ms=0)
+        try:
+            stream_checks, held, slowest = check_streams(args.port, args.workers, args.streams)
+            checks.update(stream_checks)
+            checks['no stale list after a delete'] = check_shared_cache(args.port, args.candidates)
+        finally:
+            stop_server(process)
+        print(f"{args.workers} workers x ({args.threads} API + {args.streams} stream threads): "
+              f"{held} streams held, slowest API request {slowest or 0:.2f}s")
+        for name, passed in checks.items():
+            print(f"{'ok' if passed else 'FAIL':<9} {name}")
+        if not all(checks.values()):
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
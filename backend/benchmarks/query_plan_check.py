@@ -0,0 +1,185 @@
+"""
+Query plan check for the candidate query language and request worklists
+
+Compiles every filter on its own, every pair of filters, negations and
+second pages (keyset cursors) with each sort key into the statement the
+query endpoint runs, EXPLAINs it and fails (exit 1) if the plan reads a
+whole table instead of using an index:
+
+    SQLite       a "SCAN <table>" step without an index
+    PostgreSQL   a "Seq Scan" node, planned with enable_seqscan off so that
+                 small tables do not hide a missing index
+
+Document request worklist pages (first and second) and the company history
+lookup of model routing must also come out of an index in order, without a
+sort step ("USE TEMP B-TREE" / a Sort node).
+
+Without --database-url a temporary SQLite database is migrated and checked.
+Point --database-url at a scratch PostgreSQL database to check that dialect;
+pending migrations are applied to it.
+
+    python benchmarks/query_plan_check.py
+    python benchmarks/query_plan_check.py --database-url postgresql://localhost/traqcheck_plans --verbose
+"""
+import argparse
+import itertools
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+import migrations
+from candidate_query import DEFAULT_LIMIT, SORT_KEYS, encode_cursor, parse_query, statement_parts
+from request_lifecycle import WORKLISTS, encode_cursor as encode_worklist_cursor, worklist_statement
+from routing import company_history_statement
+from serialization import candidate_rows_statement
+
+FILTERS = [
+    'status:completed',
+    'status:failed,pending',
+    'created:2024-01-01..2024-03-31',
+    'created:>=2024-06-01',
+    'updated:<2024-02-01',
+    'company:glob',
+    'designation:"senior eng"',
+    'skill:python',
+    'skill:python,sql',
+    'skill:python skill:kafka',
+    'has:documents',
+    'has:pending-request',
+    'confidence.email:<0.6',
+]
+SORTS = ['-created', 'created', '-updated', 'name', '-name']
+NEGATED = ['-has:documents', '-has:pending-request', '-skill:java', '-status:failed', '-company:acme']
+
+_SQLITE_SCAN_RE = re.compile(r'^SCAN (?!.*\bINDEX\b)(?!.*\bCONSTANT ROW\b)')
+_SQLITE_SORT_RE = re.compile(r'\bUSE TEMP B-TREE FOR ORDER BY\b')
+
+
+class explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(explain)
+def _explain_sqlite(element, compiler, **kw):
+    return 'EXPLAIN QUERY PLAN ' + compiler.process(element.statement, **kw)
+
+
+@compiles(explain, 'postgresql')
+def _explain_postgresql(element, compiler, **kw):
+    return 'EXPLAIN ' + compiler.process(element.statement, **kw)
+
+
+def plan(session, statement, sorted_output=False):
+    """(plan lines, offending lines): full scans, and sort steps when `sorted_output` is required"""
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(text('SET LOCAL enable_seqscan = off'))
+        lines = [row[0] for row in session.execute(explain(statement))]
+        session.rollback()
+        return lines, [line for line in lines
+                       if 'Seq Scan' in line or (sorted_output and line.lstrip(' ->').startswith('Sort'))]
+    lines = [row[3] for row in session.execute(explain(statement))]
+    return lines, [line for line in lines
+                   if _SQLITE_SCAN_RE.match(line) or (sorted_output and _SQLITE_SORT_RE.search(line))]
+
+
+def cases():
+    """(query text, second page?) for every checked combination"""
+    for query, sort in itertools.product(FILTERS + NEGATED, SORTS):
+        yield f'{query} sort:{sort}', False
+    for first, second in itertools.combinations(FILTERS, 2):
+        yield f'{first} {second}', False
+    for query, sort in itertools.product([''] + FILTERS, SORTS):
+        yield f'{query} sort:{sort}'.strip(), True
+
+
+def _report(label, lines, problems, verbose):
+    if verbose or problems:
+        print(f"{'FAIL' if problems else 'ok':<9} {label}")
+        for line in lines:
+            print(f"          {line}")
+
+
+def check_worklists(session, verbose=False):
+    failures, checked = [], 0
+    last_row = type('Row', (), {'created_at': datetime(2024, 5, 1), 'id': 1000})
+    for name, second_page in itertools.product(WORKLISTS, (False, True)):
+        cursor = encode_worklist_cursor(name, last_row) if second_page else None
+        lines, problems = plan(session, worklist_statement(name, DEFAULT_LIMIT + 1, cursor), sorted_output=True)
+        checked += 1
+        label = f'worklist {name}' + (' (page 2)' if second_page else '')
+        if problems:
+            failures.append(label)
+        _report(label, lines, problems, verbose)
+    return checked, failures
+
+
+def check_routing(session, verbose=False):
+    lines, problems = plan(session, company_history_statement('Acme'), sorted_output=True)
+    _report('routing company history', lines, problems, verbose)
+    return ['routing company history'] if problems else []
+
+
+def check(session, verbose=False):
+    failures, checked = [], 0
+    # A realistic cursor position: the values only need the right types
+    last_row = {'id': 1000, 'created_at': datetime(2024, 5, 1), 'updated_at': datetime(2024, 5, 2), 'name': 'Meera'}
+    for query_text, second_page in cases():
+        query = parse_query(query_text)
+        cursor = encode_cursor(query, last_row) if second_page else None
+        conditions, order_by = statement_parts(session, query, cursor)
+        lines, scans = plan(session, candidate_rows_statement(conditions, order_by, DEFAULT_LIMIT + 1))
+        checked += 1
+        label = query_text + (' (page 2)' if second_page else '')
+        if scans:
+            failures.append(label)
+        _report(label, lines, scans, verbose)
+    return checked, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TraqCheck candidate query plan check")
+    parser.add_argument('--database-url', help="Database to check (default: a temporary SQLite database)")
+    parser.add_argument('--verbose', action='store_true', help="Print every plan, not only failing ones")
+    args = parser.parse_args()
+
+    root = None
+    url = args.database_url
+    if not url:
+        root = tempfile.mkdtemp(prefix='traqcheck_plans_')
+        url = 'sqlite:///' + os.path.join(root, 'plans.db')
+    engine = create_engine(url)
+    try:
+        migrations.upgrade(engine)
+        with Session(engine) as session:
+            checked, failures = check(session, args.verbose)
+            worklists_checked, worklist_failures = check_worklists(session, args.verbose)
+            routing_failures = check_routing(session, args.verbose)
+        print(f"{engine.dialect.name}: {checked} queries checked, sort keys {', '.join(SORT_KEYS)}, "
+              f"{len(failures)} with full table scans")
+        print(f"{engine.dialect.name}: {worklists_checked} worklist pages checked, "
+              f"{len(worklist_failures)} with full table scans or sorts")
+        print(f"{engine.dialect.name}: routing company history "
+              f"{'with a full table scan or sort' if routing_failures else 'read from an index'}")
+        if failures or worklist_failures or routing_failures:
+            sys.exit(1)
+    finally:
+        engine.dispose()
+        if root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Serialization benchmark for the candidate list payload
+
+Seeds N candidates (same data as api_benchmark.py) and reports, per 1k
+candidates, the milliseconds to build and serialize the list and the
+resulting bytes, raw and compressed:
+
+    ORM objects + to_dict() + stdlib json    (the original path)
+    row tuples + stdlib json
+    row tuples + orjson                      (if installed)
+
+    python benchmarks/serialization_benchmark.py --scales 1000 10000 --repeat 5
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api_benchmark import make_config, seed
+
+import compression
+import serialization
+from app import create_app
+from models import db, Candidate
+
+
+def timed_median(repeat, call):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def run_scale(scale, repeat):
+    root = tempfile.mkdtemp(prefix=f"traqcheck_serialization_{scale}_")
+    try:
+        app = create_app(make_config(root))
+        seed(app, scale)
+        stdlib = serialization.StdlibJSONProvider(app)
+        providers = [('stdlib', stdlib)]
+        if serialization.orjson is not None:
+            providers.append(('orjson', serialization.OrjsonProvider(app)))
+
+        def orm_path():
+            candidates = Candidate.query.order_by(Candidate.created_at.desc(), Candidate.id.desc()).all()
+            body = stdlib.dumps_bytes({"candidates": [c.to_dict() for c in candidates]})
+            db.session.expunge_all()
+            return body
+
+        def rows_path(provider):
+            return lambda: provider.dumps_bytes({"candidates": serialization.candidate_payloads(db.session, provider)[0]})
+
+        strategies = [('orm+stdlib', orm_path)] + [(f'rows+{name}', rows_path(p)) for name, p in providers]
+        results = []
+        with app.app_context():
+            for name, call in strategies:
+                seconds, body = timed_median(repeat, call)
+                results.append((name, seconds, body))
+
+            encodings = ['gzip'] + (['br'] if compression.brotli is not None else [])
+            per_k = 1000 / scale
+            rows = []
+            for name, seconds, body in results:
+                row = {'strategy': name, 'ms_per_1k': seconds * 1000 * per_k, 'bytes_per_1k': len(body) * per_k}
+                for encoding in encodings:
+                    compress_seconds, compressed = timed_median(repeat, lambda: compression.compress(body, encoding))
+                    row[f'{encoding}_bytes_per_1k'] = len(compressed) * per_k
+                    row[f'{encoding}_ms_per_1k'] = compress_seconds * 1000 * per_k
+                rows.append(row)
+            db.session.remove()
+            db.engine.dispose()
+        return rows
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TraqCheck serialization benchmark")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per strategy (median is reported)")
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        print(f"\nscale {scale} (per 1k candidates)", flush=True)
+        rows = run_scale(scale, args.repeat)
+        extra = [key for key in rows[0] if key not in ('strategy', 'ms_per_1k', 'bytes_per_1k')]
+        print(f"{'strategy':<14} {'ms':>9} {'bytes':>10} " + " ".join(f"{key.replace('_per_1k', ''):>12}" for key in extra))
+        for row in rows:
+            print(f"{row['strategy']:<14} {row['ms_per_1k']:>9.2f} {row['bytes_per_1k']:>10.0f} "
+                  + " ".join(f"{row[key]:>12.1f}" for key in extra))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Local SMTP sink: accepts every message and counts it, optionally saving it to a folder
+
+A stand-in SMTP server for development, tests and delivery_benchmark.py.
+Recipients containing one of the --reject strings are refused with 550, to
+exercise permanent delivery failures.
+
+    python benchmarks/smtp_sink.py --port 1025 --folder /tmp/traqcheck-mail
+    DELIVERY_EMAIL_TRANSPORT=smtp SMTP_PORT=1025 python app.py
+"""
+import argparse
+import os
+import socketserver
+import threading
+import time
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, folder=None, latency=0.0, reject=()):
+        super().__init__((host, port), _Handler)
+        self.folder = folder
+        self.latency = latency
+        self.reject = tuple(reject)
+        self.connections = 0
+        self.messages = 0
+        self._lock = threading.Lock()
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def _received(self, data):
+        with self._lock:
+            self.messages += 1
+            number = self.messages
+        if self.folder:
+            with open(os.path.join(self.folder, f'{number:08d}.eml'), 'wb') as f:
+                f.write(data)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, *lines):
+        self.wfile.write(''.join(f'{line}\r\n' for line in lines).encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        with server._lock:
+            server.connections += 1
+        self.reply('220 traqcheck-sink ESMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply('250-traqcheck-sink', '250-8BITMIME', '250 SIZE 10485760')
+            elif verb == 'HELO':
+                self.reply('250 traqcheck-sink')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                if any(pattern in command for pattern in server.reject):
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(command)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                if not recipients:
+                    self.reply('503 No valid recipients')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    if line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(line[1:] if line.startswith(b'..') else line)
+                if server.latency:
+                    time.sleep(server.latency)
+                server._received(b''.join(data))
+                self.reply('250 OK queued')
+            elif verb == 'RSET':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink for TraqCheck delivery")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--folder', default=None, help="Save each message as an .eml file here")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay before accepting each message")
+    parser.add_argument('--reject', nargs='*', default=[], help="Refuse recipients containing these strings (550)")
+    args = parser.parse_args()
+    sink = SMTPSink(args.host, args.port, args.folder, args.latency_ms / 1000, args.reject)
+    print(f"SMTP sink listening on {args.host}:{sink.port}", flush=True)
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.server_close()
+        print(f"{sink.messages} messages over {sink.connections} connections")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+CANDIDATE_LIST_KEY = 'candidates'
+# Generation row bumped by clear(), which invalidates every key
+_EPOCH_KEY = '*'
+
+
+def candidate_key(candidate_id: int) -> str:
+    return f"candidate:{candidate_id}"
+
+
+def compute_etag(versions: Any) -> str:
+    """Build a strong ETag from a (nested) tuple of row versions"""
+    digest = hashlib.sha1(repr(versions).encode('utf-8')).hexdigest()
+    return digest
+
+
+def _fresh(stored_version: Optional[str], stored_at: float, version: Optional[str], ttl: float) -> bool:
+    return stored_version == version and not (ttl and time.time() - stored_at > ttl)
+
+
+class ResponseCache:
+    """In-process LRU of serialized JSON bodies keyed by resource.
+
+    Every invalidation bumps the key's generation. A caller reads it with
+    generation() before loading and passes it to set(), which drops the body
+    if the key was invalidated meanwhile: the load may predate the write.
+
+    Writes from other processes never call invalidate() here, so an entry is
+    also stored with a data `version` (a fingerprint the caller reads from the
+    database) and is only served while get() is given the same version and it
+    is younger than `ttl` seconds (0: no age limit).
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, bytes, Optional[str], float]]" = OrderedDict()
+        # Per-key generations, bounded; forgetting one bumps the epoch, which moves every key's generation
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, version: Optional[str] = None) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not _fresh(entry[2], entry[3], version, self.ttl):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def generation(self, key: str) -> Tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def set(self, key: str, etag: str, body: bytes, generation: Optional[Tuple[int, int]] = None,
+            version: Optional[str] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key, 0)):
+                return
+            self._entries[key] = (etag, body, version, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, candidate_id: Optional[int] = None) -> None:
+        """Drop the candidate list and, if given, a single candidate entry"""
+        with self._lock:
+            keys = [CANDIDATE_LIST_KEY] + ([candidate_key(candidate_id)] if candidate_id is not None else [])
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._generations.move_to_end(key)
+            while len(self._generations) > self.max_entries * 16:
+                self._generations.popitem(last=False)
+                self._epoch += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+
+
+class SharedResponseCache:
+    """ResponseCache stored in a SharedStore, so every worker on the host sees the same entries.
+
+    An invalidation in one worker is immediately visible to all others, which
+    a per-process LRU cannot provide. Eviction is oldest-stored first.
+    Generations live in the store too, so a body loaded in one worker before
+    a write in another is not stored after that write's invalidation. Data
+    versions and `ttl` work as in ResponseCache.
+    """
+
+    def __init__(self, store, max_entries: int = 256, ttl: float = 0):
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        with store.transaction() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache '
+                '(key TEXT PRIMARY KEY, etag TEXT NOT NULL, body BLOB NOT NULL, stored_at REAL NOT NULL, version TEXT)'
+            )
+            if 'version' not in {row[1] for row in conn.execute('PRAGMA table_info(response_cache)')}:
+                conn.execute('ALTER TABLE response_cache ADD COLUMN version TEXT')
+            conn.execute('CREATE TABLE IF NOT EXISTS response_cache_generations '
+                         '(key TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+
+    def get(self, key: str, version: Optional[str] = None) -> Optional[Tuple[str, bytes]]:
+        row = self.store.connection().execute(
+            'SELECT etag, body, version, stored_at FROM response_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or not _fresh(row[2], row[3], version, self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], bytes(row[1])
+
+    @staticmethod
+    def _generation(conn, key: str) -> Tuple[int, int]:
+        rows = dict(conn.execute('SELECT key, generation FROM response_cache_generations WHERE key IN (?, ?)',
+                                 (_EPOCH_KEY, key)).fetchall())
+        return rows.get(_EPOCH_KEY, 0), rows.get(key, 0)
+
+    def generation(self, key: str) -> Tuple[int, int]:
+        return self._generation(self.store.connection(), key)
+
+    def set(self, key: str, etag: str, body: bytes, generation: Optional[Tuple[int, int]] = None,
+            version: Optional[str] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        with self.store.transaction() as conn:
+            if generation is not None and tuple(generation) != self._generation(conn, key):
+                return
+            conn.execute('INSERT OR REPLACE INTO response_cache (key, etag, body, stored_at, version) '
+                         'VALUES (?, ?, ?, ?, ?)', (key, etag, body, time.time(), version))
+            conn.execute(
+                'DELETE FROM response_cache WHERE key IN '
+                '(SELECT key FROM response_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def invalidate(self, candidate_id: Optional[int] = None) -> None:
+        keys = [CANDIDATE_LIST_KEY] + ([candidate_key(candidate_id)] if candidate_id is not None else [])
+        with self.store.transaction() as conn:
+            conn.executemany('DELETE FROM response_cache WHERE key = ?', [(k,) for k in keys])
+            self._bump(conn, keys)
+
+    def clear(self) -> None:
+        with self.store.transaction() as conn:
+            conn.execute('DELETE FROM response_cache')
+            self._bump(conn, [_EPOCH_KEY])
+
+    @staticmethod
+    def _bump(conn, keys) -> None:
+        conn.executemany('INSERT INTO response_cache_generations (key, generation) VALUES (?, 1) '
+                         'ON CONFLICT (key) DO UPDATE SET generation = generation + 1', [(k,) for k in keys])
@@ -0,0 +1,264 @@
+"""
+Candidate query language for the dashboard list.
+
+A query is a space-separated list of `key:value` filters, all of which must
+match; a leading `-` negates one. Quote values that contain spaces.
+
+    status:completed,failed          extraction status is one of these
+    created:2024-01-01..2024-01-31   date range, either end optional; also
+    created:>=2024-01-01              <, <=, >, >= and a single day (created:2024-01-15)
+    updated:<2024-02-01
+    company:glob  designation:"senior eng"   case-insensitive prefix
+    skill:python,sql                 has any of these skills (repeat the filter to require all)
+    has:documents  has:pending-request
+    confidence.email:<0.6            per-field extraction confidence
+    sort:-created                    created, updated or name; '-' for descending (default -created)
+
+Every filter compiles to a condition one of the candidate indexes can
+answer (see migration 0009), and results are paged with a keyset cursor,
+so a page costs the same however deep it is. benchmarks/query_plan_check.py
+checks the plans with EXPLAIN.
+"""
+import base64
+import binascii
+import json
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import and_, exists, func, or_, select, tuple_
+
+from models import (Candidate, CandidateSkill, CONFIDENCE_FIELDS, Document, DocumentRequest, OPEN_REQUEST_STATUSES,
+                    confidence_score, skill_key)
+from serialization import candidate_payloads
+
+EXTRACTION_STATUSES = ('pending', 'completed', 'failed')
+PENDING_REQUEST_STATUSES = OPEN_REQUEST_STATUSES
+
+SORT_KEYS = {'created': Candidate.created_at, 'updated': Candidate.updated_at, 'name': Candidate.name}
+# Payload field holding each sort key's value, for the next-page cursor
+_SORT_FIELDS = {'created': 'created_at', 'updated': 'updated_at', 'name': 'name'}
+DEFAULT_SORT = '-created'
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+_TOKEN_RE = re.compile(r'(?P<negate>-?)(?P<key>[a-z_.]+):(?:"(?P<quoted>[^"]*)"|(?P<value>\S+))|(?P<other>\S+)')
+_COMPARISON_RE = re.compile(r'^(<=|>=|<|>)(.+)$')
+
+
+class QueryError(ValueError):
+    """The query text is invalid; the message is meant for the client"""
+
+
+class CandidateQuery(NamedTuple):
+    conditions: List[Any]
+    sort: str
+    descending: bool
+
+
+def _values(value: str) -> List[str]:
+    values = [part.strip() for part in value.split(',') if part.strip()]
+    if not values:
+        raise QueryError("Empty filter value")
+    return values
+
+
+def _parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"Invalid date '{value}': use YYYY-MM-DD or an ISO 8601 timestamp")
+
+
+def _is_day(value: str) -> bool:
+    return len(value) == 10
+
+
+def _date_filter(column, value: str):
+    """created:2024-01-01..2024-01-31, created:>=2024-01-01, created:2024-01-15 (whole days are inclusive)"""
+    comparison = _COMPARISON_RE.match(value)
+    if comparison:
+        operator, bound = comparison.groups()
+        moment = _parse_time(bound)
+        if _is_day(bound) and operator in ('<=', '>'):
+            # A whole day: "<= day" ends and "> day" starts at the following midnight
+            moment += timedelta(days=1)
+            operator = '<' if operator == '<=' else '>='
+        return {'<': column < moment, '<=': column <= moment, '>': column > moment, '>=': column >= moment}[operator]
+    start, separator, end = value.partition('..')
+    if not separator:
+        start = end = value
+    conditions = []
+    if start:
+        conditions.append(column >= _parse_time(start))
+    if end:
+        moment = _parse_time(end)
+        conditions.append(column < moment + timedelta(days=1) if _is_day(end) else column <= moment)
+    if not conditions:
+        raise QueryError("A date range needs at least one end, e.g. 2024-01-01..")
+    return and_(*conditions)
+
+
+def _prefix_filter(column, value: str):
+    """Case-insensitive prefix match as a range on the lower() expression index, plus LIKE for exactness"""
+    prefix = value.lower()
+    key = func.lower(column)
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    conditions = [key >= prefix, key.like(escaped + '%', escape='\\')]
+    if ord(prefix[-1]) < 0x10FFFF:
+        conditions.append(key < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    return and_(*conditions)
+
+
+def confidence_threshold(value: str) -> float:
+    """Parse a confidence threshold; raises QueryError unless it is a number from 0 to 1"""
+    try:
+        threshold = float(value)
+    except ValueError:
+        threshold = math.nan
+    # Also rejects nan, which float() accepts and which compares false with everything
+    if not 0 <= threshold <= 1:
+        raise QueryError("Confidence thresholds must be numbers between 0 and 1")
+    return threshold
+
+
+def _confidence_filter(field: str, value: str):
+    if field not in CONFIDENCE_FIELDS:
+        raise QueryError(f"Unknown confidence field '{field}': use one of {', '.join(CONFIDENCE_FIELDS)}")
+    comparison = _COMPARISON_RE.match(value)
+    if not comparison:
+        raise QueryError("Confidence filters need a comparison, e.g. confidence.email:<0.6")
+    operator, threshold = comparison.groups()
+    threshold = confidence_threshold(threshold)
+    score = confidence_score(field)
+    condition = {'<': score < threshold, '<=': score <= threshold, '>': score > threshold,
+                 '>=': score >= threshold}[operator]
+    return condition, score
+
+
+def _has_filter(value: str):
+    if value == 'documents':
+        return exists().where(Document.candidate_id == Candidate.id)
+    if value == 'pending-request':
+        return exists().where(DocumentRequest.candidate_id == Candidate.id,
+                              DocumentRequest.status.in_(PENDING_REQUEST_STATUSES))
+    raise QueryError(f"Unknown has: filter '{value}': use has:documents or has:pending-request")
+
+
+def _skill_filter(value: str, negate: bool):
+    keys = [skill_key(skill) for skill in _values(value)]
+    if negate:
+        # NOT EXISTS rather than NOT IN, which PostgreSQL plans as an anti-join
+        return ~exists().where(CandidateSkill.candidate_id == Candidate.id, CandidateSkill.skill.in_(keys))
+    # Driven from the skill index: only the matching candidates are looked up
+    return Candidate.id.in_(select(CandidateSkill.candidate_id).where(CandidateSkill.skill.in_(keys)))
+
+
+def _filter(key: str, value: str):
+    """(condition, the nullable expression it compares or None) for one key:value filter"""
+    if key == 'status':
+        statuses = _values(value)
+        unknown = [status for status in statuses if status not in EXTRACTION_STATUSES]
+        if unknown:
+            raise QueryError(f"Unknown status '{unknown[0]}': use {', '.join(EXTRACTION_STATUSES)}")
+        return Candidate.extraction_status.in_(statuses), Candidate.extraction_status
+    if key in ('created', 'updated'):
+        column = Candidate.created_at if key == 'created' else Candidate.updated_at
+        return _date_filter(column, value), column
+    if key in ('company', 'designation'):
+        column = Candidate.company if key == 'company' else Candidate.designation
+        return _prefix_filter(column, value), column
+    if key == 'has':
+        return _has_filter(value), None
+    if key.startswith('confidence.'):
+        return _confidence_filter(key.partition('.')[2], value)
+    raise QueryError(f"Unknown filter '{key}'")
+
+
+def parse_query(text: str) -> CandidateQuery:
+    """Compile query text into SQL conditions and a sort order; raises QueryError"""
+    conditions, sort = [], DEFAULT_SORT
+    for match in _TOKEN_RE.finditer(text or ''):
+        if match.group('other'):
+            raise QueryError(f"Expected key:value, got '{match.group('other')}'")
+        key, negate = match.group('key'), bool(match.group('negate'))
+        value = match.group('quoted') if match.group('quoted') is not None else match.group('value')
+        if not value:
+            raise QueryError(f"Empty value for '{key}'")
+        if key == 'sort':
+            if negate or value.lstrip('-') not in SORT_KEYS:
+                raise QueryError(f"Unknown sort '{value}': use {', '.join(SORT_KEYS)} (prefix '-' for descending)")
+            sort = value
+            continue
+        if key == 'skill':
+            conditions.append(_skill_filter(value, negate))
+            continue
+        condition, column = _filter(key, value)
+        if negate:
+            # NOT of a comparison with NULL is NULL, so rows without a value would match neither way
+            condition = or_(~condition, column.is_(None)) if column is not None else ~condition
+        conditions.append(condition)
+    return CandidateQuery(conditions, sort.lstrip('-'), sort.startswith('-'))
+
+
+def encode_cursor(query: CandidateQuery, payload: Dict[str, Any]) -> str:
+    value = payload[_SORT_FIELDS[query.sort]]
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([query.sort, value, payload['id']], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(query: CandidateQuery, cursor: str):
+    try:
+        sort, value, last_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError, binascii.Error):
+        raise QueryError("Invalid cursor")
+    if sort != query.sort or not isinstance(last_id, int):
+        raise QueryError("The cursor belongs to a different sort order")
+    if value is not None and query.sort in ('created', 'updated'):
+        value = _parse_time(value)
+    return value, last_id
+
+
+def _after(column, value, last_id: int, descending: bool, nulls_first: bool):
+    """Keyset condition for the rows after (value, last_id) in ORDER BY column, id"""
+    if value is None:
+        same = and_(column.is_(None), Candidate.id < last_id if descending else Candidate.id > last_id)
+        return or_(same, column.is_not(None)) if nulls_first else same
+    # Row-value comparison, which both SQLite and PostgreSQL answer with an index range
+    key = tuple_(column, Candidate.id)
+    beyond = key < (value, last_id) if descending else key > (value, last_id)
+    return beyond if nulls_first else or_(beyond, column.is_(None))
+
+
+def statement_parts(session, query: CandidateQuery, cursor: Optional[str] = None):
+    """(conditions, order_by) for a page of `query`, starting after `cursor`"""
+    column = SORT_KEYS[query.sort]
+    conditions = list(query.conditions)
+    if cursor:
+        value, last_id = _decode_cursor(query, cursor)
+        # Where NULLs sort in each direction differs: SQLite puts them first ascending, PostgreSQL last
+        postgres = session.get_bind().dialect.name == 'postgresql'
+        nulls_first = query.descending if postgres else not query.descending
+        conditions.append(_after(column, value, last_id, query.descending, nulls_first))
+    if query.descending:
+        order_by = (column.desc(), Candidate.id.desc())
+    else:
+        order_by = (column.asc(), Candidate.id.asc())
+    return conditions, order_by
+
+
+def query_candidates(session, provider, text: str, limit: int = DEFAULT_LIMIT,
+                     cursor: Optional[str] = None) -> Dict[str, Any]:
+    """One page of candidate payloads matching `text`, with the cursor of the next page (None on the last)"""
+    query = parse_query(text)
+    conditions, order_by = statement_parts(session, query, cursor)
+    candidates, _ = candidate_payloads(session, provider, conditions, order_by=order_by, limit=limit + 1)
+    next_cursor = None
+    if len(candidates) > limit:
+        candidates = candidates[:limit]
+        next_cursor = encode_cursor(query, candidates[-1])
+    return {'candidates': candidates, 'next_cursor': next_cursor}
@@ -0,0 +1,101 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from flask import request
+
+from metrics import registry
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+compressed_bytes = registry.counter(
+    'traqcheck_response_compression_bytes_total',
+    'Response body bytes before and after compression, by encoding',
+    ('encoding', 'stage')
+)
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html', 'text/csv'}
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header (q=0 excludes an encoding)"""
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressedBodyCache:
+    """Small LRU of compressed bodies keyed by (ETag, encoding), so cached JSON is compressed once"""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key: Tuple[str, str], body: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def init_app(app) -> None:
+    """Compress large text/JSON responses with brotli or gzip, as the client accepts"""
+    min_bytes = app.config['COMPRESSION_MIN_BYTES']
+    gzip_level = app.config['COMPRESSION_GZIP_LEVEL']
+    brotli_quality = app.config['COMPRESSION_BROTLI_QUALITY']
+    cache = CompressedBodyCache(app.config['COMPRESSION_CACHE_SIZE'])
+    app.extensions['compressed_body_cache'] = cache
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+        if encoding is None or (response.content_length or 0) < min_bytes:
+            return response
+
+        etag, weak = response.get_etag()
+        body = cache.get((etag, encoding)) if etag else None
+        if body is None:
+            raw = response.get_data()
+            body = compress(raw, encoding, gzip_level, brotli_quality)
+            compressed_bytes.inc(encoding, 'raw', amount=len(raw))
+            compressed_bytes.inc(encoding, 'compressed', amount=len(body))
+            if etag:
+                cache.set((etag, encoding), body)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag and not weak:
+            # Same resource, different bytes: If-None-Match uses weak comparison, so 304s still work
+            response.set_etag(etag, weak=True)
+        return response
@@ -15,14 +15,211 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Apply pending schema migrations at startup. When false the app refuses to start on an outdated
+    # schema; run `db_manager.py migrate` as a release step instead
+    AUTO_MIGRATE = (os.environ.get('AUTO_MIGRATE') or 'true').lower() == 'true'
     
     # File uploads - Use /tmp for serverless environments
     IS_SERVERLESS = os.environ.get('VERCEL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
     UPLOAD_FOLDER = '/tmp/uploads' if IS_SERVERLESS else (os.environ.get('UPLOAD_FOLDER') or 'uploads')
     RESUMES_FOLDER = os.path.join(UPLOAD_FOLDER, 'resumes')
     DOCUMENTS_FOLDER = os.path.join(UPLOAD_FOLDER, 'documents')
+    THUMBNAILS_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbnails')
+    OCR_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'ocr_cache')
+    # Uploads are written here first and moved into place when their row commits (same filesystem as the above)
+    STAGING_FOLDER = os.path.join(UPLOAD_FOLDER, 'staging')
     
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH') or 10 * 1024 * 1024)  # 10MB default
     ALLOWED_RESUME_EXTENSIONS = {'pdf', 'docx', 'txt'}
     ALLOWED_DOCUMENT_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png'}
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+    # 'openai' or 'offline' (deterministic local stand-in for tests and benchmarks)
+    LLM_PROVIDER = (os.environ.get('LLM_PROVIDER') or 'openai').lower()
+    # Simulated upstream latency of the offline model, for load tests of I/O-bound serving
+    LLM_OFFLINE_LATENCY_MS = float(os.environ.get('LLM_OFFLINE_LATENCY_MS') or 0)
+    # USD per 1M (prompt, completion) tokens, used for LLM cost accounting
+    LLM_PRICING = {
+        'gpt-3.5-turbo': (0.50, 1.50),
+        'gpt-4o-mini': (0.15, 0.60),
+        'gpt-4o': (2.50, 10.00),
+    }
+    
+    # LLM resilience: per-attempt timeout and overall deadline (seconds), retries with jittered backoff
+    LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT') or 30)
+    LLM_DEADLINE = float(os.environ.get('LLM_DEADLINE') or 60)
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES') or 3)
+    LLM_BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE') or 0.5)
+    LLM_BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX') or 8)
+    # Org quotas shared by all LLM callers in the process
+    LLM_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE') or 500)
+    LLM_TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE') or 200000)
+    # Circuit breaker: open after N consecutive upstream failures, probe again after the reset period
+    LLM_BREAKER_THRESHOLD = int(os.environ.get('LLM_BREAKER_THRESHOLD') or 5)
+    LLM_BREAKER_RESET_SECONDS = float(os.environ.get('LLM_BREAKER_RESET_SECONDS') or 30)
+    # Answer with the local extractor/templates while the upstream is degraded
+    LLM_FALLBACK_TO_LOCAL = (os.environ.get('LLM_FALLBACK_TO_LOCAL') or 'true').lower() == 'true'
+    
+    # Model routing: tiers ordered cheapest first, each at least as capable as the one before; hard
+    # inputs escalate to the next tier with a different model. gpt-3.5-turbo costs more than
+    # gpt-4o-mini (LLM_PRICING) and extracts worse, so both lower tiers default to gpt-4o-mini
+    LLM_ROUTES = {
+        'fast': os.environ.get('LLM_MODEL_FAST') or 'gpt-4o-mini',
+        'standard': os.environ.get('LLM_MODEL_STANDARD') or 'gpt-4o-mini',
+        'strong': os.environ.get('LLM_MODEL_STRONG') or 'gpt-4o',
+    }
+    ROUTING_ENABLED = (os.environ.get('ROUTING_ENABLED') or 'true').lower() == 'true'
+    ROUTING_DEFAULT_ROUTE = os.environ.get('ROUTING_DEFAULT_ROUTE') or 'standard'
+    # Short resumes where the local extractor already filled this many fields go to the fast tier
+    ROUTING_FAST_MAX_CHARS = int(os.environ.get('ROUTING_FAST_MAX_CHARS') or 4000)
+    ROUTING_FAST_MIN_FIELDS = int(os.environ.get('ROUTING_FAST_MIN_FIELDS') or 4)
+    # Very long or mostly non-Latin resumes go straight to the strong tier
+    ROUTING_STRONG_MIN_CHARS = int(os.environ.get('ROUTING_STRONG_MIN_CHARS') or 15000)
+    ROUTING_MAX_NON_LATIN_RATIO = float(os.environ.get('ROUTING_MAX_NON_LATIN_RATIO') or 0.3)
+    # Escalate one tier when past resumes from the same company extracted below this mean confidence
+    ROUTING_COMPANY_MIN_CONFIDENCE = float(os.environ.get('ROUTING_COMPANY_MIN_CONFIDENCE') or 0.6)
+    # Re-run an extraction on the next tier when its mean confidence is below this (0 disables)
+    ROUTING_ESCALATE_BELOW_CONFIDENCE = float(os.environ.get('ROUTING_ESCALATE_BELOW_CONFIDENCE') or 0.5)
+    ROUTING_DOCUMENT_REQUEST = {
+        'email': os.environ.get('ROUTING_EMAIL_ROUTE') or 'fast',
+        'sms': os.environ.get('ROUTING_SMS_ROUTE') or 'fast',
+    }
+    
+    # Resume sections sent to the LLM parser (contact, summary, experience, education, skills, other); 'all' sends the whole text
+    RESUME_PROMPT_SECTIONS = tuple(
+        name.strip() for name in (os.environ.get('RESUME_PROMPT_SECTIONS') or 'contact,summary,experience,skills').split(',')
+        if name.strip() and name.strip() != 'all'
+    )
+    
+    # Bulk intake: pack several short resumes into one LLM request
+    LLM_BATCH_TOKEN_BUDGET = int(os.environ.get('LLM_BATCH_TOKEN_BUDGET') or 6000)
+    LLM_BATCH_MAX_ITEMS = int(os.environ.get('LLM_BATCH_MAX_ITEMS') or 8)
+    BULK_UPLOAD_MAX_FILES = int(os.environ.get('BULK_UPLOAD_MAX_FILES') or 50)
+    # Candidates deleted per transaction by the bulk delete endpoint
+    BULK_DELETE_BATCH_SIZE = int(os.environ.get('BULK_DELETE_BATCH_SIZE') or 500)
+    
+    # Response caching - number of serialized candidate payloads kept in memory (0 disables)
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE') or 256)
+    # Entries are checked against a database fingerprint on every hit (inserts, deletes, candidate updates
+    # from any process); in-place document/request changes made by another process show up within this age
+    RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL') or 30)
+    
+    # State shared by the worker processes on one host (response cache, change-event log):
+    # 'memory' keeps it per process, 'sqlite' puts it in SHARED_STATE_PATH (the gunicorn profile's default)
+    SHARED_STATE = (os.environ.get('SHARED_STATE') or 'memory').lower()
+    SHARED_STATE_PATH = os.environ.get('SHARED_STATE_PATH') or os.path.join(UPLOAD_FOLDER, 'shared_state.db')
+    # Leave background threads to start_background_workers() (gunicorn calls it in each worker after fork)
+    DEFER_BACKGROUND_WORKERS = (os.environ.get('DEFER_BACKGROUND_WORKERS') or 'false').lower() == 'true'
+    
+    # JSON serialization: 'auto' uses orjson when installed, 'stdlib' forces the json module
+    JSON_PROVIDER = (os.environ.get('JSON_PROVIDER') or 'auto').lower()
+    # Compress text/JSON responses of at least this size with brotli (if installed) or gzip
+    COMPRESSION_ENABLED = (os.environ.get('COMPRESSION_ENABLED') or 'true').lower() == 'true'
+    COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES') or 1024)
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL') or 6)
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY') or 5)
+    COMPRESSION_CACHE_SIZE = int(os.environ.get('COMPRESSION_CACHE_SIZE') or 64)
+    
+    # Server-sent change events at /api/events (needs long-lived connections, so off on serverless)
+    EVENTS_ENABLED = (os.environ.get('EVENTS_ENABLED') or ('false' if IS_SERVERLESS else 'true')).lower() == 'true'
+    EVENTS_BUFFER_SIZE = int(os.environ.get('EVENTS_BUFFER_SIZE') or 1000)  # events kept for Last-Event-ID replay
+    EVENTS_SUBSCRIBER_QUEUE = int(os.environ.get('EVENTS_SUBSCRIBER_QUEUE') or 100)
+    EVENTS_KEEPALIVE_SECONDS = float(os.environ.get('EVENTS_KEEPALIVE_SECONDS') or 15)
+    EVENTS_MAX_STREAM_SECONDS = float(os.environ.get('EVENTS_MAX_STREAM_SECONDS') or 300)
+    # Open streams per process (0: unlimited). Each holds a server thread; beyond this a client is told to retry
+    EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS') or 0)
+    EVENTS_BUSY_RETRY_SECONDS = float(os.environ.get('EVENTS_BUSY_RETRY_SECONDS') or 10)
+    EVENTS_POLL_SECONDS = float(os.environ.get('EVENTS_POLL_SECONDS') or 0.5)  # shared event log tail interval
+    
+    # Document serving - stored documents are immutable, so browsers may keep them for a long time
+    DOCUMENT_CACHE_MAX_AGE = int(os.environ.get('DOCUMENT_CACHE_MAX_AGE') or 365 * 24 * 3600)
+    # '' serves files from Flask, 'x-accel' hands off to nginx, 'x-sendfile' to Apache/lighttpd
+    DOCUMENT_SENDFILE_MODE = (os.environ.get('DOCUMENT_SENDFILE_MODE') or '').lower()
+    DOCUMENT_ACCEL_PREFIX = os.environ.get('DOCUMENT_ACCEL_PREFIX') or '/protected-documents/'
+    USE_X_SENDFILE = DOCUMENT_SENDFILE_MODE == 'x-sendfile'
+    THUMBNAIL_SIZES = (128, 256, 512)
+    THUMBNAIL_DEFAULT_SIZE = 256
+    
+    # Submitted identity document images are downscaled and re-encoded after upload
+    IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION') or 2000)
+    IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY') or 80)
+    IMAGE_OUTPUT_FORMAT = (os.environ.get('IMAGE_OUTPUT_FORMAT') or 'WEBP').upper()  # WEBP or JPEG
+    # Background workers for image normalization; 0 processes inline (serverless has no background threads)
+    IMAGE_NORMALIZE_WORKERS = int(os.environ.get('IMAGE_NORMALIZE_WORKERS') or (0 if IS_SERVERLESS else 2))
+    
+    # Candidate similarity: 'local' hashes terms into vectors (no model download), 'openai' uses EMBEDDING_MODEL
+    EMBEDDING_PROVIDER = (os.environ.get('EMBEDDING_PROVIDER') or 'local').lower()
+    EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL') or 'text-embedding-3-small'
+    EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM') or 256)
+    EMBEDDING_INDEX_FOLDER = os.environ.get('EMBEDDING_INDEX_FOLDER') or os.path.join(UPLOAD_FOLDER, 'embedding_index')
+    EMBEDDING_NPROBE = int(os.environ.get('EMBEDDING_NPROBE') or 8)  # index lists scanned per query
+    # Candidates embedded since the last index build that trigger a background rebuild (0: maintenance only)
+    EMBEDDING_REBUILD_THRESHOLD = int(os.environ.get('EMBEDDING_REBUILD_THRESHOLD') or (0 if IS_SERVERLESS else 20000))
+    
+    # DOCX resumes are read only up to this many characters (the rest of the file is not parsed)
+    DOCX_MAX_CHARS = int(os.environ.get('DOCX_MAX_CHARS') or 50000)
+    
+    # OCR fallback for image-only PDF resumes (needs pytesseract + tesseract; 0 workers disables)
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS') or (0 if IS_SERVERLESS else 2))
+    OCR_MAX_PAGES = int(os.environ.get('OCR_MAX_PAGES') or 5)
+    OCR_DPI = int(os.environ.get('OCR_DPI') or 200)  # capped at 300
+    OCR_PAGE_TIMEOUT = int(os.environ.get('OCR_PAGE_TIMEOUT') or 30)  # seconds
+    OCR_LANG = os.environ.get('OCR_LANG') or 'eng'
+    
+    # File outbox: deferred unlinks and crash recovery for staged uploads (inline when there is no worker thread)
+    FILE_OUTBOX_WORKER = (os.environ.get('FILE_OUTBOX_WORKER') or ('false' if IS_SERVERLESS else 'true')).lower() == 'true'
+    FILE_OUTBOX_POLL_SECONDS = float(os.environ.get('FILE_OUTBOX_POLL_SECONDS') or 30)
+    STAGING_MAX_AGE_HOURS = float(os.environ.get('STAGING_MAX_AGE_HOURS') or 24)
+    
+    # Document request lifecycle: fulfilled once every required type is on file, reminders while nothing
+    # has arrived, expired when still open after REQUEST_EXPIRY_DAYS (by the document-requests maintenance task)
+    REQUEST_REQUIRED_DOCUMENTS = tuple(
+        name.strip().lower() for name in (os.environ.get('REQUEST_REQUIRED_DOCUMENTS') or 'pan,aadhaar').split(',')
+        if name.strip()
+    )
+    REQUEST_OVERDUE_DAYS = float(os.environ.get('REQUEST_OVERDUE_DAYS') or 3)
+    REQUEST_REMINDER_INTERVAL_HOURS = float(os.environ.get('REQUEST_REMINDER_INTERVAL_HOURS') or 48)
+    REQUEST_MAX_REMINDERS = int(os.environ.get('REQUEST_MAX_REMINDERS') or 3)
+    REQUEST_EXPIRY_DAYS = float(os.environ.get('REQUEST_EXPIRY_DAYS') or 14)
+    
+    # Outbound delivery of request and reminder messages through the outbound_messages outbox.
+    # Transport per channel: 'smtp', 'file' (one file per message in DELIVERY_SINK_FOLDER) or 'none' (not sent).
+    # The file sink is the default only with FLASK_ENV=development: elsewhere it would count as delivered
+    DEVELOPMENT = (os.environ.get('FLASK_ENV') or '').lower() == 'development'
+    _default_transport = 'file' if DEVELOPMENT else 'none'
+    DELIVERY_EMAIL_TRANSPORT = (os.environ.get('DELIVERY_EMAIL_TRANSPORT') or _default_transport).lower()
+    DELIVERY_SMS_TRANSPORT = (os.environ.get('DELIVERY_SMS_TRANSPORT') or _default_transport).lower()
+    DELIVERY_SINK_FOLDER = os.environ.get('DELIVERY_SINK_FOLDER') or os.path.join(UPLOAD_FOLDER, 'outbox')
+    # Without the worker thread (serverless) messages are sent inline after the request commits
+    DELIVERY_WORKER = (os.environ.get('DELIVERY_WORKER') or ('false' if IS_SERVERLESS else 'true')).lower() == 'true'
+    DELIVERY_POLL_SECONDS = float(os.environ.get('DELIVERY_POLL_SECONDS') or 5)
+    DELIVERY_BATCH_SIZE = int(os.environ.get('DELIVERY_BATCH_SIZE') or 100)  # messages claimed per channel per round
+    DELIVERY_EMAIL_PER_MINUTE = float(os.environ.get('DELIVERY_EMAIL_PER_MINUTE') or 600)
+    DELIVERY_SMS_PER_MINUTE = float(os.environ.get('DELIVERY_SMS_PER_MINUTE') or 120)
+    DELIVERY_MAX_ATTEMPTS = int(os.environ.get('DELIVERY_MAX_ATTEMPTS') or 5)
+    DELIVERY_RETRY_BASE_SECONDS = float(os.environ.get('DELIVERY_RETRY_BASE_SECONDS') or 30)
+    DELIVERY_RETRY_MAX_SECONDS = float(os.environ.get('DELIVERY_RETRY_MAX_SECONDS') or 3600)
+    # Claimed messages not finished within this long (worker crash) are claimed again. A batch claims no
+    # more than the channel rate sends in half a lease and stops sending at half the lease
+    DELIVERY_LEASE_SECONDS = float(os.environ.get('DELIVERY_LEASE_SECONDS') or 300)
+    DELIVERY_FROM_EMAIL = os.environ.get('DELIVERY_FROM_EMAIL') or 'TraqCheck Verification <verification@traqcheck.local>'
+    SMTP_HOST = os.environ.get('SMTP_HOST') or 'localhost'
+    SMTP_PORT = int(os.environ.get('SMTP_PORT') or 25)
+    SMTP_USERNAME = os.environ.get('SMTP_USERNAME') or ''
+    SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD') or ''
+    SMTP_STARTTLS = (os.environ.get('SMTP_STARTTLS') or 'false').lower() == 'true'
+    SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT') or 30)
+    # One connection carries up to this many messages before it is re-opened
+    SMTP_MESSAGES_PER_CONNECTION = int(os.environ.get('SMTP_MESSAGES_PER_CONNECTION') or 100)
+    
+    # Maintenance (orphaned files, failed extractions): CLI in db_manager.py, optional in-process scheduler
+    MAINTENANCE_ENABLED = (os.environ.get('MAINTENANCE_ENABLED') or 'false').lower() == 'true' and not IS_SERVERLESS
+    MAINTENANCE_INTERVAL_HOURS = float(os.environ.get('MAINTENANCE_INTERVAL_HOURS') or 24)
+    MAINTENANCE_DRY_RUN = (os.environ.get('MAINTENANCE_DRY_RUN') or 'false').lower() == 'true'
+    MAINTENANCE_BATCH_SIZE = int(os.environ.get('MAINTENANCE_BATCH_SIZE') or 500)
+    # Files younger than this are never treated as orphans (uploads are saved before their row is committed)
+    MAINTENANCE_MIN_FILE_AGE = int(os.environ.get('MAINTENANCE_MIN_FILE_AGE') or 3600)
+    MAINTENANCE_FAILED_MIN_AGE_DAYS = float(os.environ.get('MAINTENANCE_FAILED_MIN_AGE_DAYS') or 1)
+    
+    # Instrumentation - Prometheus text at /metrics and per-request Server-Timing headers
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or 'true').lower() == 'true'
+    SERVER_TIMING_ENABLED = (os.environ.get('SERVER_TIMING_ENABLED') or 'true').lower() == 'true'
@@ -1,8 +1,21 @@
 """
 Database management and cleanup utility
+
+Interactive menu:       python db_manager.py
+Maintenance (cron):     python db_manager.py orphaned-files [--dry-run] [--batch-size N] [--min-age SECONDS]
+                        python db_manager.py failed-extractions [--dry-run] [--batch-size N] [--older-than-days D]
+                        python db_manager.py embeddings [--dry-run] [--batch-size N] [--rebuild]
+                        python db_manager.py document-requests [--dry-run] [--batch-size N] [--expiry-days D]
+                        python db_manager.py deliveries [--dry-run] [--batch-size N]
+Foreground scheduler:   python db_manager.py schedule [--interval-hours H] [--dry-run]
+Schema migrations:      python db_manager.py migrate [--status] [--target VERSION]
 """
+import argparse
+import json
+import logging
 import os
 import sys
+import time
 from datetime import datetime
 from sqlalchemy import create_engine, func
 from sqlalchemy.orm import sessionmaker
@@ -12,6 +25,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from models import db, Candidate, Document, DocumentRequest
 from config import Config
+import maintenance
+import migrations
 
 class DatabaseManager:
     def __init__(self):
@@ -106,83 +121,40 @@ class DatabaseManager:
         if not email_dupes and not phone_dupes:
             print("\n✅ No duplicates found")
     
+    def run_maintenance(self, task, dry_run=True, batch_size=None, **options):
+        """Run a maintenance task (see maintenance.TASKS) and return its report"""
+        batch_size = batch_size or Config.MAINTENANCE_BATCH_SIZE
+        return maintenance.TASKS[task](self.session, dry_run=dry_run, batch_size=batch_size, **options)
+    
+    def _confirm_and_run(self, task, noun):
+        report = self.run_maintenance(task, dry_run=True)
+        if not report['matched']:
+            print(f"\n✅ No {noun} found")
+            return
+        
+        print(f"\n⚠️  Found {report['matched']} {noun} ({report['bytes'] / (1024*1024):.1f} MB):")
+        for item in report['sample']:
+            print(f"  - {item}")
+        if report['matched'] > len(report['sample']):
+            print(f"  ... and {report['matched'] - len(report['sample'])} more")
+        
+        confirm = input("\nDelete these? (yes/no): ")
+        if confirm.lower() == 'yes':
+            report = self.run_maintenance(task, dry_run=False)
+            print(f"  ✅ Deleted {report['deleted']} ({report['errors']} errors)")
+    
     def cleanup_orphaned_files(self):
         """Remove files that don't have database records"""
         print("\n" + "=" * 60)
         print("  ORPHANED FILES CLEANUP")
         print("=" * 60)
-        
-        upload_folder = Config.UPLOAD_FOLDER
-        if not os.path.exists(upload_folder):
-            print("\n✅ No upload folder found")
-            return
-        
-        # Get all files (not directories)
-        all_files = set()
-        for item in os.listdir(upload_folder):
-            item_path = os.path.join(upload_folder, item)
-            if os.path.isfile(item_path):
-                all_files.add(item)
-        
-        # Get all filenames from database
-        db_files = set()
-        candidates = self.session.query(Candidate).all()
-        for c in candidates:
-            if c.resume_filename:
-                db_files.add(c.resume_filename)
-        
-        documents = self.session.query(Document).all()
-        for d in documents:
-            if d.filename:
-                db_files.add(d.filename)
-        
-        # Find orphaned files
-        orphaned = all_files - db_files
-        
-        if orphaned:
-            print(f"\n⚠️  Found {len(orphaned)} orphaned files:")
-            for filename in orphaned:
-                print(f"  - {filename}")
-            
-            confirm = input("\nDelete these files? (yes/no): ")
-            if confirm.lower() == 'yes':
-                for filename in orphaned:
-                    filepath = os.path.join(upload_folder, filename)
-                    try:
-                        os.remove(filepath)
-                        print(f"  ✅ Deleted: {filename}")
-                    except Exception as e:
-                        print(f"  ❌ Could not delete {filename}: {e}")
-        else:
-            print("\n✅ No orphaned files found")
+        self._confirm_and_run('orphaned-files', 'orphaned files')
     
     def cleanup_failed_extractions(self):
         print("\n" + "=" * 60)
         print("  FAILED EXTRACTIONS CLEANUP")
         print("=" * 60)
-        
-        failed = self.session.query(Candidate).filter_by(extraction_status='failed').all()
-        
-        if not failed:
-            print("\n✅ No failed extractions found")
-            return
-        
-        print(f"\n⚠️  Found {len(failed)} failed extractions:")
-        for c in failed:
-            print(f"  - ID: {c.id}, File: {c.resume_filename}, Created: {c.created_at}")
-        
-        confirm = input("\nDelete these candidates? (yes/no): ")
-        if confirm.lower() == 'yes':
-            for c in failed:
-                if c.resume_filename:
-                    filepath = os.path.join(Config.UPLOAD_FOLDER, c.resume_filename)
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-                
-                self.session.delete(c)
-            
-            self.session.commit()
-            print(f"  ✅ Deleted {len(failed)} candidates")
+        self._confirm_and_run('failed-extractions', 'failed extractions')
     
     def reset_database(self):
         """Drop and recreate all tables"""
@@ -202,10 +174,11 @@ class DatabaseManager:
         
         # Drop all tables
         db.metadata.drop_all(self.engine)
+        migrations.version_table.drop(self.engine, checkfirst=True)
         print("  ✅ Dropped all tables")
         
         # Recreate tables
-        db.metadata.create_all(self.engine)
+        migrations.upgrade(self.engine)
         print("  ✅ Recreated tables")
         
         # Clean upload folder
@@ -269,5 +242,93 @@ def main():
     finally:
         db.close()
 
+def build_parser():
+    parser = argparse.ArgumentParser(description="TraqCheck database maintenance")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    subparsers.add_parser('stats', help="Show database statistics")
+    
+    orphans = subparsers.add_parser('orphaned-files', help="Delete uploaded files no row references")
+    orphans.add_argument('--min-age', type=float, default=None,
+                         help="Skip files modified within this many seconds (default MAINTENANCE_MIN_FILE_AGE)")
+    
+    failed = subparsers.add_parser('failed-extractions', help="Delete candidates whose extraction failed")
+    failed.add_argument('--older-than-days', type=float, default=None,
+                        help="Only candidates created before this many days ago (default MAINTENANCE_FAILED_MIN_AGE_DAYS)")
+    
+    embeddings = subparsers.add_parser('embeddings', help="Embed candidates without a vector and rebuild the similarity index")
+    embeddings.add_argument('--rebuild', action='store_true', help="Rebuild the index even if it is up to date")
+    
+    requests = subparsers.add_parser('document-requests', help="Expire stale document requests and count reminders due")
+    requests.add_argument('--expiry-days', type=float, default=None,
+                          help="Expire requests open longer than this many days (default REQUEST_EXPIRY_DAYS)")
+    
+    deliveries = subparsers.add_parser('deliveries', help="Send due request and reminder messages from the outbox")
+    
+    schedule = subparsers.add_parser('schedule', help="Run all maintenance tasks periodically in the foreground")
+    schedule.add_argument('--interval-hours', type=float, default=Config.MAINTENANCE_INTERVAL_HOURS)
+    
+    migrate = subparsers.add_parser('migrate', help="Apply pending schema migrations")
+    migrate.add_argument('--status', action='store_true', help="List migrations and whether they are applied")
+    migrate.add_argument('--target', default=None, help="Stop after this version")
+    
+    for sub in (orphans, failed, embeddings, requests, deliveries, schedule):
+        sub.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting")
+        sub.add_argument('--batch-size', type=int, default=Config.MAINTENANCE_BATCH_SIZE)
+    return parser
+
+def run_migrations(args):
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+    try:
+        if args.status:
+            applied = set(migrations.applied_versions(engine))
+            for migration in migrations.MIGRATIONS:
+                mark = 'applied' if migration.version in applied else 'pending'
+                print(f"{migration.version}  {mark:8} {migration.description}")
+            return 0
+        done = migrations.upgrade(engine, target=args.target)
+        print(f"Applied {len(done)} migration(s): {', '.join(done)}" if done else "Schema is up to date")
+        return 0
+    finally:
+        engine.dispose()
+
+def run_command(args):
+    if args.command == 'migrate':
+        return run_migrations(args)
+    
+    db = DatabaseManager()
+    try:
+        if args.command == 'stats':
+            db.show_stats()
+            return 0
+        
+        if args.command == 'schedule':
+            while True:
+                try:
+                    for report in maintenance.run_tasks(db.session, list(maintenance.TASKS), args.dry_run, args.batch_size):
+                        print(json.dumps(report), flush=True)
+                except Exception:
+                    db.session.rollback()
+                    logging.exception("Maintenance run failed")
+                time.sleep(args.interval_hours * 3600)
+        
+        options = {}
+        if args.command == 'orphaned-files':
+            options['min_age'] = args.min_age
+        elif args.command == 'embeddings':
+            options['rebuild'] = args.rebuild
+        elif args.command == 'document-requests':
+            options['expiry_days'] = args.expiry_days
+        elif args.command == 'failed-extractions':
+            options['older_than_days'] = args.older_than_days
+        report = db.run_maintenance(args.command, dry_run=args.dry_run, batch_size=args.batch_size, **options)
+        print(json.dumps(report, indent=2))
+        return 1 if report['errors'] else 0
+    finally:
+        db.close()
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+        sys.exit(run_command(build_parser().parse_args()))
     main()
@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, insert, literal, select, union_all
+
+from events import publish, CANDIDATE_DELETED
+from file_store import UNLINK, UNLINK_THUMBNAILS
+from metrics import timed
+from models import Candidate, CandidateSkill, Document, DocumentRequest, FileOperation, OutboundMessage
+
+
+def invalidate_cached(candidate_ids) -> None:
+    """Drop the cached payloads of these candidates and the list, when running inside the app"""
+    if has_app_context() and 'response_cache' in current_app.extensions:
+        cache = current_app.extensions['response_cache']
+        for candidate_id in candidate_ids:
+            cache.invalidate(candidate_id)
+
+
+def _queue_file_removals(session, ids: List[int]) -> None:
+    """INSERT ... SELECT the unlinks for a batch of candidates into the file outbox"""
+    now = datetime.utcnow()
+    sources = (
+        (UNLINK, Candidate.resume_path, Candidate.id),
+        (UNLINK, Document.file_path, Document.candidate_id),
+        (UNLINK_THUMBNAILS, Document.filename, Document.candidate_id),
+    )
+    rows = union_all(*(
+        select(literal(op), path_column, literal(now), literal(0)).where(id_column.in_(ids), path_column.isnot(None))
+        for op, path_column, id_column in sources
+    ))
+    session.execute(insert(FileOperation).from_select(['op', 'path', 'created_at', 'attempts'], rows))
+
+
+def delete_candidates(session, condition, batch_size: int = 500, dry_run: bool = False,
+                      limit: Optional[int] = None, collect_ids: bool = True) -> Dict[str, Any]:
+    """Delete every candidate matching `condition` with set-based statements.
+
+    Works in id-ordered batches, one transaction each. Per batch the file
+    removals are queued in the outbox with INSERT ... SELECT, then documents,
+    outbound messages, document requests and candidates are deleted with one
+    DELETE each. No rows are loaded into the session. Cached payloads are
+    invalidated per batch (inside the app); files are removed afterwards by
+    the outbox worker. Returns {'matched', 'deleted', 'ids'}
+    ('ids' stays empty without `collect_ids`, keeping memory flat for very
+    large deletes).
+    """
+    report = {'matched': 0, 'deleted': 0, 'ids': []}
+    last_id = 0
+    with timed('db.delete_candidates'):
+        while limit is None or report['matched'] < limit:
+            size = batch_size if limit is None else min(batch_size, limit - report['matched'])
+            ids = list(session.execute(
+                select(Candidate.id).where(condition, Candidate.id > last_id).order_by(Candidate.id).limit(size)
+            ).scalars())
+            if not ids:
+                break
+            last_id = ids[-1]
+            report['matched'] += len(ids)
+            if collect_ids:
+                report['ids'].extend(ids)
+            if dry_run:
+                continue
+
+            _queue_file_removals(session, ids)
+            # Children are deleted explicitly as well as by ON DELETE CASCADE, so databases
+            # created before the cascade was declared behave the same
+            session.execute(delete(Document).where(Document.candidate_id.in_(ids)))
+            session.execute(delete(OutboundMessage).where(OutboundMessage.candidate_id.in_(ids)))
+            session.execute(delete(DocumentRequest).where(DocumentRequest.candidate_id.in_(ids)))
+            session.execute(delete(CandidateSkill).where(CandidateSkill.candidate_id.in_(ids)))
+            session.execute(delete(Candidate).where(Candidate.id.in_(ids)))
+            session.commit()
+            # Set-based deletes bypass the ORM flush hooks, so announce them here
+            publish(CANDIDATE_DELETED, {'candidate_ids': ids})
+            invalidate_cached(ids)
+            report['deleted'] += len(ids)
+    return report
@@ -0,0 +1,556 @@
+"""
+Outbound delivery of document request and reminder messages.
+
+Messages are written to the outbound_messages outbox in the transaction that
+creates them (see queue_message) and sent afterwards by DeliveryWorker, one
+thread per channel. Each round claims up to `batch_size` due messages of a
+channel, sends them through that channel's transport (SMTP reuses one
+connection for the whole batch) at the channel's token-bucket rate, and
+records the outcomes in one transaction. Failures are retried with
+exponential backoff until DELIVERY_MAX_ATTEMPTS; permanent rejections (5xx,
+refused recipients) fail at once.
+
+Delivery is at least once: a worker that dies mid-batch leaves its claimed
+messages to be claimed again when their lease runs out. A live worker never
+outlasts its lease: a batch claims no more than the channel rate can send in
+half a lease, and stops at half the lease, handing back what it has not
+started. The file sink names files by message id, so a repeated delivery
+overwrites the first.
+"""
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from email.header import Header
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid, parseaddr
+from typing import Any, Dict, List, Mapping, Optional
+
+from sqlalchemy import func, select, update
+
+from events import REQUEST_UPDATED, publish_after_commit
+from metrics import registry, timed
+from models import db, DocumentRequest, OutboundMessage, REQUEST_QUEUED, REQUEST_SENT
+from resilience import RateLimitTimeout, TokenBucket, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+deliveries = registry.counter(
+    'traqcheck_deliveries_total',
+    'Outbound messages by channel and outcome (sent, retry, failed)',
+    ('channel', 'outcome')
+)
+delivery_latency = registry.histogram(
+    'traqcheck_delivery_latency_seconds',
+    'Time from queueing an outbound message to handing it to the transport',
+    ('channel',),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600, 4 * 3600, 24 * 3600)
+)
+delivery_connections = registry.counter(
+    'traqcheck_delivery_connections_total',
+    'Transport connections opened, by transport',
+    ('transport',)
+)
+
+PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+EMAIL, SMS = 'email', 'sms'
+CHANNELS = (EMAIL, SMS)
+KIND_REQUEST, KIND_REMINDER = 'request', 'reminder'
+DEFAULT_SUBJECT = 'Documents for your background verification'
+RECENT_LATENCIES = 1000
+
+
+class PermanentDeliveryError(Exception):
+    """The message can never be delivered as it is (refused recipient, rejected content): not retried"""
+
+
+class TransportUnavailable(Exception):
+    """The transport cannot be reached (connect or login failed): the rest of the batch is retried later"""
+
+
+def split_email(text: str):
+    """(subject, body) of an agent-written email ("SUBJECT: ...", "BODY: ..."); plain text gets a default subject"""
+    text = (text or '').strip()
+    if not text.upper().startswith('SUBJECT:'):
+        return DEFAULT_SUBJECT, text
+    subject, _, rest = text[len('SUBJECT:'):].partition('\n')
+    rest = rest.strip()
+    if rest.upper().startswith('BODY:'):
+        rest = rest[len('BODY:'):].strip()
+    return subject.strip() or DEFAULT_SUBJECT, rest
+
+
+def recipient_for(channel: str, email: Optional[str], phone: Optional[str]) -> Optional[str]:
+    return email if channel == EMAIL else phone
+
+
+def queue_message(session, candidate_id: int, channel: str, recipient: Optional[str], text: str, kind: str,
+                  request_id: Optional[int] = None) -> Optional[OutboundMessage]:
+    """Add a message to the outbox in the session's transaction; None when there is no recipient"""
+    if not recipient or not text:
+        return None
+    subject, body = split_email(text) if channel == EMAIL else (None, text.strip())
+    message = OutboundMessage(candidate_id=candidate_id, request_id=request_id, kind=kind, channel=channel,
+                              recipient=recipient.strip(), subject=subject, body=body, status=PENDING,
+                              attempts=0, next_attempt_at=datetime.utcnow())
+    session.add(message)
+    return message
+
+
+def render_email(message, from_address: str) -> bytes:
+    """The message as RFC 5322 bytes.
+
+    Built with the compat32 MIMEText API: the default email policy parses
+    and re-folds every header, which costs more than the SMTP round trip.
+    """
+    subject = message.subject or DEFAULT_SUBJECT
+    email = MIMEText(message.body, 'plain', 'utf-8')
+    email['From'] = from_address
+    email['To'] = message.recipient
+    email['Subject'] = subject if subject.isascii() else Header(subject, 'utf-8')
+    email['Date'] = formatdate(localtime=False)
+    domain = parseaddr(from_address)[1].partition('@')[2] or None
+    email['Message-ID'] = make_msgid(f'traqcheck.{message.id}', domain=domain)
+    return email.as_bytes()
+
+
+# --- transports -------------------------------------------------------------
+
+class Transport:
+    """Sends the messages of one channel: open() before a batch, send() per message (raises on failure), close()"""
+
+    name = 'base'
+
+    def open(self) -> None:
+        pass
+
+    def send(self, message) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class FileSinkTransport(Transport):
+    """Writes each message to <folder>/<channel>/<id>.eml (email) or .json (SMS).
+
+    Stands in for an SMTP server or SMS gateway in development and tests.
+    """
+
+    name = 'file'
+
+    def __init__(self, folder: str, channel: str, from_address: str):
+        self.directory = os.path.join(folder, channel)
+        self.channel = channel
+        self.from_address = from_address
+
+    def open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+    def send(self, message) -> None:
+        if self.channel == EMAIL:
+            path, data = f'{message.id}.eml', render_email(message, self.from_address)
+        else:
+            path, data = f'{message.id}.json', json.dumps({
+                'id': message.id, 'to': message.recipient, 'body': message.body,
+                'queued_at': message.created_at.isoformat() if message.created_at else None
+            }).encode('utf-8')
+        path = os.path.join(self.directory, path)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+
+class SMTPTransport(Transport):
+    """SMTP delivery that keeps one connection open across a batch.
+
+    The connection is opened on the first message, re-opened after
+    `messages_per_connection` messages or a dropped connection, and closed
+    with QUIT at the end of the batch.
+    """
+
+    name = 'smtp'
+
+    def __init__(self, host: str, port: int, from_address: str, username: str = '', password: str = '',
+                 starttls: bool = False, timeout: float = 30, messages_per_connection: int = 100):
+        self.host = host
+        self.port = port
+        self.from_address = from_address
+        self.envelope_sender = parseaddr(from_address)[1]
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.messages_per_connection = max(1, messages_per_connection)
+        self._smtp = None
+        self._sent_on_connection = 0
+
+    def _connect(self) -> None:
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        except (smtplib.SMTPException, OSError) as e:
+            raise TransportUnavailable(f"SMTP {self.host}:{self.port}: {e}")
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except (smtplib.SMTPException, OSError) as e:
+            smtp.close()
+            raise TransportUnavailable(f"SMTP {self.host}:{self.port}: {e}")
+        delivery_connections.inc(self.name)
+        self._smtp, self._sent_on_connection = smtp, 0
+
+    def send(self, message) -> None:
+        if self._smtp is not None and self._sent_on_connection >= self.messages_per_connection:
+            self.close()
+        if self._smtp is None:
+            self._connect()
+        try:
+            self._smtp.sendmail(self.envelope_sender, [message.recipient], render_email(message, self.from_address))
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentDeliveryError(f"Recipient refused: {e.recipients}")
+        except smtplib.SMTPResponseException as e:
+            if 500 <= e.smtp_code < 600:
+                raise PermanentDeliveryError(f"{e.smtp_code} {e.smtp_error!r}")
+            raise
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Reconnect for the next message
+            self.close()
+            raise
+        self._sent_on_connection += 1
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+
+def build_transport(channel: str, config: Mapping[str, Any]) -> Optional[Transport]:
+    """The configured transport of a channel, or None when the channel is not delivered ('none')"""
+    name = config['DELIVERY_EMAIL_TRANSPORT' if channel == EMAIL else 'DELIVERY_SMS_TRANSPORT']
+    if name == 'none':
+        return None
+    if name == 'file':
+        return FileSinkTransport(config['DELIVERY_SINK_FOLDER'], channel, config['DELIVERY_FROM_EMAIL'])
+    if name == 'smtp' and channel == EMAIL:
+        return SMTPTransport(config['SMTP_HOST'], config['SMTP_PORT'], config['DELIVERY_FROM_EMAIL'],
+                             config['SMTP_USERNAME'], config['SMTP_PASSWORD'], config['SMTP_STARTTLS'],
+                             config['SMTP_TIMEOUT'], config['SMTP_MESSAGES_PER_CONNECTION'])
+    raise ValueError(f"Unknown {channel} transport '{name}'")
+
+
+def build_transports(config: Mapping[str, Any]) -> Dict[str, Transport]:
+    transports = {channel: build_transport(channel, config) for channel in CHANNELS}
+    return {channel: transport for channel, transport in transports.items() if transport is not None}
+
+
+def build_limiters(config: Mapping[str, Any]) -> Dict[str, Optional[TokenBucket]]:
+    """Per-channel token buckets; a rate of 0 means unlimited. Bursts are capped at one second's worth."""
+    limiters = {}
+    for channel in CHANNELS:
+        rate = config['DELIVERY_EMAIL_PER_MINUTE' if channel == EMAIL else 'DELIVERY_SMS_PER_MINUTE']
+        limiters[channel] = TokenBucket(rate, capacity=max(1.0, rate / 60)) if rate > 0 else None
+    return limiters
+
+
+# --- outbox processing ------------------------------------------------------
+
+def release_expired_claims(session, now: Optional[datetime] = None) -> int:
+    """Put messages claimed by a worker that never finished them back in the queue"""
+    result = session.execute(
+        update(OutboundMessage)
+        .where(OutboundMessage.status == SENDING, OutboundMessage.next_attempt_at < (now or datetime.utcnow()))
+        .values(status=PENDING)
+    )
+    session.commit()
+    return result.rowcount
+
+
+def claim_batch(session, channel: str, limit: int, lease_seconds: float, now: Optional[datetime] = None):
+    """Claim up to `limit` due messages of a channel, oldest first, and commit; returns their rows"""
+    now = now or datetime.utcnow()
+    # (status, channel, next_attempt_at, id) index range, already in order
+    due = (OutboundMessage.status == PENDING, OutboundMessage.channel == channel, OutboundMessage.next_attempt_at <= now)
+    ids = list(session.execute(
+        select(OutboundMessage.id).where(*due)
+        .order_by(OutboundMessage.next_attempt_at, OutboundMessage.id).limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars())
+    if not ids:
+        session.rollback()
+        return []
+    claimed = list(session.execute(
+        update(OutboundMessage)
+        .where(OutboundMessage.id.in_(ids), OutboundMessage.status == PENDING)
+        .values(status=SENDING, attempts=OutboundMessage.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=lease_seconds))
+        .returning(OutboundMessage.id)
+    ).scalars())
+    rows = session.execute(
+        select(OutboundMessage.id, OutboundMessage.candidate_id, OutboundMessage.request_id, OutboundMessage.kind,
+               OutboundMessage.channel, OutboundMessage.recipient, OutboundMessage.subject, OutboundMessage.body,
+               OutboundMessage.attempts, OutboundMessage.created_at)
+        .where(OutboundMessage.id.in_(claimed)).order_by(OutboundMessage.id)
+    ).all()
+    session.commit()
+    return rows
+
+
+def _wait_turn(limiter: Optional[TokenBucket], stop_at: Optional[float]) -> bool:
+    """Take a send token; False when `stop_at` passes first"""
+    remaining = None if stop_at is None else stop_at - time.monotonic()
+    if remaining is not None and remaining <= 0:
+        return False
+    if limiter is not None:
+        try:
+            limiter.acquire(timeout=remaining)
+        except RateLimitTimeout:
+            return False
+    return True
+
+
+def deliver_batch(session, transport: Transport, limiter: Optional[TokenBucket], rows, max_attempts: int,
+                  retry_base: float, retry_max: float, stop_at: Optional[float] = None) -> Dict[str, Any]:
+    """Send claimed messages over one transport session and record every outcome in one transaction.
+
+    Messages not started by `stop_at` (time.monotonic()) go back to the queue
+    without using up an attempt. Returns {'sent', 'retried', 'failed',
+    'deferred', 'latencies', 'candidate_ids'}.
+    """
+    sent, retried, failed, deferred, latencies = [], [], [], [], []
+    try:
+        transport.open()
+        for index, row in enumerate(rows):
+            if not _wait_turn(limiter, stop_at):
+                now = datetime.utcnow()
+                deferred = [{'id': rest.id, 'status': PENDING, 'attempts': rest.attempts - 1,
+                             'next_attempt_at': now} for rest in rows[index:]]
+                break
+            try:
+                with timed(f'delivery.{row.channel}'):
+                    transport.send(row)
+            except PermanentDeliveryError as e:
+                failed.append({'id': row.id, 'status': FAILED, 'last_error': str(e)})
+            except TransportUnavailable:
+                raise
+            except Exception as e:
+                if row.attempts >= max_attempts:
+                    failed.append({'id': row.id, 'status': FAILED, 'last_error': str(e)})
+                else:
+                    retry_at = datetime.utcnow() + timedelta(seconds=backoff_delay(row.attempts, retry_base, retry_max))
+                    retried.append({'id': row.id, 'status': PENDING, 'next_attempt_at': retry_at,
+                                    'last_error': str(e)})
+            else:
+                sent_at = datetime.utcnow()
+                sent.append({'id': row.id, 'status': SENT, 'sent_at': sent_at, 'last_error': None})
+                if row.created_at:
+                    latencies.append((sent_at - row.created_at).total_seconds())
+    except Exception as e:
+        # The transport is unavailable: everything not yet sent is retried
+        done = {outcome['id'] for outcome in sent + retried + failed}
+        for row in rows:
+            if row.id not in done:
+                retried.append({'id': row.id, 'status': PENDING, 'last_error': str(e),
+                                'next_attempt_at': datetime.utcnow() + timedelta(
+                                    seconds=backoff_delay(row.attempts, retry_base, retry_max))})
+        logger.warning("%s transport failed: %s", transport.name, e)
+    finally:
+        transport.close()
+
+    # Bulk UPDATE by primary key (executemany)
+    for outcomes in (sent, retried, failed, deferred):
+        if outcomes:
+            session.execute(update(OutboundMessage), outcomes)
+    sent_ids = {outcome['id'] for outcome in sent}
+    request_ids = [row.request_id for row in rows if row.id in sent_ids and row.kind == KIND_REQUEST and row.request_id]
+    candidate_ids = set()
+    if request_ids:
+        # Guarded: a request already opened or fulfilled stays where it is
+        for request_id, candidate_id in session.execute(
+            update(DocumentRequest)
+            .where(DocumentRequest.id.in_(request_ids), DocumentRequest.status == REQUEST_QUEUED)
+            .values(status=REQUEST_SENT)
+            .returning(DocumentRequest.id, DocumentRequest.candidate_id)
+        ):
+            publish_after_commit(session, REQUEST_UPDATED, {
+                'candidate_id': candidate_id, 'request_ids': [request_id], 'change': REQUEST_SENT
+            })
+            candidate_ids.add(candidate_id)
+    session.commit()
+
+    channel = rows[0].channel if rows else ''
+    deliveries.inc(channel, 'sent', amount=len(sent))
+    deliveries.inc(channel, 'retry', amount=len(retried))
+    deliveries.inc(channel, 'failed', amount=len(failed))
+    for latency in latencies:
+        delivery_latency.observe(latency, channel)
+    for outcome in failed:
+        logger.warning("Delivery of message %s failed permanently: %s", outcome['id'], outcome['last_error'])
+    return {'sent': len(sent), 'retried': len(retried), 'failed': len(failed), 'deferred': len(deferred),
+            'latencies': latencies, 'candidate_ids': candidate_ids}
+
+
+def drain_channel(session, channel: str, transport: Transport, limiter: Optional[TokenBucket] = None,
+                  batch_size: int = 100, max_attempts: int = 5, retry_base: float = 30, retry_max: float = 3600,
+                  lease_seconds: float = 300, max_batches: Optional[int] = None) -> Dict[str, Any]:
+    """Deliver a channel's due messages batch by batch until none are left (or `max_batches`)"""
+    report = {'channel': channel, 'batches': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'deferred': 0,
+              'latencies': [], 'candidate_ids': set(), 'seconds': 0.0}
+    if limiter is not None:
+        # No more than the rate sends in half a lease, so the claim cannot expire while the batch is sent
+        batch_size = max(1, min(batch_size, int(limiter.rate * lease_seconds / 2)))
+    started = time.perf_counter()
+    release_expired_claims(session)
+    while max_batches is None or report['batches'] < max_batches:
+        claimed_at = time.monotonic()
+        rows = claim_batch(session, channel, batch_size, lease_seconds)
+        if not rows:
+            break
+        result = deliver_batch(session, transport, limiter, rows, max_attempts, retry_base, retry_max,
+                               stop_at=claimed_at + lease_seconds / 2)
+        report['batches'] += 1
+        for key in ('sent', 'retried', 'failed', 'deferred'):
+            report[key] += result[key]
+        report['latencies'].extend(result['latencies'])
+        report['candidate_ids'].update(result['candidate_ids'])
+        if result['deferred'] == len(rows):
+            # Nothing could be started within the lease: wait for the next round
+            break
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def queue_stats(session) -> Dict[str, Any]:
+    """Undelivered messages per channel and status, and the age of the oldest due one"""
+    now = datetime.utcnow()
+    queue = {channel: {PENDING: 0, SENDING: 0, FAILED: 0} for channel in CHANNELS}
+    # Status range reads on the queue index; delivered messages are never counted
+    for status, channel, count, oldest in session.execute(
+        select(OutboundMessage.status, OutboundMessage.channel, func.count(), func.min(OutboundMessage.created_at))
+        .where(OutboundMessage.status.in_((PENDING, SENDING, FAILED)))
+        .group_by(OutboundMessage.status, OutboundMessage.channel)
+    ):
+        queue.setdefault(channel, {})[status] = count
+        if status == PENDING and oldest is not None:
+            queue[channel]['oldest_pending_seconds'] = round((now - oldest).total_seconds(), 1)
+    return queue
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class DeliveryWorker:
+    """Sends the outbox on one background thread per channel.
+
+    Without threads (serverless) notify() delivers one batch per channel
+    inline after the request that queued the messages has committed.
+    """
+
+    def __init__(self, app, transports: Dict[str, Transport], limiters: Dict[str, Optional[TokenBucket]],
+                 poll_interval: float = 5.0, batch_size: int = 100, max_attempts: int = 5,
+                 retry_base: float = 30, retry_max: float = 3600, lease_seconds: float = 300):
+        self.app = app
+        self.transports = transports
+        self.limiters = limiters
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        # A transport holds one connection: a channel is drained by one thread at a time
+        self._locks = {channel: threading.Lock() for channel in transports}
+        self._wake = {channel: threading.Event() for channel in transports}
+        self._stop = threading.Event()
+        self._threads = []
+        self._totals = {channel: {'sent': 0, 'retried': 0, 'failed': 0, 'busy_seconds': 0.0}
+                        for channel in transports}
+        self._latencies = {channel: deque(maxlen=RECENT_LATENCIES) for channel in transports}
+
+    @property
+    def channels(self):
+        """Channels with a transport: messages for other channels are not queued"""
+        return tuple(self.transports)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for channel in self.transports:
+            thread = threading.Thread(target=self._run, args=(channel,), name=f'delivery-{channel}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self) -> None:
+        """New messages were committed: deliver them soon"""
+        if not self._threads:
+            for channel in self.transports:
+                self.drain(channel, max_batches=1)
+            return
+        for event in self._wake.values():
+            event.set()
+
+    def drain(self, channel: str, max_batches: Optional[int] = None) -> Dict[str, Any]:
+        with self._locks[channel], self.app.app_context():
+            try:
+                report = drain_channel(db.session, channel, self.transports[channel], self.limiters.get(channel),
+                                       self.batch_size, self.max_attempts, self.retry_base, self.retry_max,
+                                       self.lease_seconds, max_batches)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to deliver %s messages", channel)
+                return {}
+            finally:
+                db.session.remove()
+            totals = self._totals[channel]
+            for key in ('sent', 'retried', 'failed'):
+                totals[key] += report[key]
+            if report['batches']:
+                totals['busy_seconds'] += report['seconds']
+            self._latencies[channel].extend(report['latencies'])
+            cache = self.app.extensions.get('response_cache')
+            if cache is not None:
+                # Cached candidate payloads list their requests' status
+                for candidate_id in report['candidate_ids']:
+                    cache.invalidate(candidate_id)
+            return report
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth plus this process's delivered counts, throughput and recent latency per channel"""
+        with self.app.app_context():
+            queue = queue_stats(db.session)
+        channels = {}
+        for channel, totals in self._totals.items():
+            latencies = list(self._latencies[channel])
+            busy = totals['busy_seconds']
+            channels[channel] = {
+                **{key: totals[key] for key in ('sent', 'retried', 'failed')},
+                'messages_per_second': round(totals['sent'] / busy, 1) if busy else None,
+                'latency_p50_seconds': _percentile(latencies, 0.5),
+                'latency_p95_seconds': _percentile(latencies, 0.95),
+            }
+        return {'worker': bool(self._threads), 'channels': channels, 'queue': queue}
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        for event in self._wake.values():
+            event.set()
+
+    def _run(self, channel: str) -> None:
+        wake = self._wake[channel]
+        while not self._stop.is_set():
+            self.drain(channel)
+            wake.wait(self.poll_interval)
+            wake.clear()
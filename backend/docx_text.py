@@ -0,0 +1,128 @@
+import posixpath
+import zipfile
+from typing import Iterator, Optional
+from xml.etree.ElementTree import ParseError, iterparse
+
+from metrics import registry
+
+docx_truncated = registry.counter(
+    'traqcheck_docx_truncated_total',
+    'DOCX resumes whose text was cut at DOCX_MAX_CHARS',
+    ()
+)
+
+DEFAULT_DOCUMENT_PART = 'word/document.xml'
+OFFICE_DOCUMENT_REL = '/officeDocument'
+
+
+def _local(tag: str) -> str:
+    # Tags are matched by local name so transitional and strict OOXML namespaces both work
+    return tag.rpartition('}')[2]
+
+
+def _document_part(archive: zipfile.ZipFile) -> str:
+    """Path of the main document part, from the package relationships (usually word/document.xml)"""
+    try:
+        with archive.open('_rels/.rels') as rels:
+            for _, elem in iterparse(rels):
+                if _local(elem.tag) == 'Relationship' and elem.get('Type', '').endswith(OFFICE_DOCUMENT_REL):
+                    return posixpath.normpath(elem.get('Target', '').lstrip('/'))
+    except (KeyError, ParseError):
+        pass
+    return DEFAULT_DOCUMENT_PART
+
+
+def iter_docx_paragraphs(file_path: str) -> Iterator[str]:
+    """Yield the text of each paragraph of a DOCX body, in document order.
+
+    Streams word/document.xml out of the zip with iterparse instead of
+    building python-docx's object model, so memory stays flat and a caller
+    that stops early never decompresses the rest. Table cells are ordinary
+    paragraphs here, which also fixes the duplicates python-docx produces
+    for merged cells: vertically merged continuation cells are skipped, and
+    the VML fallback copy of a text box (mc:Fallback) is ignored.
+
+    Raises ValueError for anything that is not a readable DOCX package.
+    """
+    try:
+        archive = zipfile.ZipFile(file_path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ValueError(f"Invalid DOCX file format: {e}")
+    with archive:
+        part = _document_part(archive)
+        try:
+            stream = archive.open(part)
+        except KeyError:
+            raise ValueError(f"Invalid DOCX file format: missing {part}")
+        with stream:
+            paragraphs = []  # stack: text boxes put paragraphs inside paragraphs
+            skip_depth = 0  # > 0 inside mc:Fallback, vMerge continuation cells or tab-stop definitions
+            cell_skipped = []  # per open table cell: was it skipped as a merged continuation
+            try:
+                for event, elem in iterparse(stream, events=('start', 'end')):
+                    name = _local(elem.tag)
+                    if event == 'start':
+                        if name == 'p':
+                            paragraphs.append([])
+                        elif name in ('Fallback', 'tabs'):
+                            skip_depth += 1
+                        elif name == 'tc':
+                            cell_skipped.append(False)
+                        continue
+
+                    if name == 't':
+                        if not skip_depth and paragraphs and elem.text:
+                            paragraphs[-1].append(elem.text)
+                    elif name == 'tab' or name == 'ptab':
+                        if not skip_depth and paragraphs:
+                            paragraphs[-1].append('\t')
+                    elif name == 'br' or name == 'cr':
+                        if not skip_depth and paragraphs:
+                            paragraphs[-1].append('\n')
+                    elif name == 'noBreakHyphen':
+                        if not skip_depth and paragraphs:
+                            paragraphs[-1].append('-')
+                    elif name == 'p':
+                        text = ''.join(paragraphs.pop())
+                        elem.clear()
+                        if not skip_depth:
+                            yield text
+                    elif name in ('Fallback', 'tabs'):
+                        skip_depth -= 1
+                        elem.clear()
+                    elif name == 'vMerge':
+                        # Only the first cell of a vertical merge ('restart') holds the content
+                        if cell_skipped and not cell_skipped[-1] and _vmerge_continues(elem):
+                            cell_skipped[-1] = True
+                            skip_depth += 1
+                    elif name == 'tc':
+                        if cell_skipped.pop():
+                            skip_depth -= 1
+                        elem.clear()
+                    elif name == 'tbl':
+                        elem.clear()
+            except ParseError as e:
+                raise ValueError(f"Invalid DOCX file format: {e}")
+
+
+def _vmerge_continues(elem) -> bool:
+    for key, value in elem.attrib.items():
+        if _local(key) == 'val':
+            return value != 'restart'
+    return True  # <w:vMerge/> without a value continues the merge
+
+
+def extract_docx_text(file_path: str, max_chars: Optional[int] = None) -> str:
+    """Non-empty paragraphs joined by newlines, cut at `max_chars` (parsing stops there)"""
+    parts, length = [], 0
+    for text in iter_docx_paragraphs(file_path):
+        if not text.strip():
+            continue
+        if max_chars and length + len(text) > max_chars:
+            if max_chars > length:
+                parts.append(text[:max_chars - length])
+            docx_truncated.inc()
+            break
+        parts.append(text)
+        length += len(text) + 1
+    return '\n'.join(parts).strip()
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+
+from config import Config
+from metrics import registry, timed
+from models import Candidate, Embedding
+from sections import SEARCH_SECTIONS, select as select_sections
+
+logger = logging.getLogger(__name__)
+
+embedding_lookups = registry.counter(
+    'traqcheck_embedding_lookups_total',
+    'Embedding lookups by outcome (cached: found by content hash, computed: sent to the embedder)',
+    ('outcome',)
+)
+
+_TOKEN_RE = re.compile(r'[a-z0-9][a-z0-9+#.]*')
+
+
+class HashingEmbedder:
+    """Local embedder with no model download: signed feature hashing of words and word pairs.
+
+    Terms are weighted with 1 + log(tf) and the vector is L2-normalized, so
+    a dot product is the cosine similarity of the two bags of terms. Hashes
+    are stable across processes, so vectors can be cached and indexed.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f'hashing-v1:{dim}'
+
+    def _features(self, text: str) -> Counter:
+        words = [w.rstrip('.') for w in _TOKEN_RE.findall(text.lower())]
+        features = Counter(words)
+        features.update(f'{a} {b}' for a, b in zip(words, words[1:]))
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+                weight = (1.0 + math.log(count)) * (0.5 if ' ' in feature else 1.0)
+                vectors[row, digest % self.dim] += weight if digest >> 63 else -weight
+        return normalize(vectors)
+
+
+class OpenAIEmbedder:
+    """OpenAI embeddings (shortened to `dim` dimensions by the API), normalized like the local ones"""
+
+    def __init__(self, model: str, dim: int):
+        from langchain_openai import OpenAIEmbeddings
+
+        self.dim = dim
+        self.name = f'openai:{model}:{dim}'
+        self.client = OpenAIEmbeddings(
+            model=model,
+            dimensions=dim,
+            openai_api_key=Config.OPENAI_API_KEY,
+            timeout=Config.LLM_TIMEOUT,
+            max_retries=Config.LLM_MAX_RETRIES
+        )
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        with timed('llm.embed'):
+            return normalize(np.asarray(self.client.embed_documents(list(texts)), dtype=np.float32))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def build_embedder():
+    """Embedder for EMBEDDING_PROVIDER ('local' or 'openai'); the offline LLM provider always embeds locally"""
+    if Config.EMBEDDING_PROVIDER == 'openai' and Config.LLM_PROVIDER != 'offline':
+        return OpenAIEmbedder(Config.EMBEDDING_MODEL, Config.EMBEDDING_DIM)
+    return HashingEmbedder(Config.EMBEDDING_DIM)
+
+
+def candidate_text(name: Optional[str], designation: Optional[str], company: Optional[str],
+                   skills: Optional[Iterable[str]], resume_text: Optional[str],
+                   resume_sections: Optional[Dict[str, List[List[int]]]]) -> str:
+    """What a candidate is compared on: role, skills and the summary/experience/skills sections"""
+    header = [designation or '', company or '', ', '.join(skills or [])]
+    body = select_sections(resume_text, resume_sections, SEARCH_SECTIONS) if resume_text else ''
+    # The name is only a fallback: it says nothing about the profile
+    return '\n'.join(part for part in header + [body] if part) or (name or '')
+
+
+def content_hash(embedder, text: str) -> str:
+    return hashlib.sha256(f'{embedder.name}\n{text}'.encode('utf-8')).hexdigest()
+
+
+def to_bytes(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype='<f4')
+
+
+def embed_texts(session, embedder, texts: Sequence[str]) -> List[str]:
+    """Content hashes for `texts`, embedding (in one call) and storing only those not cached yet.
+
+    New rows are added to the session; the caller commits.
+    """
+    hashes = [content_hash(embedder, text) for text in texts]
+    cached = set(session.execute(
+        select(Embedding.content_hash).where(Embedding.content_hash.in_(set(hashes)))
+    ).scalars())
+    missing = {}
+    for digest, text in zip(hashes, texts):
+        if digest not in cached:
+            missing.setdefault(digest, text)
+    embedding_lookups.inc('cached', amount=len(hashes) - len(missing))
+    if missing:
+        embedding_lookups.inc('computed', amount=len(missing))
+        vectors = embedder.embed(list(missing.values()))
+        for digest, vector in zip(missing, vectors):
+            session.add(Embedding(content_hash=digest, model=embedder.name, dim=embedder.dim, vector=to_bytes(vector)))
+    return hashes
+
+
+def embed_candidate(session, embedder, candidate: Candidate) -> str:
+    """Set candidate.embedding_hash, reusing a cached vector for the same content"""
+    text = candidate_text(candidate.name, candidate.designation, candidate.company, candidate.skills,
+                          candidate.resume_text, candidate.resume_sections)
+    candidate.embedding_hash = embed_texts(session, embedder, [text])[0]
+    return candidate.embedding_hash
+
+
+def load_vector(session, digest: str) -> Optional[np.ndarray]:
+    data = session.execute(select(Embedding.vector).where(Embedding.content_hash == digest)).scalar()
+    return from_bytes(data) if data is not None else None
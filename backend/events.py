@@ -0,0 +1,341 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from sqlalchemy import event, inspect
+
+from metrics import registry
+from models import Candidate, Document, DocumentRequest
+
+logger = logging.getLogger(__name__)
+
+events_published = registry.counter(
+    'traqcheck_events_published_total',
+    'Change events published to the in-process event bus, by type',
+    ('type',)
+)
+event_subscribers_dropped = registry.counter(
+    'traqcheck_event_subscribers_overflowed_total',
+    'Event stream subscribers that fell behind and were told to reload',
+    ()
+)
+event_streams_refused = registry.counter(
+    'traqcheck_event_streams_refused_total',
+    'Event streams turned away because the process already serves EVENTS_MAX_STREAMS',
+    ()
+)
+
+CANDIDATE_CREATED = 'candidate.created'
+CANDIDATE_PARSED = 'candidate.parsed'
+CANDIDATE_FAILED = 'candidate.failed'
+CANDIDATE_DELETED = 'candidate.deleted'
+DOCUMENTS_SUBMITTED = 'documents.submitted'
+REQUEST_GENERATED = 'request.generated'
+# Lifecycle change of a candidate's requests: opened, fulfilled, expired or reminded
+REQUEST_UPDATED = 'request.updated'
+# Sent to a subscriber whose position can no longer be replayed: reload everything
+RESET = 'reset'
+
+
+class Event(NamedTuple):
+    id: str
+    type: str
+    data: Dict[str, Any]
+
+
+class TooManySubscribers(Exception):
+    """The process already serves its maximum number of event streams"""
+
+
+class Subscription:
+    def __init__(self, bus: 'EventBus', max_queue: int):
+        self.bus = bus
+        self.queue: "queue.Queue[Event]" = queue.Queue(max_queue)
+        self.overflowed = False
+
+    def get(self, timeout: float) -> Optional[Event]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """In-process pub/sub with a replay buffer.
+
+    Event ids are '<boot id>-<sequence>'. A subscriber that reconnects with
+    the id of the last event it saw gets everything newer from the buffer;
+    if that id is from another process lifetime or already fell out of the
+    buffer it gets a single 'reset' event instead.
+    """
+
+    def __init__(self, buffer_size: int = 1000, max_queue: int = 100, max_subscribers: int = 0):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers  # 0: unlimited
+        self._sequence = itertools.count(1)
+        self._buffer: "deque[Event]" = deque(maxlen=buffer_size)
+        self._subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Event:
+        with self._lock:
+            published = Event(f"{self.boot_id}-{next(self._sequence)}", event_type, data)
+            self._deliver(published)
+        events_published.inc(event_type)
+        return published
+
+    def _deliver(self, published: Event) -> None:
+        """Buffer an event and hand it to every subscriber (caller holds the lock)"""
+        self._buffer.append(published)
+        for subscription in self._subscribers:
+            try:
+                subscription.queue.put_nowait(published)
+            except queue.Full:
+                if not subscription.overflowed:
+                    subscription.overflowed = True
+                    event_subscribers_dropped.inc()
+
+    def start(self) -> None:
+        """Nothing to run in the background for the in-process bus"""
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> "tuple[Subscription, List[Event]]":
+        """Register a subscriber; returns it with the events it missed since `last_event_id`.
+
+        Raises TooManySubscribers when `max_subscribers` streams are already open.
+        """
+        subscription = Subscription(self, self.max_queue)
+        with self._lock:
+            if self.max_subscribers and len(self._subscribers) >= self.max_subscribers:
+                event_streams_refused.inc()
+                raise TooManySubscribers()
+            self._subscribers.append(subscription)
+            backlog = self._replay(last_event_id)
+        return subscription, backlog
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def configure(self, buffer_size: int, max_queue: int, max_subscribers: int = 0) -> None:
+        with self._lock:
+            self._buffer = deque(self._buffer, maxlen=buffer_size)
+            self.max_queue = max_queue
+            self.max_subscribers = max_subscribers
+
+    def reset_event(self) -> Event:
+        with self._lock:
+            return self._reset()
+
+    def _replay(self, last_event_id: Optional[str]) -> List[Event]:
+        if not last_event_id:
+            return []
+        boot_id, _, sequence = last_event_id.partition('-')
+        if boot_id != self.boot_id or not sequence.isdigit():
+            return [self._reset()]
+        sequence = int(sequence)
+        oldest = int(self._buffer[0].id.partition('-')[2]) if self._buffer else None
+        if oldest is not None and sequence < oldest - 1:
+            return [self._reset()]
+        return [e for e in self._buffer if int(e.id.partition('-')[2]) > sequence]
+
+    def _reset(self) -> Event:
+        last = self._buffer[-1].id if self._buffer else f"{self.boot_id}-0"
+        return Event(last, RESET, {})
+
+
+class SharedEventBus(EventBus):
+    """Event log kept in a SharedStore, so a stream served by any worker sees events from all of them.
+
+    publish() appends to an SQLite table; every worker tails the table on a
+    background thread (and right after its own publishes) and fans new rows
+    out to its local subscribers. Ids are '<log id>-<row id>', so a client can
+    resume on any worker, even after a restart.
+    """
+
+    def __init__(self, store, buffer_size: int = 1000, max_queue: int = 100, poll_interval: float = 0.5):
+        super().__init__(buffer_size, max_queue)
+        self.store = store
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self._poll_lock = threading.Lock()
+        self._thread = None
+        with store.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS events '
+                         '(id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, data TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS event_log_meta (log_id TEXT NOT NULL)')
+            row = conn.execute('SELECT log_id FROM event_log_meta').fetchone()
+            if row is None:
+                conn.execute('INSERT INTO event_log_meta (log_id) VALUES (?)', (self.boot_id,))
+            else:
+                self.boot_id = row[0]
+            self._last_seen = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+
+    def configure(self, buffer_size: int, max_queue: int, max_subscribers: int = 0) -> None:
+        super().configure(buffer_size, max_queue, max_subscribers)
+        self.buffer_size = buffer_size
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Event:
+        with self.store.transaction() as conn:
+            row_id = conn.execute('INSERT INTO events (type, data) VALUES (?, ?)',
+                                  (event_type, json.dumps(data))).lastrowid
+            if row_id % 100 == 0:
+                conn.execute('DELETE FROM events WHERE id <= ?', (row_id - self.buffer_size,))
+        events_published.inc(event_type)
+        self.poll()
+        return Event(f"{self.boot_id}-{row_id}", event_type, data)
+
+    def poll(self) -> int:
+        """Deliver rows added since the last poll to local subscribers"""
+        with self._poll_lock:
+            rows = self.store.connection().execute(
+                'SELECT id, type, data FROM events WHERE id > ? ORDER BY id', (self._last_seen,)
+            ).fetchall()
+            if not rows:
+                return 0
+            with self._lock:
+                for row_id, event_type, data in rows:
+                    self._deliver(Event(f"{self.boot_id}-{row_id}", event_type, json.loads(data)))
+                self._last_seen = rows[-1][0]
+            return len(rows)
+
+    def _replay(self, last_event_id: Optional[str]) -> List[Event]:
+        if not last_event_id:
+            return []
+        log_id, _, sequence = last_event_id.partition('-')
+        if log_id != self.boot_id or not sequence.isdigit():
+            return [self._reset()]
+        conn = self.store.connection()
+        oldest = conn.execute('SELECT MIN(id) FROM events').fetchone()[0]
+        if oldest is not None and int(sequence) < oldest - 1:
+            return [self._reset()]
+        # Rows after _last_seen reach the new subscriber through its queue on the next poll
+        rows = conn.execute('SELECT id, type, data FROM events WHERE id > ? AND id <= ? ORDER BY id',
+                            (int(sequence), self._last_seen)).fetchall()
+        return [Event(f"{self.boot_id}-{row_id}", event_type, json.loads(data)) for row_id, event_type, data in rows]
+
+    def _reset(self) -> Event:
+        return Event(f"{self.boot_id}-{self._last_seen}", RESET, {})
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='event-log-tail', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Failed to read the shared event log")
+            time.sleep(self.poll_interval)
+
+
+_bus: EventBus = EventBus()
+
+
+def get_bus() -> EventBus:
+    return _bus
+
+
+def publish(event_type: str, data: Dict[str, Any]) -> Event:
+    return _bus.publish(event_type, data)
+
+
+def _pending(session) -> List[tuple]:
+    return session.info.setdefault('pending_events', [])
+
+
+def publish_after_commit(session, event_type: str, data: Dict[str, Any]) -> None:
+    """Publish an event when the session's transaction commits; for changes the flush hooks do not see (Core UPDATEs)"""
+    _pending(session).append((event_type, data))
+
+
+def _collect_changes(session, flush_context) -> None:
+    """after_flush: turn inserted/updated rows into events, published only if the transaction commits"""
+    pending = _pending(session)
+    submitted: Dict[int, List[int]] = {}
+    for obj in session.new:
+        if isinstance(obj, Candidate):
+            pending.append((CANDIDATE_CREATED, {'candidate_id': obj.id, 'extraction_status': obj.extraction_status}))
+        elif isinstance(obj, Document):
+            submitted.setdefault(obj.candidate_id, []).append(obj.id)
+        elif isinstance(obj, DocumentRequest):
+            pending.append((REQUEST_GENERATED, {
+                'candidate_id': obj.candidate_id, 'request_id': obj.id, 'request_type': obj.request_type
+            }))
+    for obj in session.dirty:
+        if isinstance(obj, Candidate):
+            history = inspect(obj).attrs.extraction_status.history
+            if history.has_changes() and obj.extraction_status in ('completed', 'failed'):
+                event_type = CANDIDATE_PARSED if obj.extraction_status == 'completed' else CANDIDATE_FAILED
+                pending.append((event_type, {'candidate_id': obj.id, 'extraction_status': obj.extraction_status}))
+        elif isinstance(obj, Document) and session.is_modified(obj):
+            # Re-submitted or normalized document
+            submitted.setdefault(obj.candidate_id, []).append(obj.id)
+    for candidate_id, document_ids in submitted.items():
+        pending.append((DOCUMENTS_SUBMITTED, {'candidate_id': candidate_id, 'document_ids': document_ids}))
+
+
+def _publish_pending(session) -> None:
+    for event_type, data in session.info.pop('pending_events', []):
+        publish(event_type, data)
+
+
+def _discard_pending_on_rollback(session, previous_transaction) -> None:
+    session.info.pop('pending_events', None)
+
+
+def init_app(app, db, store=None) -> None:
+    """Publish change events from db.session commits; with a SharedStore the log is shared by all workers"""
+    global _bus
+    if store is None and isinstance(_bus, SharedEventBus):
+        _bus = EventBus()
+    elif store is not None and not (isinstance(_bus, SharedEventBus) and _bus.store.path == store.path):
+        _bus = SharedEventBus(store, poll_interval=app.config['EVENTS_POLL_SECONDS'])
+    _bus.configure(app.config['EVENTS_BUFFER_SIZE'], app.config['EVENTS_SUBSCRIBER_QUEUE'],
+                   app.config['EVENTS_MAX_STREAMS'])
+    app.extensions['event_bus'] = _bus
+    for name, listener in (('after_flush', _collect_changes), ('after_commit', _publish_pending),
+                           ('after_soft_rollback', _discard_pending_on_rollback)):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+
+
+def format_event(published: Event, dumps) -> str:
+    return f"id: {published.id}\nevent: {published.type}\ndata: {dumps(published.data)}\n\n"
+
+
+def stream(subscription: Subscription, backlog: List[Event], dumps, keepalive: float = 15.0,
+           max_seconds: float = 300.0, retry_ms: int = 3000) -> Iterator[str]:
+    """Server-sent events for one subscriber.
+
+    Ends after `max_seconds` so long-lived connections do not pin a worker
+    thread forever; EventSource reconnects with Last-Event-ID and resumes.
+    """
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield f"retry: {retry_ms}\n\n"
+        for published in backlog:
+            yield format_event(published, dumps)
+        while time.monotonic() < deadline:
+            if subscription.overflowed:
+                yield format_event(subscription.bus.reset_event(), dumps)
+                return
+            published = subscription.get(timeout=min(keepalive, max(0.0, deadline - time.monotonic())))
+            if published is None:
+                yield ": keepalive\n\n"
+            else:
+                yield format_event(published, dumps)
+    finally:
+        subscription.close()
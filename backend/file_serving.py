@@ -0,0 +1,121 @@
+import glob
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from PIL import Image, ImageOps
+
+THUMBNAIL_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp'}
+
+_etag_cache = OrderedDict()
+_etag_lock = threading.Lock()
+_ETAG_CACHE_SIZE = 1024
+
+
+def content_etag(file_path: str) -> str:
+    """Strong ETag from the file contents, memoized on (path, mtime, size)"""
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    with _etag_lock:
+        etag = _etag_cache.get(key)
+        if etag is not None:
+            _etag_cache.move_to_end(key)
+            return etag
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+
+    with _etag_lock:
+        _etag_cache[key] = etag
+        while len(_etag_cache) > _ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    return etag
+
+
+def resolve_path(directory: str, filename: str) -> str:
+    file_path = safe_join(directory, filename)
+    if file_path is None or not os.path.isfile(file_path):
+        raise NotFound()
+    return file_path
+
+
+def send_document(directory: str, filename: str, max_age: int = 0,
+                  sendfile_mode: str = '', accel_prefix: str = '/protected-documents/') -> Response:
+    """Serve a stored document with Range support and caching headers.
+
+    Stored documents are never rewritten in place (every upload gets a new
+    timestamped name), so they are served as immutable. With `sendfile_mode`
+    set to 'x-accel' the body is left to nginx via X-Accel-Redirect; for
+    'x-sendfile' Flask's USE_X_SENDFILE handling is used.
+    """
+    file_path = resolve_path(directory, filename)
+    etag = content_etag(file_path)
+
+    if sendfile_mode == 'x-accel':
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = Response(status=200, mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename.lstrip('/')
+        response.set_etag(etag)
+        response.last_modified = int(os.path.getmtime(file_path))
+    else:
+        response = send_file(file_path, etag=etag, conditional=True, max_age=max_age or None)
+
+    if max_age:
+        # Identity documents must never sit in shared caches
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+
+    if sendfile_mode == 'x-accel':
+        response = response.make_conditional(request)
+    return response
+
+
+def thumbnail_path(cache_dir: str, filename: str, size: int) -> str:
+    return os.path.join(cache_dir, f"{filename}.{size}.jpg")
+
+
+def get_thumbnail(source_path: str, cache_dir: str, filename: str, size: int, quality: int = 80) -> str:
+    """Return the path of a cached JPEG thumbnail, generating it on first use"""
+    target = thumbnail_path(cache_dir, filename, size)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source_path):
+        return target
+
+    with Image.open(source_path) as img:
+        # draft() lets the JPEG decoder downscale while decoding
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # Write to a temp file first so concurrent readers never see a partial thumbnail
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, format='JPEG', quality=quality, optimize=True)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return target
+
+
+def remove_thumbnails(cache_dir: str, filename: str) -> None:
+    for path in glob.glob(os.path.join(glob.escape(cache_dir), glob.escape(filename) + '.*.jpg')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,227 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import or_
+
+from file_serving import remove_thumbnails
+from metrics import registry
+from models import db, FileOperation
+
+logger = logging.getLogger(__name__)
+
+file_operations = registry.counter(
+    'traqcheck_file_operations_total',
+    'Outbox file operations applied, by operation and outcome',
+    ('op', 'outcome')
+)
+
+PROMOTE, UNLINK, UNLINK_THUMBNAILS = 'promote', 'unlink', 'unlink_thumbnails'
+
+
+class PendingOperation(NamedTuple):
+    """Detached copy of a FileOperation row, safe to use after commit even if another worker removed the row"""
+    id: int
+    op: str
+    path: str
+    target: Optional[str] = None
+
+
+def queue_operation(session, op: str, path: str, target: Optional[str] = None) -> PendingOperation:
+    """Record a file operation in the session's transaction"""
+    operation = FileOperation(op=op, path=path, target=target)
+    session.add(operation)
+    session.flush()
+    return PendingOperation(operation.id, op, path, target)
+
+
+def apply_operation(operation: PendingOperation, thumbnails_dir: Optional[str] = None) -> None:
+    """Perform one file operation; every operation is idempotent so replays are safe"""
+    if operation.op == PROMOTE:
+        if os.path.exists(operation.path):
+            os.replace(operation.path, operation.target)
+        elif not os.path.exists(operation.target):
+            raise FileNotFoundError(f"Staged file {operation.path} is missing")
+    elif operation.op == UNLINK:
+        try:
+            os.remove(operation.path)
+        except FileNotFoundError:
+            pass
+    elif operation.op == UNLINK_THUMBNAILS:
+        if thumbnails_dir:
+            remove_thumbnails(thumbnails_dir, operation.path)
+    else:
+        raise ValueError(f"Unknown file operation: {operation.op}")
+
+
+def process_operations(session, operations: Iterable[PendingOperation], thumbnails_dir: Optional[str] = None) -> int:
+    """Apply operations and delete their rows; failures stay queued with the error recorded"""
+    done = []
+    for operation in operations:
+        try:
+            apply_operation(operation, thumbnails_dir)
+        except Exception as e:
+            session.query(FileOperation).filter(FileOperation.id == operation.id).update(
+                {'attempts': FileOperation.attempts + 1, 'last_error': str(e)}, synchronize_session=False
+            )
+            file_operations.inc(operation.op, 'error')
+            logger.warning("File operation %s %s failed: %s", operation.op, operation.path, e)
+            continue
+        file_operations.inc(operation.op, 'applied')
+        done.append(operation.id)
+    if done:
+        # Bulk delete: another worker may already have applied and removed the same row
+        session.query(FileOperation).filter(FileOperation.id.in_(done)).delete(synchronize_session=False)
+    session.commit()
+    return len(done)
+
+
+def process_pending(session, thumbnails_dir: Optional[str] = None, batch_size: int = 500,
+                    max_attempts: int = 10, promote_grace: float = 60) -> int:
+    """Drain the outbox in id order, one batch per transaction.
+    
+    Promotes younger than `promote_grace` seconds are left to the request
+    that queued them, which applies them right after its commit.
+    """
+    total, last_id = 0, 0
+    promote_cutoff = datetime.utcnow() - timedelta(seconds=promote_grace)
+    while True:
+        batch = session.query(FileOperation) \
+            .filter(FileOperation.id > last_id, FileOperation.attempts < max_attempts) \
+            .filter(or_(FileOperation.op != PROMOTE, FileOperation.created_at < promote_cutoff)) \
+            .order_by(FileOperation.id).limit(batch_size).all()
+        if not batch:
+            return total
+        last_id = batch[-1].id
+        pending = [PendingOperation(row.id, row.op, row.path, row.target) for row in batch]
+        total += process_operations(session, pending, thumbnails_dir)
+
+
+class FileStore:
+    """Write-ahead staging for uploaded files.
+
+    Uploads are written to a staging directory first. Moving them into place
+    ('promote') and removing replaced or deleted files ('unlink') are recorded
+    as FileOperation rows in the same transaction as the rows that reference
+    them, and applied after the commit: promotes right away, unlinks on a
+    background thread. A crash at any point leaves either an unreferenced
+    staged file (swept by age) or an outbox row that is replayed, never an
+    orphan or a dangling path in the upload folders.
+    """
+
+    def __init__(self, app, staging_dir: str, poll_interval: float = 30.0,
+                 staging_max_age: float = 24 * 3600, batch_size: int = 500):
+        self.app = app
+        self.staging_dir = staging_dir
+        self.poll_interval = poll_interval
+        self.staging_max_age = staging_max_age
+        self.batch_size = batch_size
+        os.makedirs(staging_dir, exist_ok=True)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Process the outbox on a background thread (without it removals run inline)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='file-outbox', daemon=True)
+            self._thread.start()
+
+    @property
+    def thumbnails_dir(self) -> str:
+        return self.app.config['THUMBNAILS_FOLDER']
+
+    def staging_path(self, suffix: str = '') -> str:
+        return os.path.join(self.staging_dir, uuid.uuid4().hex + suffix)
+
+    def stage(self, file_storage, suffix: str = '') -> str:
+        """Save an uploaded file into the staging directory and return its path"""
+        path = self.staging_path(suffix)
+        file_storage.save(path)
+        return path
+
+    def discard(self, staged_path: str) -> None:
+        """Drop a staged file that will not be committed"""
+        try:
+            os.remove(staged_path)
+        except FileNotFoundError:
+            pass
+
+    def promote(self, staged_path: str, final_path: str) -> PendingOperation:
+        """Queue moving a staged file to its final path once the session commits"""
+        return queue_operation(db.session, PROMOTE, staged_path, final_path)
+
+    def unlink(self, path: Optional[str]) -> Optional[PendingOperation]:
+        """Queue removing a file once the session commits"""
+        return queue_operation(db.session, UNLINK, path) if path else None
+
+    def unlink_thumbnails(self, filename: Optional[str]) -> Optional[PendingOperation]:
+        return queue_operation(db.session, UNLINK_THUMBNAILS, filename) if filename else None
+
+    def apply(self, operations: List[Optional[PendingOperation]]) -> None:
+        """Call after commit: promote staged files now, leave removals to the background worker"""
+        operations = [op for op in operations if op is not None]
+        promotes = [op for op in operations if op.op == PROMOTE]
+        if promotes:
+            process_operations(db.session, promotes, self.thumbnails_dir)
+        if len(promotes) < len(operations):
+            if self._thread is None:
+                # No background thread (serverless): finish the removals inline
+                process_operations(db.session, [op for op in operations if op.op != PROMOTE], self.thumbnails_dir)
+            else:
+                self._wake.set()
+
+    def notify(self) -> None:
+        """New outbox rows were committed by a set-based statement; process them soon"""
+        if self._thread is None:
+            self.drain()
+        else:
+            self._wake.set()
+
+    def drain(self) -> int:
+        with self.app.app_context():
+            try:
+                return process_pending(db.session, self.thumbnails_dir, self.batch_size)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to process file outbox")
+                return 0
+
+    def sweep_staging(self) -> int:
+        """Remove staged files abandoned before their transaction committed"""
+        cutoff = time.time() - self.staging_max_age
+        removed = 0
+        with self.app.app_context():
+            with os.scandir(self.staging_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.stat().st_mtime > cutoff:
+                            continue
+                        if FileOperation.query.filter_by(op=PROMOTE, path=entry.path).first() is not None:
+                            continue
+                        os.remove(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        continue
+        return removed
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self) -> None:
+        last_sweep = 0.0
+        while not self._stop.is_set():
+            self.drain()
+            if time.monotonic() - last_sweep > self.poll_interval * 10:
+                try:
+                    self.sweep_staging()
+                except Exception:
+                    logger.exception("Failed to sweep staging directory")
+                last_sweep = time.monotonic()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
@@ -0,0 +1,67 @@
+"""
+Gunicorn profile for TraqCheck
+
+    cd backend && gunicorn -c gunicorn.conf.py wsgi:app
+
+Requests spend most of their time waiting on the LLM, so each worker runs a
+pool of threads (gthread) and the worker count follows the CPU count for the
+CPU-bound parts (PDF/DOCX parsing, image normalization, serialization).
+The app is preloaded in the master so parsers, agents and imported libraries
+are shared copy-on-write; per-process threads and DB connections are set up
+again in each worker after the fork. Caches and the change-event log live in
+a SQLite file shared by all workers (SHARED_STATE=sqlite).
+
+Each /api/events stream holds a thread for up to EVENTS_MAX_STREAM_SECONDS,
+and every open dashboard or profile tab keeps one. Each worker therefore gets
+EVENTS_MAX_STREAMS threads for streams on top of GUNICORN_THREADS for API
+requests. The app turns away streams beyond that limit (the browser retries
+after EVENTS_BUSY_RETRY_SECONDS, often reaching another worker), so API and
+LLM requests never queue behind open tabs. Raise EVENTS_MAX_STREAMS with
+the expected number of open tabs divided by the worker count.
+
+benchmarks/profile_check.py starts this profile and checks both guarantees:
+streams beyond the limit do not delay API requests, and an invalidation in
+one worker is seen by the cache of every other.
+
+Every setting can be overridden from the environment; see benchmarks/load_test.py
+for throughput across layouts.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or f"0.0.0.0:{os.environ.get('PORT') or 5000}"
+workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count())
+# Read by config.py: stream threads come on top of the API threads
+event_streams = int(os.environ.setdefault('EVENTS_MAX_STREAMS', '16'))
+threads = int(os.environ.get('GUNICORN_THREADS') or 8) + event_streams
+worker_class = 'gthread'
+# Above LLM_DEADLINE plus parsing, so slow upstream calls fail in the app rather than by worker kill
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 120)
+graceful_timeout = 30
+keepalive = 5
+preload_app = (os.environ.get('GUNICORN_PRELOAD') or 'true').lower() == 'true'
+# Recycle workers now and then to bound memory growth from parsing libraries
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS') or 1000)
+max_requests_jitter = max_requests // 10
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None  # empty disables
+
+# Read by config.py when the app is imported (in the master, because of preload_app)
+os.environ.setdefault('SHARED_STATE', 'sqlite')
+os.environ['DEFER_BACKGROUND_WORKERS'] = 'true'
+# LLM and delivery quotas are enforced per process: give each worker its share of the org-wide limits
+for name, default in (('LLM_REQUESTS_PER_MINUTE', 500), ('LLM_TOKENS_PER_MINUTE', 200000),
+                      ('DELIVERY_EMAIL_PER_MINUTE', 600), ('DELIVERY_SMS_PER_MINUTE', 120)):
+    total = int(os.environ.setdefault(f'{name}_TOTAL', os.environ.get(name) or str(default)))
+    os.environ[name] = str(max(1, total // workers) if total > 0 else 0)  # 0: unlimited delivery
+
+
+def post_fork(server, worker):
+    from app import start_background_workers
+    from models import db
+
+    app = worker.app.wsgi()
+    with app.app_context():
+        # Pooled connections opened in the master must not be shared with the children
+        db.engine.dispose(close=False)
+    start_background_workers(app)
@@ -0,0 +1,154 @@
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from models import db, Document
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+NORMALIZABLE_EXTENSIONS = {'jpg', 'jpeg', 'png'}
+FORMAT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def normalized_path(source_path: str, output_format: str = 'WEBP') -> str:
+    """Stored files are served as immutable, so the re-encoded image gets a new name"""
+    return os.path.splitext(source_path)[0] + '.min.' + FORMAT_EXTENSIONS[output_format.upper()]
+
+
+def normalize_image(source_path: str, max_dimension: int = 2000, quality: int = 80,
+                    output_format: str = 'WEBP', target_path: Optional[str] = None) -> Tuple[str, int, int]:
+    """Re-encode an identity document image into a compact, EXIF-free file.
+
+    The result is written to `target_path` (default: next to the source, see
+    normalized_path) and the source is left for the caller to remove.
+    Returns (path, original_bytes, stored_bytes); when re-encoding would not
+    shrink the file the source path is returned.
+    """
+    output_format = output_format.upper()
+    target_path = target_path or normalized_path(source_path, output_format)
+    original_size = os.path.getsize(source_path)
+
+    with Image.open(source_path) as img:
+        # draft() lets the JPEG decoder skip full-resolution decoding of large phone photos
+        img.draft('RGB', (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_dimension, max_dimension))
+
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        if output_format == 'WEBP' and has_alpha:
+            img = img.convert('RGBA')
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        directory = os.path.dirname(target_path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            # No exif= argument, so metadata (GPS, device info) is dropped
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, format=output_format, quality=quality, optimize=True)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    stored_size = os.path.getsize(tmp_path)
+    if stored_size >= original_size:
+        os.remove(tmp_path)
+        return source_path, original_size, original_size
+
+    os.replace(tmp_path, target_path)
+    return target_path, original_size, stored_size
+
+
+class ImageNormalizer:
+    """Runs normalize_image for submitted documents off the request thread"""
+
+    def __init__(self, app, file_store, max_workers: int = 2,
+                 on_update: Optional[Callable[[Document, str], None]] = None):
+        self.app = app
+        self.file_store = file_store
+        self.on_update = on_update
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-normalizer') \
+            if max_workers > 0 else None
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def submit(self, document_id: int):
+        if self.executor is None:
+            # Serverless/no-pool mode: process inline
+            self.process(document_id)
+            return None
+        return self.executor.submit(self.process, document_id)
+
+    def process(self, document_id: int) -> None:
+        with self.app.app_context():
+            try:
+                document = db.session.get(Document, document_id)
+                if document is None or not document.file_path or not os.path.exists(document.file_path):
+                    return
+
+                ext = document.filename.rsplit('.', 1)[-1].lower()
+                if ext not in NORMALIZABLE_EXTENSIONS:
+                    return
+
+                output_format = self.app.config['IMAGE_OUTPUT_FORMAT']
+                final_path = normalized_path(document.file_path, output_format)
+                staged_path = self.file_store.staging_path(os.path.splitext(final_path)[1])
+                with timed('image.normalize'):
+                    new_path, original_size, stored_size = normalize_image(
+                        document.file_path,
+                        max_dimension=self.app.config['IMAGE_MAX_DIMENSION'],
+                        quality=self.app.config['IMAGE_QUALITY'],
+                        output_format=output_format,
+                        target_path=staged_path
+                    )
+
+                if new_path != document.file_path:
+                    old_filename, old_path = document.filename, document.file_path
+                    document.file_path = final_path
+                    document.filename = os.path.basename(final_path)
+                    # Swap files through the outbox so a crash never leaves the row pointing at a missing file
+                    operations = [
+                        self.file_store.promote(staged_path, final_path),
+                        self.file_store.unlink(old_path),
+                        self.file_store.unlink_thumbnails(old_filename)
+                    ]
+                    try:
+                        db.session.commit()
+                    except Exception:
+                        self.file_store.discard(staged_path)
+                        raise
+                    self.file_store.apply(operations)
+                    if self.on_update:
+                        self.on_update(document, old_filename)
+
+                with self._lock:
+                    self.processed += 1
+                    self.bytes_in += original_size
+                    self.bytes_out += stored_size
+
+                logger.info("Normalized document %s: %d -> %d bytes (saved %d)",
+                            document_id, original_size, stored_size, original_size - stored_size)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to normalize document %s", document_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
@@ -0,0 +1,283 @@
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+
+from config import Config
+from local_extractor import extract_fields
+from metrics import registry
+from resilience import TokenBucket, CircuitBreaker, CircuitOpenError, RateLimitTimeout, backoff_delay
+from usage import usage_callback
+
+logger = logging.getLogger(__name__)
+
+RESUME_MARKER = "Resume text:"
+BATCH_DOCUMENT_RE = re.compile(r'^=== DOCUMENT (\S+) ===$', re.MULTILINE)
+
+
+class OfflineChatModel(BaseChatModel):
+    """Deterministic, network-free stand-in for the OpenAI chat models.
+
+    Resume prompts are answered with the local regex extractor and document
+    request prompts with a templated message, so the whole API can be run in
+    tests and benchmarks without an API key.
+    """
+
+    model_name: str = "offline"
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = str(messages[-1].content) if messages else ""
+        if Config.LLM_OFFLINE_LATENCY_MS:
+            time.sleep(Config.LLM_OFFLINE_LATENCY_MS / 1000)
+        content = self._respond(prompt)
+        # Rough token estimate (~4 characters per token) so usage accounting has realistic numbers
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        usage = {
+            'input_tokens': prompt_chars // 4,
+            'output_tokens': len(content) // 4,
+            'total_tokens': (prompt_chars + len(content)) // 4
+        }
+        message = AIMessage(content=content, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={'model_name': self.model_name})
+
+    def _respond(self, prompt: str) -> str:
+        parts = BATCH_DOCUMENT_RE.split(prompt)
+        if len(parts) > 1:
+            # parts = [preamble, id1, text1, id2, text2, ...]
+            results = []
+            for doc_id, text in zip(parts[1::2], parts[2::2]):
+                results.append({"document_id": doc_id, **extract_fields(text)})
+            return json.dumps({"results": results})
+        
+        if RESUME_MARKER in prompt:
+            resume_text = prompt.split(RESUME_MARKER, 1)[1]
+            return json.dumps(extract_fields(resume_text))
+
+        name_match = re.search(r'Name:\s*(.+)', prompt)
+        name = name_match.group(1).strip() if name_match else "Candidate"
+        if "SMS" in prompt:
+            return f"Hi {name}, please upload your PAN and Aadhaar via the TraqCheck portal for verification. Thanks!"
+        return (
+            "SUBJECT: Document request for background verification\n\n"
+            f"BODY:\nDear {name},\n\n"
+            "As part of your background verification, please share your PAN and Aadhaar "
+            "using the secure upload link you will receive shortly.\n\n"
+            "Regards,\nTraqCheck Verification Team"
+        )
+
+
+class LLMUnavailableError(Exception):
+    """The LLM could not answer in time (deadline, rate limit or open circuit)"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+llm_retries = registry.counter(
+    'traqcheck_llm_retries_total',
+    'LLM call retries after a retryable upstream error',
+    ('model',)
+)
+llm_fallbacks = registry.counter(
+    'traqcheck_llm_fallbacks_total',
+    'LLM calls answered by the local fallback instead of the upstream model',
+    ('model', 'reason')
+)
+
+
+def is_retryable(error: Exception) -> bool:
+    """429s, 5xx, timeouts and connection errors are worth retrying"""
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def estimate_tokens(value: Any) -> int:
+    if hasattr(value, 'to_messages'):
+        text = ''.join(str(m.content) for m in value.to_messages())
+    else:
+        text = str(value)
+    return len(text) // 4
+
+
+class ResilientChatModel(Runnable):
+    """Wraps a chat model with deadlines, retries, rate limiting and a circuit breaker.
+
+    Drop-in for `prompt | llm`. The rate limiters and breaker are shared by
+    every wrapper in the process, so ResumeParser and DocumentRequestAgent
+    draw from the same requests-per-minute and tokens-per-minute budget.
+    When the breaker is open (or the deadline is exhausted) the optional
+    `fallback` model answers instead; without one LLMUnavailableError is raised.
+    `with_timeout(seconds)` returns the model with a shorter request timeout,
+    so the last attempt cannot run past the deadline.
+    """
+
+    def __init__(self, model: BaseChatModel, model_name: str, request_limiter: TokenBucket,
+                 token_limiter: TokenBucket, breaker: CircuitBreaker, fallback: Optional[BaseChatModel] = None,
+                 deadline: float = 60.0, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, completion_allowance: int = 500, timeout: Optional[float] = None,
+                 with_timeout: Optional[Callable[[float], Runnable]] = None):
+        self.model = model
+        self.timeout = timeout
+        self.with_timeout = with_timeout
+        self.model_name = model_name
+        self.request_limiter = request_limiter
+        self.token_limiter = token_limiter
+        self.breaker = breaker
+        self.fallback = fallback
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.completion_allowance = completion_allowance
+
+    def invoke(self, input: Any, config: Optional[dict] = None, **kwargs: Any) -> Any:
+        try:
+            return self._invoke_upstream(input, config, **kwargs)
+        except LLMUnavailableError as e:
+            if self.fallback is None:
+                raise
+            logger.warning("LLM %s unavailable (%s); using local fallback", self.model_name, e)
+            llm_fallbacks.inc(self.model_name, type(e.__cause__ or e).__name__)
+            return self.fallback.invoke(input, config=config, **kwargs)
+
+    def _invoke_upstream(self, input: Any, config: Optional[dict], **kwargs: Any) -> Any:
+        if not self.breaker.allow():
+            raise LLMUnavailableError(
+                f"LLM circuit is open for {self.model_name}", retry_after=self.breaker.retry_after()
+            ) from CircuitOpenError()
+
+        # Every exit records an outcome or releases the trial: a half-open breaker whose trial
+        # call never reports back would reject every later call until the process restarts
+        recorded = False
+        try:
+            deadline = time.monotonic() + self.deadline
+            estimated = estimate_tokens(input) + self.completion_allowance
+            attempt = 0
+            while True:
+                try:
+                    self.request_limiter.acquire(1, timeout=deadline - time.monotonic())
+                    self.token_limiter.acquire(estimated, timeout=deadline - time.monotonic())
+                except RateLimitTimeout as e:
+                    # Our own quota, not an upstream fault: don't trip the breaker
+                    raise LLMUnavailableError(str(e), retry_after=1.0) from e
+
+                try:
+                    result = self._model(deadline - time.monotonic()).invoke(input, config=config, **kwargs)
+                except Exception as e:
+                    retryable = is_retryable(e)
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                    if not retryable or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                        if retryable:
+                            self.breaker.record_failure()
+                            recorded = True
+                            raise LLMUnavailableError(
+                                f"LLM {self.model_name} failed after {attempt + 1} attempt(s): {e}",
+                                retry_after=delay
+                            ) from e
+                        raise
+                    llm_retries.inc(self.model_name)
+                    logger.info("Retrying %s in %.2fs after %s", self.model_name, delay, e)
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+
+                self.breaker.record_success()
+                recorded = True
+                message = result.get('raw') if isinstance(result, dict) else result
+                usage = getattr(message, 'usage_metadata', None)
+                if usage and usage.get('total_tokens'):
+                    self.token_limiter.adjust(estimated - usage['total_tokens'])
+                return result
+        finally:
+            if not recorded:
+                self.breaker.release()
+
+    def _model(self, remaining: float) -> Runnable:
+        """The model, with its request timeout cut to what is left of the deadline"""
+        if self.with_timeout is None or self.timeout is None or remaining >= self.timeout:
+            return self.model
+        return self.with_timeout(max(remaining, 0.1))
+
+
+_shared_lock = threading.Lock()
+_shared = {}
+
+
+def _shared_limits():
+    """Process-wide rate limiters and breaker for the upstream provider"""
+    with _shared_lock:
+        if not _shared:
+            _shared['requests'] = TokenBucket(Config.LLM_REQUESTS_PER_MINUTE)
+            _shared['tokens'] = TokenBucket(Config.LLM_TOKENS_PER_MINUTE)
+            _shared['breaker'] = CircuitBreaker(
+                failure_threshold=Config.LLM_BREAKER_THRESHOLD,
+                reset_timeout=Config.LLM_BREAKER_RESET_SECONDS
+            )
+        return _shared['requests'], _shared['tokens'], _shared['breaker']
+
+
+def build_chat_model(model: str, temperature: float, schema: Optional[type] = None) -> Runnable:
+    """Chat model for the configured LLM_PROVIDER ('openai' or 'offline'), wrapped for resilience.
+    
+    With a pydantic `schema` the OpenAI model answers through function calling
+    and returns {'raw', 'parsed', 'parsing_error'}; the offline model and the
+    local fallback always return a plain message.
+    """
+    with_timeout = None
+    if Config.LLM_PROVIDER == 'offline':
+        base = OfflineChatModel(model_name=model, callbacks=[usage_callback])
+        fallback = None
+    else:
+        chat = ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            openai_api_key=Config.OPENAI_API_KEY,
+            timeout=Config.LLM_TIMEOUT,
+            max_retries=0,  # retries are handled by ResilientChatModel
+            callbacks=[usage_callback]
+        )
+
+        def with_timeout(timeout: Optional[float], chat=chat) -> Runnable:
+            if timeout is not None:
+                # Per-request timeout; the copy shares the client and its connection pool
+                chat = chat.model_copy(update={'model_kwargs': {**chat.model_kwargs, 'timeout': timeout}})
+            if schema is not None:
+                return chat.with_structured_output(schema, method='function_calling', include_raw=True)
+            return chat
+
+        base = with_timeout(None)
+        fallback = OfflineChatModel(model_name='local-fallback', callbacks=[usage_callback]) \
+            if Config.LLM_FALLBACK_TO_LOCAL else None
+
+    request_limiter, token_limiter, breaker = _shared_limits()
+    return ResilientChatModel(
+        base,
+        model,
+        request_limiter=request_limiter,
+        token_limiter=token_limiter,
+        breaker=breaker,
+        fallback=fallback,
+        deadline=Config.LLM_DEADLINE,
+        max_retries=Config.LLM_MAX_RETRIES,
+        backoff_base=Config.LLM_BACKOFF_BASE,
+        backoff_max=Config.LLM_BACKOFF_MAX,
+        timeout=Config.LLM_TIMEOUT,
+        with_timeout=with_timeout
+    )
@@ -0,0 +1,78 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from sections import SKILL_SECTIONS, select
+
+EMAIL_RE = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+PHONE_RE = re.compile(r'(?:\+?\d{1,3}[\s.-]?)?(?:\(?\d{2,5}\)?[\s.-]?)?\d{3,5}[\s.-]?\d{4,5}')
+DESIGNATION_AT_COMPANY_RE = re.compile(
+    r'^\s*(?P<designation>[A-Z][A-Za-z /&-]{2,60}?)\s+(?:at|@)\s+(?P<company>[A-Z][\w&.\']*(?:\s+[A-Z][\w&.\']*){0,4})',
+    re.MULTILINE
+)
+
+KNOWN_SKILLS = [
+    'Python', 'Java', 'JavaScript', 'TypeScript', 'C++', 'C#', 'Go', 'Rust', 'Ruby', 'PHP', 'Kotlin', 'Swift',
+    'SQL', 'PostgreSQL', 'MySQL', 'MongoDB', 'Redis', 'React', 'Angular', 'Vue', 'Node.js', 'Django', 'Flask',
+    'FastAPI', 'Spring', 'AWS', 'Azure', 'GCP', 'Docker', 'Kubernetes', 'Terraform', 'Git', 'Linux',
+    'Machine Learning', 'Deep Learning', 'TensorFlow', 'PyTorch', 'Pandas', 'NumPy', 'Spark', 'Kafka',
+    'HTML', 'CSS', 'REST', 'GraphQL', 'Agile', 'Scrum', 'Leadership', 'Communication', 'Excel'
+]
+_SKILL_PATTERNS = [(skill, re.compile(r'(?<![\w+#])' + re.escape(skill) + r'(?![\w+#])', re.IGNORECASE))
+                   for skill in KNOWN_SKILLS]
+
+FIELDS = ('name', 'email', 'phone', 'company', 'designation', 'skills')
+
+
+def _guess_name(lines: List[str]) -> Optional[str]:
+    # The name is almost always one of the first non-empty lines: 2-4 capitalised words, no digits/symbols
+    for line in lines[:5]:
+        words = line.split()
+        if 2 <= len(words) <= 4 and all(w[:1].isupper() and w.replace('.', '').replace('-', '').isalpha() for w in words):
+            return line
+    return None
+
+
+def extract_fields(text: str, sections: Optional[Dict[str, List[List[int]]]] = None) -> Dict[str, Any]:
+    """Cheap regex/heuristic extraction in the same shape as the LLM parser output.
+
+    Used as the offline stand-in for the LLM and as a fast path that can fill
+    obvious fields (email, phone) without a model call. With the resume's
+    `sections`, skills are only looked for in the summary, experience and
+    skills sections.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+
+    email_match = EMAIL_RE.search(text)
+    phone_match = None
+    for match in PHONE_RE.finditer(text):
+        if sum(ch.isdigit() for ch in match.group()) >= 10:
+            phone_match = match
+            break
+    role_match = DESIGNATION_AT_COMPANY_RE.search(text)
+    name = _guess_name(lines)
+    skill_text = select(text, sections, SKILL_SECTIONS)
+    skills = [skill for skill, pattern in _SKILL_PATTERNS if pattern.search(skill_text)]
+
+    data = {
+        "name": name,
+        "email": email_match.group() if email_match else None,
+        "phone": phone_match.group().strip() if phone_match else None,
+        "company": role_match.group('company').strip() if role_match else None,
+        "designation": role_match.group('designation').strip() if role_match else None,
+        "skills": skills
+    }
+    confidence_scores = {
+        "name": 0.6 if name else 0.0,
+        "email": 0.95 if data['email'] else 0.0,
+        "phone": 0.85 if data['phone'] else 0.0,
+        "company": 0.5 if data['company'] else 0.0,
+        "designation": 0.5 if data['designation'] else 0.0,
+        "skills": 0.5 if skills else 0.0
+    }
+    return {"data": data, "confidence_scores": confidence_scores}
+
+
+def filled_fields(result: Dict[str, Any]) -> int:
+    """Number of fields the extraction filled in"""
+    data = result.get('data', {})
+    return sum(1 for field in FIELDS if data.get(field))
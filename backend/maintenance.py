@@ -0,0 +1,307 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from flask import Config as Settings, current_app, has_app_context
+from sqlalchemy import and_, func
+
+from config import Config
+from deletion import delete_candidates, invalidate_cached
+from delivery import build_limiters, build_transports, drain_channel, queue_stats
+from embeddings import build_embedder
+from file_store import process_pending
+from metrics import registry, timed
+from models import Candidate, Document, FileOperation
+from request_lifecycle import expire_requests, reminders_due
+from similarity import backfill_embeddings, rebuild_index, unindexed_count
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process run lock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+maintenance_deleted = registry.counter(
+    'traqcheck_maintenance_deleted_total',
+    'Files and rows removed by maintenance tasks',
+    ('task', 'kind')
+)
+
+THUMBNAIL_NAME_RE = re.compile(r'^(?P<source>.+)\.\d+\.jpg$')
+SAMPLE_SIZE = 20
+
+
+def iter_files(directory: str, min_age: float = 0) -> Iterator[os.DirEntry]:
+    """Stream regular files in a directory without listing it into memory.
+
+    Files modified less than `min_age` seconds ago are skipped: uploads are
+    written to disk before their database row is committed.
+    """
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - min_age
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime <= cutoff:
+                    yield entry
+            except FileNotFoundError:
+                continue
+
+
+def chunked(iterable, size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _new_report(task: str, dry_run: bool) -> Dict[str, Any]:
+    return {
+        'task': task,
+        'dry_run': dry_run,
+        'scanned': 0,
+        'matched': 0,
+        'deleted': 0,
+        'bytes': 0,
+        'errors': 0,
+        'sample': []
+    }
+
+
+def find_orphans(session, directory: str, column, key: Callable[[str], Optional[str]] = lambda name: name,
+                 chunk_size: int = 1000, min_age: float = 0, report: Optional[Dict[str, Any]] = None
+                 ) -> Iterator[os.DirEntry]:
+    """Yield files in `directory` whose name (mapped through `key`) is not in `column`.
+
+    Directory entries are checked against the database one chunk at a time
+    with an indexed IN query, so memory stays constant however many files
+    there are.
+    """
+    for entries in chunked(iter_files(directory, min_age), chunk_size):
+        keys = {entry.name: key(entry.name) for entry in entries}
+        wanted = {k for k in keys.values() if k}
+        known = {row[0] for row in session.query(column).filter(column.in_(wanted))} if wanted else set()
+        for entry in entries:
+            if report is not None:
+                report['scanned'] += 1
+            if keys[entry.name] not in known:
+                yield entry
+
+
+def _thumbnail_source(name: str) -> Optional[str]:
+    match = THUMBNAIL_NAME_RE.match(name)
+    return match.group('source') if match else None
+
+
+def cleanup_orphaned_files(session, dry_run: bool = True, batch_size: int = 500,
+                           min_age: Optional[float] = None) -> Dict[str, Any]:
+    """Remove uploaded resumes, documents and thumbnails that no row references"""
+    min_age = Config.MAINTENANCE_MIN_FILE_AGE if min_age is None else min_age
+    report = _new_report('orphaned_files', dry_run)
+    targets = (
+        (Config.RESUMES_FOLDER, Candidate.resume_filename, lambda name: name),
+        (Config.DOCUMENTS_FOLDER, Document.filename, lambda name: name),
+        (Config.THUMBNAILS_FOLDER, Document.filename, _thumbnail_source),
+    )
+    with timed('maintenance.orphaned_files'):
+        for directory, column, key in targets:
+            orphans = find_orphans(session, directory, column, key, chunk_size=batch_size,
+                                   min_age=min_age, report=report)
+            for batch in chunked(orphans, batch_size):
+                for entry in batch:
+                    report['matched'] += 1
+                    if len(report['sample']) < SAMPLE_SIZE:
+                        report['sample'].append(entry.path)
+                    if dry_run:
+                        report['bytes'] += entry.stat().st_size
+                        continue
+                    try:
+                        size = entry.stat().st_size
+                        os.remove(entry.path)
+                        report['deleted'] += 1
+                        report['bytes'] += size
+                    except OSError as e:
+                        report['errors'] += 1
+                        logger.warning("Could not delete %s: %s", entry.path, e)
+    maintenance_deleted.inc('orphaned_files', 'file', amount=report['deleted'])
+    return report
+
+
+def cleanup_failed_extractions(session, dry_run: bool = True, batch_size: int = 500,
+                               older_than_days: Optional[float] = None) -> Dict[str, Any]:
+    """Delete candidates whose extraction failed, with their files, in id-ordered batches"""
+    older_than_days = Config.MAINTENANCE_FAILED_MIN_AGE_DAYS if older_than_days is None else older_than_days
+    report = _new_report('failed_extractions', dry_run)
+    condition = Candidate.extraction_status == 'failed'
+    if older_than_days:
+        condition = and_(condition, Candidate.created_at < datetime.utcnow() - timedelta(days=older_than_days))
+
+    sample = session.query(Candidate.id, Candidate.resume_filename, Candidate.created_at) \
+        .filter(condition).order_by(Candidate.id).limit(SAMPLE_SIZE).all()
+    report['sample'] = [f"{row.id}: {row.resume_filename} ({row.created_at})" for row in sample]
+
+    with timed('maintenance.failed_extractions'):
+        # File removals queued by this run get ids above the current maximum
+        queued_after = session.query(func.max(FileOperation.id)).scalar() or 0
+        result = delete_candidates(session, condition, batch_size=batch_size, dry_run=dry_run, collect_ids=False)
+        report['scanned'] = report['matched'] = result['matched']
+        report['deleted'] = result['deleted']
+        if result['deleted']:
+            # The CLI has no outbox worker: remove the queued files now
+            process_pending(session, Config.THUMBNAILS_FOLDER, batch_size)
+            report['errors'] = session.query(FileOperation) \
+                .filter(FileOperation.id > queued_after, FileOperation.attempts > 0).count()
+    maintenance_deleted.inc('failed_extractions', 'candidate', amount=report['deleted'])
+    return report
+
+
+def refresh_embeddings(session, dry_run: bool = True, batch_size: int = 500, rebuild: bool = False) -> Dict[str, Any]:
+    """Embed candidates that have no vector for the current model, then rebuild the similarity index if stale"""
+    report = _new_report('embeddings', dry_run)
+    embedder = build_embedder()
+    with timed('maintenance.embeddings'):
+        backfill = backfill_embeddings(session, embedder, batch_size=batch_size, dry_run=dry_run)
+        report['scanned'] = report['matched'] = backfill['scanned']
+        report['embedded'] = backfill['embedded']
+        report['unindexed'] = unindexed_count(session, Config.EMBEDDING_INDEX_FOLDER, embedder.name)
+        report['indexed'] = 0
+        if not dry_run and (rebuild or report['embedded'] or report['unindexed']):
+            manifest = rebuild_index(session, Config.EMBEDDING_INDEX_FOLDER, embedder.name, embedder.dim)
+            report['indexed'] = manifest['count'] if manifest else 0
+    return report
+
+
+def process_document_requests(session, dry_run: bool = True, batch_size: int = 500,
+                              expiry_days: Optional[float] = None) -> Dict[str, Any]:
+    """Expire document requests left open past REQUEST_EXPIRY_DAYS and count those due a reminder"""
+    report = _new_report('document_requests', dry_run)
+    with timed('maintenance.document_requests'):
+        result = expire_requests(session, expiry_days=expiry_days, batch_size=batch_size, dry_run=dry_run)
+        report['scanned'] = report['matched'] = result['matched']
+        report['expired'] = result['expired']
+        report['reminders_due'] = reminders_due(session)
+    # Cached candidate payloads list the requests
+    invalidate_cached(result['candidate_ids'])
+    return report
+
+
+def deliver_messages(session, dry_run: bool = True, batch_size: int = 500) -> Dict[str, Any]:
+    """Send due outbound messages: the delivery outbox for deployments without the worker thread (cron, serverless)"""
+    report = _new_report('deliveries', dry_run)
+    if has_app_context():
+        settings = current_app.config
+    else:
+        settings = Settings('')
+        settings.from_object(Config)
+    with timed('maintenance.deliveries'):
+        queue = queue_stats(session)
+        report['scanned'] = report['matched'] = sum(counts.get('pending', 0) for counts in queue.values())
+        report['sent'] = report['retried'] = report['failed'] = 0
+        if not dry_run:
+            limiters = build_limiters(settings)
+            for channel, transport in build_transports(settings).items():
+                result = drain_channel(session, channel, transport, limiters[channel], batch_size,
+                                       settings['DELIVERY_MAX_ATTEMPTS'], settings['DELIVERY_RETRY_BASE_SECONDS'],
+                                       settings['DELIVERY_RETRY_MAX_SECONDS'], settings['DELIVERY_LEASE_SECONDS'])
+                for key in ('sent', 'retried', 'failed'):
+                    report[key] += result[key]
+            report['errors'] = report['failed']
+    return report
+
+
+TASKS = {
+    'orphaned-files': cleanup_orphaned_files,
+    'failed-extractions': cleanup_failed_extractions,
+    'embeddings': refresh_embeddings,
+    'document-requests': process_document_requests,
+    'deliveries': deliver_messages,
+}
+
+
+class RunLock:
+    """Non-blocking cross-process lock so only one worker runs maintenance at a time"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'w')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def run_tasks(session, names, dry_run: bool, batch_size: int) -> List[Dict[str, Any]]:
+    lock = RunLock(os.path.join(Config.UPLOAD_FOLDER, '.maintenance.lock'))
+    if not lock.acquire():
+        logger.info("Maintenance already running elsewhere; skipping")
+        return []
+    try:
+        reports = []
+        for name in names:
+            report = TASKS[name](session, dry_run=dry_run, batch_size=batch_size)
+            logger.info("Maintenance %s: %s", name, {k: v for k, v in report.items() if k != 'sample'})
+            reports.append(report)
+        return reports
+    finally:
+        lock.release()
+
+
+class MaintenanceScheduler:
+    """Runs maintenance tasks every `interval` seconds on a daemon thread inside the app"""
+
+    def __init__(self, app, session_factory, interval: float, tasks=tuple(TASKS),
+                 dry_run: bool = False, batch_size: int = 500):
+        self.app = app
+        self.session_factory = session_factory
+        self.interval = interval
+        self.tasks = tasks
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='maintenance-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_once(self) -> List[Dict[str, Any]]:
+        with self.app.app_context():
+            session = self.session_factory()
+            try:
+                return run_tasks(session, self.tasks, self.dry_run, self.batch_size)
+            except Exception:
+                session.rollback()
+                logger.exception("Maintenance run failed")
+                return []
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once()
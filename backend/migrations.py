@@ -0,0 +1,400 @@
+"""
+Versioned schema migrations.
+
+Each migration has a version, a description and an upgrade function run
+against a connection. Applied versions are recorded in `schema_migrations`.
+The baseline creates any missing tables from the current models, so later
+migrations must be idempotent (IF NOT EXISTS, inspector checks): on a fresh
+database the baseline has usually created their objects already.
+
+Migrations marked non-transactional run in autocommit mode so PostgreSQL can
+build indexes CONCURRENTLY without blocking writes. On PostgreSQL an upgrade
+holds an advisory lock, so workers that start together apply them once.
+
+    python db_manager.py migrate [--status] [--target VERSION]
+"""
+import json
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, bindparam, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from sqlalchemy.dialects.postgresql import JSONB
+
+from config import Config
+from models import db, AWAITING_DOCUMENTS_WHERE, CONFIDENCE_FIELDS, CandidateSkill, Embedding, OutboundMessage, skill_keys
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key held while migrating; any constant shared by every process
+MIGRATION_LOCK_KEY = 0x7472_6163
+
+version_table = Table(
+    'schema_migrations', MetaData(),
+    Column('version', String(50), primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime, default=datetime.utcnow),
+)
+
+
+class Migration(NamedTuple):
+    version: str
+    description: str
+    upgrade: Callable
+    transactional: bool = True
+
+
+def _is_postgres(conn) -> bool:
+    return conn.dialect.name == 'postgresql'
+
+
+def create_index(conn, name: str, table: str, columns: str, where: Optional[str] = None,
+                 unique: bool = False) -> None:
+    """CREATE INDEX IF NOT EXISTS, CONCURRENTLY on PostgreSQL (connection must be in autocommit)"""
+    concurrently = ''
+    if _is_postgres(conn):
+        concurrently = 'CONCURRENTLY '
+        # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would skip
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).first()
+        if invalid:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+    sql = f'CREATE {"UNIQUE " if unique else ""}INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})'
+    if where:
+        sql += f' WHERE {where}'
+    conn.execute(text(sql))
+
+
+def _baseline(conn) -> None:
+    db.metadata.create_all(conn, checkfirst=True)
+
+
+def _lookup_indexes(conn) -> None:
+    # Names match the models' index=True columns, so databases built by create_all are left as they are
+    create_index(conn, 'ix_documents_candidate_id', 'documents', 'candidate_id')
+    create_index(conn, 'ix_document_requests_candidate_id', 'document_requests', 'candidate_id')
+    create_index(conn, 'ix_documents_filename', 'documents', 'filename')
+    create_index(conn, 'ix_file_operations_path', 'file_operations', 'path')
+
+
+def _dashboard_indexes(conn) -> None:
+    # Newest-first dashboard listing and keyset pages
+    create_index(conn, 'ix_candidates_created_at_id', 'candidates', 'created_at, id')
+    # Status counts and status-filtered listings (also serves plain extraction_status lookups)
+    create_index(conn, 'ix_candidates_status_created_at', 'candidates', 'extraction_status, created_at, id')
+    # Small partial indexes for the work queues: pending extractions and failed-extraction cleanup
+    create_index(conn, 'ix_candidates_pending', 'candidates', 'created_at, id', "extraction_status = 'pending'")
+    create_index(conn, 'ix_candidates_failed', 'candidates', 'created_at, id', "extraction_status = 'failed'")
+
+
+def _cascade_foreign_keys(conn) -> None:
+    """Add ON DELETE CASCADE to the candidate foreign keys (PostgreSQL).
+
+    The new constraint is added NOT VALID and validated separately, so only a
+    brief lock is taken. SQLite would need a table rebuild; deletes there
+    remove child rows explicitly, so its constraints are left alone.
+    """
+    if not _is_postgres(conn):
+        return
+    inspector = inspect(conn)
+    for table in ('documents', 'document_requests'):
+        for fk in inspector.get_foreign_keys(table):
+            if fk['referred_table'] != 'candidates' or (fk.get('options') or {}).get('ondelete') == 'CASCADE':
+                continue
+            name = fk['name']
+            conn.execute(text(
+                f'ALTER TABLE {table} DROP CONSTRAINT {name}, '
+                f'ADD CONSTRAINT {name} FOREIGN KEY (candidate_id) REFERENCES candidates (id) '
+                f'ON DELETE CASCADE NOT VALID'
+            ))
+            conn.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}'))
+
+
+JSON_COLUMNS = ('skills', 'confidence_scores')
+
+
+def _normalize_json(value):
+    """Canonical JSON text for a legacy TEXT value; blank or unparseable values become NULL"""
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        # Already decoded by a native JSON column
+        return json.dumps(value)
+    if not value.strip():
+        return None
+    try:
+        return json.dumps(json.loads(value))
+    except ValueError:
+        logger.warning("Dropping unparseable JSON value %.80r", value)
+        return None
+
+
+@contextmanager
+def _transaction(bind):
+    """A transaction per use on an Engine; an existing Connection is used as is"""
+    if isinstance(bind, Engine):
+        with bind.begin() as conn:
+            yield conn
+    else:
+        yield bind
+
+
+def backfill_json(bind, suffix: str = '', where: str = '', params=None, batch_size: int = 1000) -> int:
+    """Rewrite skills/confidence_scores as canonical JSON into `<column><suffix>`, in id-ordered batches.
+    
+    Given an Engine every batch commits on its own, so writers are never
+    blocked for long; given a Connection the caller owns the transaction.
+    Returns the number of rows written.
+    """
+    postgres = bind.dialect.name == 'postgresql'
+    targets = ', '.join(
+        f"{column}{suffix} = CAST(:{column} AS JSONB)" if postgres else f"{column}{suffix} = :{column}"
+        for column in JSON_COLUMNS
+    )
+    # Read the raw text so the driver's JSON handling does not get in the way
+    source = ', '.join(f'CAST({column} AS TEXT) AS {column}' for column in JSON_COLUMNS)
+    condition = f'AND ({where})' if where else ''
+    written, last_id = 0, 0
+    while True:
+        with _transaction(bind) as conn:
+            rows = conn.execute(text(
+                f'SELECT id, {source} FROM candidates WHERE id > :last_id {condition} ORDER BY id LIMIT :limit'
+            ), {**(params or {}), 'last_id': last_id, 'limit': batch_size}).mappings().all()
+            if not rows:
+                return written
+            last_id = rows[-1]['id']
+            updates = []
+            for row in rows:
+                values = {column: _normalize_json(row[column]) for column in JSON_COLUMNS}
+                if suffix or any(values[column] != row[column] for column in JSON_COLUMNS):
+                    updates.append({'id': row['id'], **values})
+            if updates:
+                conn.execute(text(f'UPDATE candidates SET {targets} WHERE id = :id'), updates)
+                written += len(updates)
+
+
+def _json_columns(conn) -> None:
+    """Move skills and confidence_scores from TEXT to native JSON.
+    
+    SQLite keeps its TEXT storage (the JSON type reads it as is); values are
+    just normalized. PostgreSQL gets new JSONB columns that are backfilled in
+    batches while the table stays writable, then swapped in with a short
+    transaction that also catches up rows written during the backfill.
+    """
+    if not _is_postgres(conn):
+        backfill_json(conn.engine)
+        return
+    types = {column['name']: column['type'] for column in inspect(conn).get_columns('candidates')}
+    if all(isinstance(types[column], JSONB) for column in JSON_COLUMNS):
+        return
+    started = conn.execute(text('SELECT now()')).scalar()
+    for column in JSON_COLUMNS:
+        conn.execute(text(f'ALTER TABLE candidates ADD COLUMN IF NOT EXISTS {column}_jsonb JSONB'))
+    backfill_json(conn.engine, suffix='_jsonb')
+    with conn.engine.begin() as tx:
+        tx.execute(text('LOCK TABLE candidates IN SHARE ROW EXCLUSIVE MODE'))
+        stale = ' OR '.join(f'({column}_jsonb IS NULL AND {column} IS NOT NULL)' for column in JSON_COLUMNS)
+        backfill_json(tx, suffix='_jsonb', where=f'updated_at >= :started OR {stale}', params={'started': started})
+        for column in JSON_COLUMNS:
+            tx.execute(text(f'ALTER TABLE candidates DROP COLUMN {column}'))
+            tx.execute(text(f'ALTER TABLE candidates RENAME COLUMN {column}_jsonb TO {column}'))
+
+
+def _confidence_indexes(conn) -> None:
+    # Must match models.confidence_score() so threshold filters in the list API use them
+    for field in CONFIDENCE_FIELDS:
+        if _is_postgres(conn):
+            expression = f"(CAST((confidence_scores ->> '{field}') AS DOUBLE PRECISION))"
+        else:
+            expression = f"CAST(json_extract(confidence_scores, '$.{field}') AS REAL)"
+        create_index(conn, f'ix_candidates_confidence_{field}', 'candidates', expression)
+
+
+def _resume_sections(conn) -> None:
+    # Nullable columns without defaults: a metadata-only change on both SQLite and PostgreSQL
+    existing = {column['name'] for column in inspect(conn).get_columns('candidates')}
+    json_type = 'JSONB' if _is_postgres(conn) else 'JSON'
+    for column, column_type in (('resume_text', 'TEXT'), ('resume_sections', json_type)):
+        if column not in existing:
+            conn.execute(text(f'ALTER TABLE candidates ADD COLUMN {column} {column_type}'))
+
+
+def _embeddings(conn) -> None:
+    Embedding.__table__.create(conn, checkfirst=True)
+    if 'embedding_hash' not in {column['name'] for column in inspect(conn).get_columns('candidates')}:
+        conn.execute(text('ALTER TABLE candidates ADD COLUMN embedding_hash VARCHAR(64)'))
+    create_index(conn, 'ix_candidates_embedding_hash', 'candidates', 'embedding_hash')
+
+
+def backfill_skills(engine, batch_size: int = 1000) -> int:
+    """Fill candidate_skills from the skills JSON of candidates that have no rows there yet; returns rows written"""
+    written, last_id = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                'SELECT id, CAST(skills AS TEXT) AS skills FROM candidates c WHERE id > :last_id '
+                'AND NOT EXISTS (SELECT 1 FROM candidate_skills s WHERE s.candidate_id = c.id) '
+                'ORDER BY id LIMIT :limit'
+            ), {'last_id': last_id, 'limit': batch_size}).all()
+            if not rows:
+                return written
+            last_id = rows[-1].id
+            values = []
+            for row in rows:
+                skills = json.loads(_normalize_json(row.skills) or '[]')
+                if isinstance(skills, list):
+                    values.extend({'candidate_id': row.id, 'skill': key} for key in skill_keys(skills))
+            if values:
+                conn.execute(CandidateSkill.__table__.insert(), values)
+                written += len(values)
+
+
+def _query_indexes(conn) -> None:
+    # Everything the candidate query language filters and sorts on (see candidate_query.py)
+    CandidateSkill.__table__.create(conn, checkfirst=True)
+    backfill_skills(conn.engine)
+    create_index(conn, 'ix_candidates_company_lower', 'candidates', 'lower(company)')
+    create_index(conn, 'ix_candidates_designation_lower', 'candidates', 'lower(designation)')
+    create_index(conn, 'ix_candidates_updated_at_id', 'candidates', 'updated_at, id')
+    create_index(conn, 'ix_document_requests_status_candidate', 'document_requests', 'status, candidate_id')
+
+
+def _request_lifecycle(conn) -> None:
+    # See request_lifecycle.py. Nullable columns, and a constant default, are metadata-only on both dialects
+    existing = {column['name'] for column in inspect(conn).get_columns('document_requests')}
+    for column in ('opened_at', 'documents_received_at', 'fulfilled_at', 'expired_at', 'last_reminded_at'):
+        if column not in existing:
+            conn.execute(text(f'ALTER TABLE document_requests ADD COLUMN {column} TIMESTAMP'))
+    if 'reminder_count' not in existing:
+        conn.execute(text('ALTER TABLE document_requests ADD COLUMN reminder_count INTEGER NOT NULL DEFAULT 0'))
+    # Requests whose candidate already sent every required document were fulfilled before tracking existed
+    required = list(Config.REQUEST_REQUIRED_DOCUMENTS)
+    conn.execute(text(
+        "UPDATE document_requests SET status = 'fulfilled', fulfilled_at = :now, documents_received_at = :now "
+        "WHERE status IN ('sent', 'opened') AND fulfilled_at IS NULL AND "
+        "(SELECT COUNT(DISTINCT d.document_type) FROM documents d "
+        " WHERE d.candidate_id = document_requests.candidate_id AND d.document_type IN :required) = :count"
+    ).bindparams(bindparam('required', expanding=True)),
+        {'now': datetime.utcnow(), 'required': required, 'count': len(required)})
+    create_index(conn, 'ix_document_requests_status_created_at', 'document_requests', 'status, created_at, id')
+    create_index(conn, 'ix_document_requests_awaiting', 'document_requests', 'created_at, id',
+                 where=AWAITING_DOCUMENTS_WHERE)
+
+
+def _outbound_messages(conn) -> None:
+    OutboundMessage.__table__.create(conn, checkfirst=True)
+    create_index(conn, 'ix_outbound_messages_queue', 'outbound_messages', 'status, channel, next_attempt_at, id')
+
+
+def _llm_usage_key(conn) -> None:
+    # persist_usage read-modify-wrote these rows, so concurrent requests could add duplicates
+    # for a key: fold each duplicate group into its lowest id before the key becomes unique
+    key = 'day, COALESCE(candidate_id, 0), operation, model'
+    with conn.engine.begin() as merge:
+        groups = merge.execute(text(
+            'SELECT MIN(id) AS id, SUM(calls) AS calls, SUM(errors) AS errors, SUM(prompt_tokens) AS prompt_tokens, '
+            'SUM(completion_tokens) AS completion_tokens, SUM(total_latency_ms) AS total_latency_ms, '
+            f'SUM(cost_usd) AS cost_usd FROM llm_usage GROUP BY {key} HAVING COUNT(*) > 1'
+        )).mappings().all()
+        if groups:
+            merge.execute(text(
+                'UPDATE llm_usage SET calls = :calls, errors = :errors, prompt_tokens = :prompt_tokens, '
+                'completion_tokens = :completion_tokens, total_latency_ms = :total_latency_ms, '
+                'cost_usd = :cost_usd WHERE id = :id'
+            ), [dict(group) for group in groups])
+            merge.execute(text(f'DELETE FROM llm_usage WHERE id NOT IN (SELECT MIN(id) FROM llm_usage GROUP BY {key})'))
+    create_index(conn, 'ux_llm_usage_key', 'llm_usage', key, unique=True)
+
+
+def _routing_indexes(conn) -> None:
+    # routing.company_confidence: latest candidates with an exact company, newest first
+    create_index(conn, 'ix_candidates_company_id', 'candidates', 'company, id')
+
+
+MIGRATIONS: List[Migration] = [
+    Migration('0001', 'baseline tables', _baseline),
+    Migration('0002', 'candidate_id and filename lookup indexes', _lookup_indexes, transactional=False),
+    Migration('0003', 'dashboard sort and status work-queue indexes', _dashboard_indexes, transactional=False),
+    Migration('0004', 'ON DELETE CASCADE for candidate foreign keys', _cascade_foreign_keys, transactional=False),
+    Migration('0005', 'native JSON skills and confidence_scores', _json_columns, transactional=False),
+    Migration('0006', 'per-field confidence expression indexes', _confidence_indexes, transactional=False),
+    Migration('0007', 'stored resume text and section offsets', _resume_sections),
+    Migration('0008', 'embedding cache and candidate embedding hashes', _embeddings, transactional=False),
+    Migration('0009', 'candidate skills table and query filter indexes', _query_indexes, transactional=False),
+    Migration('0010', 'document request lifecycle columns and worklist indexes', _request_lifecycle,
+              transactional=False),
+    Migration('0011', 'outbound message outbox', _outbound_messages, transactional=False),
+    Migration('0012', 'unique llm_usage key for upserts', _llm_usage_key, transactional=False),
+    Migration('0013', 'company history index for model routing', _routing_indexes, transactional=False),
+]
+
+
+def applied_versions(engine) -> List[str]:
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(version_table.name):
+            return []
+        return list(conn.execute(select(version_table.c.version).order_by(version_table.c.version)).scalars())
+
+
+def pending_migrations(engine) -> List[Migration]:
+    applied = set(applied_versions(engine))
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+@contextmanager
+def _migration_lock(engine):
+    """Serialize upgrades across processes; elsewhere the version table's primary key catches races"""
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    # Session-level lock on its own autocommit connection, so it spans the non-transactional migrations
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+
+def upgrade(engine, target: Optional[str] = None) -> List[str]:
+    """Apply pending migrations in order, up to and including `target`; returns the versions applied"""
+    with _migration_lock(engine):
+        version_table.create(engine, checkfirst=True)
+        return _apply(engine, target)
+
+
+def _apply(engine, target: Optional[str]) -> List[str]:
+    done = []
+    # Read under the lock: a process that waited sees what the first one applied
+    for migration in pending_migrations(engine):
+        if target is not None and migration.version > target:
+            break
+        logger.info("Applying migration %s: %s", migration.version, migration.description)
+        try:
+            if migration.transactional:
+                with engine.begin() as conn:
+                    migration.upgrade(conn)
+                    _record(conn, migration)
+            else:
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    migration.upgrade(conn)
+                with engine.begin() as conn:
+                    _record(conn, migration)
+        except IntegrityError:
+            # Another worker applied the same migration concurrently; migrations are idempotent
+            logger.info("Migration %s was applied by another process", migration.version)
+            continue
+        done.append(migration.version)
+    return done
+
+
+def _record(conn, migration: Migration) -> None:
+    conn.execute(version_table.insert().values(
+        version=migration.version, description=migration.description, applied_at=datetime.utcnow()
+    ))
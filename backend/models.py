@@ -1,11 +1,43 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-import json
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+import sqlite3
 
 db = SQLAlchemy()
 
+# JSONB on PostgreSQL; JSON text queried with json_extract on SQLite
+JSONType = db.JSON().with_variant(JSONB(), 'postgresql')
+
+CONFIDENCE_FIELDS = ('name', 'email', 'phone', 'company', 'designation', 'skills')
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are switched on per connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 class Candidate(db.Model):
     __tablename__ = 'candidates'
+    # Created by migrations 0003, 0009 and 0013; declared here so create_all builds the same schema
+    __table_args__ = (
+        db.Index('ix_candidates_created_at_id', 'created_at', 'id'),
+        db.Index('ix_candidates_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_candidates_company_id', 'company', 'id'),
+        db.Index('ix_candidates_status_created_at', 'extraction_status', 'created_at', 'id'),
+        db.Index('ix_candidates_pending', 'created_at', 'id',
+                 sqlite_where=db.text("extraction_status = 'pending'"),
+                 postgresql_where=db.text("extraction_status = 'pending'")),
+        db.Index('ix_candidates_failed', 'created_at', 'id',
+                 sqlite_where=db.text("extraction_status = 'failed'"),
+                 postgresql_where=db.text("extraction_status = 'failed'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(200), index=True)
@@ -13,16 +45,25 @@ class Candidate(db.Model):
     phone = db.Column(db.String(50), unique=True, index=True, nullable=True)
     company = db.Column(db.String(200))
     designation = db.Column(db.String(200))
-    skills = db.Column(db.Text)
+    skills = db.Column(JSONType)
     resume_filename = db.Column(db.String(500), unique=True)
     resume_path = db.Column(db.String(500))
     extraction_status = db.Column(db.String(50), default='pending')
-    confidence_scores = db.Column(db.Text)
+    confidence_scores = db.Column(JSONType)
+    # Extracted resume text and its sections ({name: [[start, end], ...]} offsets into it, see sections.py).
+    # Deferred: only loaded by the consumers that slice it
+    resume_text = db.deferred(db.Column(db.Text))
+    resume_sections = db.Column(JSONType)
+    # Content hash of the candidate's embedding in the embeddings table (see embeddings.py)
+    embedding_hash = db.Column(db.String(64), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    documents = db.relationship('Document', backref='candidate', lazy=True, cascade='all, delete-orphan')
-    document_requests = db.relationship('DocumentRequest', backref='candidate', lazy=True, cascade='all, delete-orphan')
+    documents = db.relationship('Document', backref='candidate', lazy=True, cascade='all, delete-orphan',
+                                passive_deletes=True)
+    document_requests = db.relationship('DocumentRequest', backref='candidate', lazy=True, cascade='all, delete-orphan',
+                                        passive_deletes=True)
+    skill_index = db.relationship('CandidateSkill', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def to_dict(self):
         return {
@@ -32,23 +73,47 @@ class Candidate(db.Model):
             'phone': self.phone,
             'company': self.company,
             'designation': self.designation,
-            'skills': json.loads(self.skills) if self.skills else [],
+            'skills': self.skills or [],
             'resume_filename': self.resume_filename,
             'extraction_status': self.extraction_status,
-            'confidence_scores': json.loads(self.confidence_scores) if self.confidence_scores else {},
+            'confidence_scores': self.confidence_scores or {},
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'documents': [doc.to_dict() for doc in self.documents],
             'document_requests': [req.to_dict() for req in self.document_requests]
         }
 
+class confidence_score(FunctionElement):
+    """Numeric confidence of one extracted field, e.g. filter(confidence_score('email') < 0.6).
+    
+    Compiles to the same expression as the indexes built by migration 0006,
+    so threshold filters are index lookups rather than scans.
+    """
+    type = db.Float()
+    name = 'confidence_score'
+    inherit_cache = False
+    
+    def __init__(self, field):
+        if field not in CONFIDENCE_FIELDS:
+            raise ValueError(f"Unknown confidence field: {field}")
+        self.field = field
+        super().__init__(Candidate.confidence_scores)
+
+@compiles(confidence_score)
+def _compile_confidence_score(element, compiler, **kw):
+    return f"CAST(json_extract({compiler.process(element.clauses, **kw)}, '$.{element.field}') AS REAL)"
+
+@compiles(confidence_score, 'postgresql')
+def _compile_confidence_score_postgresql(element, compiler, **kw):
+    return f"CAST(({compiler.process(element.clauses, **kw)} ->> '{element.field}') AS DOUBLE PRECISION)"
+
 class Document(db.Model):
     __tablename__ = 'documents'
     
     id = db.Column(db.Integer, primary_key=True)
-    candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.id'), nullable=False)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.id', ondelete='CASCADE'), nullable=False, index=True)
     document_type = db.Column(db.String(50))
-    filename = db.Column(db.String(500))
+    filename = db.Column(db.String(500), index=True)
     file_path = db.Column(db.String(500))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -61,15 +126,44 @@ class Document(db.Model):
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None
         }
 
+# Document request lifecycle: (queued ->) sent -> opened -> fulfilled, or expired while still open
+# (see request_lifecycle.py). Requests wait in 'queued' until the delivery worker has sent their message.
+REQUEST_QUEUED = 'queued'
+REQUEST_SENT = 'sent'
+REQUEST_OPENED = 'opened'
+REQUEST_FULFILLED = 'fulfilled'
+REQUEST_EXPIRED = 'expired'
+REQUEST_STATUSES = (REQUEST_QUEUED, REQUEST_SENT, REQUEST_OPENED, REQUEST_FULFILLED, REQUEST_EXPIRED)
+OPEN_REQUEST_STATUSES = (REQUEST_QUEUED, REQUEST_SENT, REQUEST_OPENED)
+
+# Open requests with nothing received yet. Written with the lifecycle timestamps rather than the
+# status so SQLite picks this partial index over (status, created_at); queries repeat the predicate
+AWAITING_DOCUMENTS_WHERE = 'documents_received_at IS NULL AND fulfilled_at IS NULL AND expired_at IS NULL'
+
 class DocumentRequest(db.Model):
     __tablename__ = 'document_requests'
+    # Created by migrations 0009 and 0010
+    __table_args__ = (
+        db.Index('ix_document_requests_status_candidate', 'status', 'candidate_id'),
+        db.Index('ix_document_requests_status_created_at', 'status', 'created_at', 'id'),
+        db.Index('ix_document_requests_awaiting', 'created_at', 'id',
+                 sqlite_where=db.text(AWAITING_DOCUMENTS_WHERE),
+                 postgresql_where=db.text(AWAITING_DOCUMENTS_WHERE)),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.id'), nullable=False)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.id', ondelete='CASCADE'), nullable=False, index=True)
     request_message = db.Column(db.Text)
     request_type = db.Column(db.String(50), default='email')
-    status = db.Column(db.String(50), default='sent')
+    status = db.Column(db.String(50), default=REQUEST_SENT)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    opened_at = db.Column(db.DateTime)
+    # First documents after the request, complete or not
+    documents_received_at = db.Column(db.DateTime)
+    fulfilled_at = db.Column(db.DateTime)
+    expired_at = db.Column(db.DateTime)
+    reminder_count = db.Column(db.Integer, default=0, nullable=False)
+    last_reminded_at = db.Column(db.DateTime)
     
     def to_dict(self):
         return {
@@ -78,5 +172,107 @@ class DocumentRequest(db.Model):
             'request_message': self.request_message,
             'request_type': self.request_type,
             'status': self.status,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'opened_at': self.opened_at.isoformat() if self.opened_at else None,
+            'fulfilled_at': self.fulfilled_at.isoformat() if self.fulfilled_at else None,
+            'expired_at': self.expired_at.isoformat() if self.expired_at else None,
+            'reminder_count': self.reminder_count or 0
         }
+
+class CandidateSkill(db.Model):
+    """One normalized skill of a candidate, so skill filters are index lookups instead of JSON scans.
+    
+    Written alongside Candidate.skills (which keeps the original spelling and
+    order); see skill_keys().
+    """
+    __tablename__ = 'candidate_skills'
+    __table_args__ = (
+        db.Index('ix_candidate_skills_skill', 'skill', 'candidate_id'),
+    )
+    
+    candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.id', ondelete='CASCADE'), primary_key=True)
+    skill = db.Column(db.String(100), primary_key=True)
+
+def skill_key(skill) -> str:
+    return ' '.join(str(skill).lower().split())[:100]
+
+def skill_keys(skills):
+    """Distinct normalized keys of a skills list, e.g. ['Python', ' python ', 'SQL'] -> ['python', 'sql']"""
+    return sorted({skill_key(skill) for skill in skills or () if skill_key(skill)})
+
+class LlmUsage(db.Model):
+    """Daily LLM usage aggregates per candidate, operation and model"""
+    __tablename__ = 'llm_usage'
+    # Created by migration 0012; persist_usage upserts against it
+    __table_args__ = (
+        db.Index('ux_llm_usage_key', 'day', db.text('COALESCE(candidate_id, 0)'), 'operation', 'model',
+                 unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    # No foreign key: cost history must outlive deleted candidates
+    candidate_id = db.Column(db.Integer, index=True, nullable=True)
+    operation = db.Column(db.String(100))
+    model = db.Column(db.String(100))
+    calls = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Integer, default=0)
+    prompt_tokens = db.Column(db.Integer, default=0)
+    completion_tokens = db.Column(db.Integer, default=0)
+    total_latency_ms = db.Column(db.Float, default=0.0)
+    cost_usd = db.Column(db.Float, default=0.0)
+
+class FileOperation(db.Model):
+    """Filesystem change recorded in the same transaction as the rows it belongs to.
+    
+    'promote' moves a staged upload into place, 'unlink' removes a file and
+    'unlink_thumbnails' drops the cached previews of a document. Rows are
+    deleted once applied; leftovers after a crash are replayed in the background.
+    """
+    __tablename__ = 'file_operations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(20), nullable=False)
+    path = db.Column(db.String(500), nullable=False, index=True)
+    target = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+
+class Embedding(db.Model):
+    """Embedding vectors cached by content hash (model + embedded text), stored as float32 bytes"""
+    __tablename__ = 'embeddings'
+    
+    content_hash = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(100), nullable=False)
+    dim = db.Column(db.Integer, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class OutboundMessage(db.Model):
+    """Email or SMS waiting for (or done with) delivery, written in the transaction that creates it.
+
+    The delivery worker claims due 'pending' rows per channel, marks them
+    'sending' for a lease, and then 'sent', or back to 'pending' with a
+    later next_attempt_at, or 'failed' once out of attempts (see delivery.py).
+    """
+    __tablename__ = 'outbound_messages'
+    # Created by migration 0011: the per-channel due-message queue
+    __table_args__ = (
+        db.Index('ix_outbound_messages_queue', 'status', 'channel', 'next_attempt_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.id', ondelete='CASCADE'), nullable=False, index=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('document_requests.id', ondelete='CASCADE'), index=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'request' or 'reminder'
+    channel = db.Column(db.String(20), nullable=False)  # 'email' or 'sms'
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(500))
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
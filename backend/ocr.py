@@ -0,0 +1,155 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+import PyPDF2
+from PIL import Image
+
+# OCR is optional: it needs pytesseract plus the tesseract binary. pypdfium2
+# gives proper page rasterization; without it the scanned page images
+# embedded in the PDF are used instead.
+try:
+    import pytesseract
+except ImportError:  # pragma: no cover - depends on the deployment
+    pytesseract = None
+
+try:
+    import pypdfium2
+except ImportError:  # pragma: no cover - depends on the deployment
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+MAX_DPI = 300
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _render_page(file_path: str, page_index: int, dpi: int) -> Optional[Image.Image]:
+    if pypdfium2 is not None:
+        pdf = pypdfium2.PdfDocument(file_path)
+        try:
+            return pdf[page_index].render(scale=dpi / 72).to_pil()
+        finally:
+            pdf.close()
+
+    # Scanned PDFs are usually one full-page image per page
+    page = PyPDF2.PdfReader(file_path).pages[page_index]
+    images = list(page.images)
+    if not images:
+        return None
+    img = Image.open(io.BytesIO(max(images, key=lambda i: len(i.data)).data))
+    # Bound the resolution as if the page had been rendered at `dpi`
+    width_pt = float(page.mediabox.width) or 612
+    max_width = int(width_pt / 72 * dpi)
+    if img.width > max_width:
+        img.thumbnail((max_width, max_width * img.height // img.width))
+    return img
+
+
+def ocr_page(file_path: str, page_index: int, dpi: int, lang: str, timeout: int) -> str:
+    """Rasterize and OCR a single page. Runs inside the worker process."""
+    img = _render_page(file_path, page_index, dpi)
+    if img is None:
+        return ""
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    return pytesseract.image_to_string(img, lang=lang, timeout=timeout)
+
+
+class OcrExtractor:
+    """OCR fallback for PDFs without a text layer.
+
+    Pages are processed in a process pool with a page cap and per-page
+    timeout. Results are cached on disk by file hash so a re-uploaded scan
+    is never OCRed twice.
+    """
+
+    def __init__(self, cache_dir: str, max_workers: int = 2, max_pages: int = 5,
+                 dpi: int = 200, page_timeout: int = 30, lang: str = 'eng'):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_pages = max_pages
+        self.dpi = min(dpi, MAX_DPI)
+        self.page_timeout = page_timeout
+        self.lang = lang
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return pytesseract is not None and self.max_workers > 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so normal text PDFs never pay for worker start-up
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _cache_path(self, file_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{file_hash}.txt")
+
+    def extract_text(self, file_path: str) -> str:
+        if not self.available:
+            return ""
+
+        file_hash = file_sha256(file_path)
+        cache_path = self._cache_path(file_hash)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return f.read()
+
+        page_count = len(PyPDF2.PdfReader(file_path).pages)
+        executor = self._get_executor()
+        futures = [
+            executor.submit(ocr_page, file_path, i, self.dpi, self.lang, self.page_timeout)
+            for i in range(min(page_count, self.max_pages))
+        ]
+
+        pages = []
+        complete = True
+        for i, future in enumerate(futures):
+            try:
+                # Small grace period on top of tesseract's own timeout
+                pages.append(future.result(timeout=self.page_timeout + 5))
+            except (FutureTimeoutError, RuntimeError) as e:
+                # pytesseract raises RuntimeError when its own timeout fires
+                logger.warning("OCR of page %d of %s timed out: %s", i, file_path, e)
+                future.cancel()
+                complete = False
+            except Exception as e:
+                logger.warning("OCR of page %d of %s failed: %s", i, file_path, e)
+                complete = False
+
+        text = "\n".join(p.strip() for p in pages if p and p.strip())
+
+        if not complete:
+            # Possibly transient (timeouts, worker crash): don't cache a partial result
+            return text
+
+        # Empty results are cached too, so unreadable scans fail fast next time
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+
+        return text
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
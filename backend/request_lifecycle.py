@@ -0,0 +1,271 @@
+"""
+Document request lifecycle and worklists.
+
+    queued  -> sent       the delivery worker sent the request message (delivery.py)
+    sent    -> opened     the candidate opened the request, or sent some of the documents
+    open    -> fulfilled  every REQUEST_REQUIRED_DOCUMENTS type is on file
+    open    -> expired    still open REQUEST_EXPIRY_DAYS after it was created
+
+Transitions are UPDATEs guarded by the current status, so a request never
+moves backwards however workers interleave. Worklists are keyset-paged
+index range reads: per status on (status, created_at, id), and for requests
+still waiting on documents on the partial ix_document_requests_awaiting.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, or_, select, tuple_, update
+
+from config import Config
+from delivery import KIND_REMINDER, queue_message, recipient_for
+from events import REQUEST_UPDATED, publish_after_commit
+from models import (Candidate, Document, DocumentRequest, OPEN_REQUEST_STATUSES, REQUEST_EXPIRED,
+                    REQUEST_FULFILLED, REQUEST_OPENED, REQUEST_QUEUED, REQUEST_SENT, REQUEST_STATUSES)
+
+# Oldest first: what needs chasing. Per-status lists are newest first.
+WORKLISTS = ('overdue', 'reminders') + REQUEST_STATUSES
+
+DOCUMENT_NAMES = {'pan': 'PAN', 'aadhaar': 'Aadhaar'}
+
+
+class CursorError(ValueError):
+    """The worklist cursor is malformed or belongs to another worklist"""
+
+
+def _awaiting():
+    # Same predicate as the partial index (models.AWAITING_DOCUMENTS_WHERE), so the planner can match it
+    return and_(DocumentRequest.documents_received_at.is_(None), DocumentRequest.fulfilled_at.is_(None),
+                DocumentRequest.expired_at.is_(None))
+
+
+def _worklist_conditions(name: str, now: datetime):
+    """(conditions, oldest first?) of a worklist"""
+    if name in REQUEST_STATUSES:
+        return [DocumentRequest.status == name], False
+    overdue = DocumentRequest.created_at < now - timedelta(days=Config.REQUEST_OVERDUE_DAYS)
+    if name == 'overdue':
+        return [_awaiting(), overdue], True
+    if name == 'reminders':
+        reminder_due = or_(
+            DocumentRequest.last_reminded_at.is_(None),
+            DocumentRequest.last_reminded_at < now - timedelta(hours=Config.REQUEST_REMINDER_INTERVAL_HOURS)
+        )
+        # Requests whose own message has not gone out yet are not chased. An inequality, not
+        # status IN (sent, opened), so the partial index still drives the query in created_at order
+        return [_awaiting(), overdue, DocumentRequest.status != REQUEST_QUEUED,
+                DocumentRequest.reminder_count < Config.REQUEST_MAX_REMINDERS, reminder_due], True
+    raise ValueError(f"Unknown worklist '{name}': use {', '.join(WORKLISTS)}")
+
+
+def _columns():
+    return select(DocumentRequest.id, DocumentRequest.candidate_id, Candidate.name, Candidate.email,
+                  Candidate.phone, DocumentRequest.request_type, DocumentRequest.status,
+                  DocumentRequest.created_at, DocumentRequest.opened_at, DocumentRequest.documents_received_at,
+                  DocumentRequest.fulfilled_at, DocumentRequest.expired_at, DocumentRequest.reminder_count,
+                  DocumentRequest.last_reminded_at).join(Candidate, Candidate.id == DocumentRequest.candidate_id)
+
+
+def _payload(row) -> Dict[str, Any]:
+    return {
+        'id': row.id,
+        'candidate_id': row.candidate_id,
+        'candidate': {'name': row.name, 'email': row.email, 'phone': row.phone},
+        'request_type': row.request_type,
+        'status': row.status,
+        'created_at': row.created_at,
+        'opened_at': row.opened_at,
+        'documents_received_at': row.documents_received_at,
+        'fulfilled_at': row.fulfilled_at,
+        'expired_at': row.expired_at,
+        'reminder_count': row.reminder_count or 0,
+        'last_reminded_at': row.last_reminded_at
+    }
+
+
+def encode_cursor(name: str, row) -> str:
+    raw = json.dumps([name, row.created_at.isoformat(), row.id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(name: str, cursor: str):
+    try:
+        cursor_name, created_at, last_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        created_at = datetime.fromisoformat(created_at)
+    except (ValueError, TypeError, binascii.Error):
+        raise CursorError("Invalid cursor")
+    if cursor_name != name or not isinstance(last_id, int):
+        raise CursorError("The cursor belongs to a different worklist")
+    return created_at, last_id
+
+
+def worklist_statement(name: str, limit: int, cursor: Optional[str] = None, now: Optional[datetime] = None):
+    """The page query of a worklist: an index range read of at most `limit` rows, however deep the page"""
+    now = now or datetime.utcnow()
+    conditions, ascending = _worklist_conditions(name, now)
+    key = tuple_(DocumentRequest.created_at, DocumentRequest.id)
+    if cursor:
+        after = _decode_cursor(name, cursor)
+        conditions.append(key > after if ascending else key < after)
+    if ascending:
+        order_by = (DocumentRequest.created_at.asc(), DocumentRequest.id.asc())
+    else:
+        order_by = (DocumentRequest.created_at.desc(), DocumentRequest.id.desc())
+    return _columns().where(*conditions).order_by(*order_by).limit(limit)
+
+
+def worklist(session, name: str, limit: int, cursor: Optional[str] = None,
+             now: Optional[datetime] = None) -> Dict[str, Any]:
+    """One page of a worklist, with the cursor of the next page (None on the last)"""
+    rows = session.execute(worklist_statement(name, limit + 1, cursor, now)).all()
+    next_cursor = encode_cursor(name, rows[limit - 1]) if len(rows) > limit else None
+    return {'worklist': name, 'requests': [_payload(row) for row in rows[:limit]], 'next_cursor': next_cursor}
+
+
+def _announce(session, changed, change: str) -> None:
+    by_candidate: Dict[int, List[int]] = {}
+    for request_id, candidate_id in changed:
+        by_candidate.setdefault(candidate_id, []).append(request_id)
+    for candidate_id, request_ids in by_candidate.items():
+        publish_after_commit(session, REQUEST_UPDATED, {
+            'candidate_id': candidate_id, 'request_ids': request_ids, 'change': change
+        })
+
+
+def mark_opened(session, request_id: int, now: Optional[datetime] = None) -> bool:
+    """sent -> opened; False if the request is not in 'sent' (already opened, closed or missing). Caller commits."""
+    changed = session.execute(
+        update(DocumentRequest)
+        .where(DocumentRequest.id == request_id, DocumentRequest.status == REQUEST_SENT)
+        .values(status=REQUEST_OPENED, opened_at=now or datetime.utcnow())
+        .returning(DocumentRequest.id, DocumentRequest.candidate_id)
+    ).all()
+    _announce(session, changed, REQUEST_OPENED)
+    return bool(changed)
+
+
+def documents_received(session, candidate_id: int, now: Optional[datetime] = None) -> Optional[str]:
+    """Advance the candidate's open requests after documents arrive (call before committing the documents).
+
+    Requests become fulfilled once every required document type is on file,
+    and opened otherwise. Returns the new status, or None when nothing was open.
+    """
+    now = now or datetime.utcnow()
+    on_file = set(session.execute(
+        select(Document.document_type).where(Document.candidate_id == candidate_id)
+    ).scalars())
+    complete = set(Config.REQUEST_REQUIRED_DOCUMENTS) <= on_file
+    values = {
+        'status': REQUEST_FULFILLED if complete else REQUEST_OPENED,
+        'opened_at': func.coalesce(DocumentRequest.opened_at, now),
+        'documents_received_at': func.coalesce(DocumentRequest.documents_received_at, now),
+    }
+    if complete:
+        values['fulfilled_at'] = now
+    changed = session.execute(
+        update(DocumentRequest)
+        .where(DocumentRequest.candidate_id == candidate_id, DocumentRequest.status.in_(OPEN_REQUEST_STATUSES))
+        .values(**values)
+        .returning(DocumentRequest.id, DocumentRequest.candidate_id)
+    ).all()
+    if not changed:
+        return None
+    _announce(session, changed, values['status'])
+    return values['status']
+
+
+def expire_requests(session, now: Optional[datetime] = None, expiry_days: Optional[float] = None,
+                    batch_size: int = 500, dry_run: bool = False) -> Dict[str, Any]:
+    """Expire requests still open `expiry_days` after they were sent, a batch per transaction.
+
+    Returns {'matched', 'expired', 'candidate_ids'}.
+    """
+    now = now or datetime.utcnow()
+    expiry_days = Config.REQUEST_EXPIRY_DAYS if expiry_days is None else expiry_days
+    # (status, created_at) index range per open status
+    stale = and_(DocumentRequest.status.in_(OPEN_REQUEST_STATUSES),
+                 DocumentRequest.created_at < now - timedelta(days=expiry_days))
+    report = {'matched': 0, 'expired': 0, 'candidate_ids': set()}
+    if dry_run:
+        report['matched'] = session.execute(select(func.count()).where(stale)).scalar()
+        return report
+    while True:
+        ids = list(session.execute(select(DocumentRequest.id).where(stale).limit(batch_size)).scalars())
+        if not ids:
+            break
+        report['matched'] += len(ids)
+        changed = session.execute(
+            update(DocumentRequest)
+            .where(DocumentRequest.id.in_(ids), stale)
+            .values(status=REQUEST_EXPIRED, expired_at=now)
+            .returning(DocumentRequest.id, DocumentRequest.candidate_id)
+        ).all()
+        _announce(session, changed, REQUEST_EXPIRED)
+        session.commit()
+        report['expired'] += len(changed)
+        report['candidate_ids'].update(candidate_id for _, candidate_id in changed)
+    return report
+
+
+def reminders_due(session, now: Optional[datetime] = None) -> int:
+    conditions, _ = _worklist_conditions('reminders', now or datetime.utcnow())
+    return session.execute(select(func.count()).where(*conditions)).scalar()
+
+
+def reminder_message(name: Optional[str], request_type: Optional[str], reminder_number: int) -> str:
+    documents = ' and '.join(DOCUMENT_NAMES.get(doc, doc.title()) for doc in Config.REQUEST_REQUIRED_DOCUMENTS)
+    if request_type == 'sms':
+        first_name = (name or 'there').split()[0]
+        return (f"Hi {first_name}, a reminder to upload your {documents} on the TraqCheck portal "
+                f"to complete your background verification.")
+    return (
+        f"SUBJECT: Reminder {reminder_number}: {documents} for your background verification\n\n"
+        f"BODY:\nDear {name or 'Candidate'},\n\n"
+        f"We have not yet received your {documents}, which we need to complete the background verification "
+        f"requested by your organization. Please upload them using the secure link from our earlier email.\n\n"
+        f"Regards,\nTraqCheck Verification Team"
+    )
+
+
+def claim_reminders(session, limit: int, now: Optional[datetime] = None,
+                    channels: Iterable[str] = ()) -> List[Dict[str, Any]]:
+    """Claim up to `limit` requests due a reminder, oldest first, and return them with the reminder text.
+
+    Claiming bumps reminder_count and last_reminded_at in a guarded UPDATE
+    (rows are also locked with SKIP LOCKED on PostgreSQL), so concurrent
+    workers never claim the same request twice. Reminders on `channels` are
+    queued for delivery in the same transaction ('queued' in the result). Commits.
+    """
+    now = now or datetime.utcnow()
+    conditions, _ = _worklist_conditions('reminders', now)
+    ids = list(session.execute(
+        select(DocumentRequest.id).where(*conditions)
+        .order_by(DocumentRequest.created_at, DocumentRequest.id).limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars())
+    if not ids:
+        session.rollback()
+        return []
+    changed = session.execute(
+        update(DocumentRequest)
+        .where(DocumentRequest.id.in_(ids), *conditions)
+        .values(reminder_count=DocumentRequest.reminder_count + 1, last_reminded_at=now)
+        .returning(DocumentRequest.id, DocumentRequest.candidate_id)
+    ).all()
+    _announce(session, changed, 'reminded')
+    rows = session.execute(
+        _columns().where(DocumentRequest.id.in_([request_id for request_id, _ in changed]))
+        .order_by(DocumentRequest.created_at, DocumentRequest.id)
+    ).all()
+    reminders = []
+    for row in rows:
+        message = reminder_message(row.name, row.request_type, row.reminder_count)
+        queued = row.request_type in channels and queue_message(
+            session, row.candidate_id, row.request_type, recipient_for(row.request_type, row.email, row.phone),
+            message, KIND_REMINDER, request_id=row.id
+        ) is not None
+        reminders.append({**_payload(row), 'message': message, 'queued': queued})
+    session.commit()
+    return reminders
@@ -1,18 +1,141 @@
 import os
 import PyPDF2
-import docx
 import json
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+import re
+import time
+from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, Field, ValidationError
 from langchain_core.prompts import ChatPromptTemplate
 from config import Config
+from docx_text import extract_docx_text
+from llm import LLMUnavailableError
+from local_extractor import extract_fields
+from ocr import OcrExtractor
+from metrics import timed, timed_function, registry
+from routing import ModelRouter, mean_confidence, route_escalations
+from sections import segment, select
+
+llm_parse_outcomes = registry.counter(
+    'traqcheck_llm_parse_total',
+    'Resume LLM responses by parse outcome (structured, plain, repaired, retried, failed)',
+    ('outcome',)
+)
+resume_prompt_chars = registry.counter(
+    'traqcheck_resume_prompt_chars_total',
+    'Resume characters extracted from files and characters actually sent to the LLM parser',
+    ('stage',)
+)
+
+_FENCE_RE = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+
+
+class ResumeData(BaseModel):
+    name: Optional[str] = Field(None, description="Full name of the candidate")
+    email: Optional[str] = Field(None, description="Email address")
+    phone: Optional[str] = Field(None, description="Phone number")
+    company: Optional[str] = Field(None, description="Current or most recent company")
+    designation: Optional[str] = Field(None, description="Current or most recent job title/designation")
+    skills: List[str] = Field(default_factory=list, description="Technical and soft skills")
+
+
+class ConfidenceScores(BaseModel):
+    name: float = 0.0
+    email: float = 0.0
+    phone: float = 0.0
+    company: float = 0.0
+    designation: float = 0.0
+    skills: float = 0.0
+
+
+class ParsedResume(BaseModel):
+    """Structured resume extraction with a 0.0-1.0 confidence score per field"""
+    data: ResumeData
+    confidence_scores: ConfidenceScores
+
+
+class BatchParsedResume(ParsedResume):
+    document_id: str = Field(description="ID of the document this result belongs to")
+
+
+class BatchParsedResumes(BaseModel):
+    """One extraction per input document, keyed by document_id"""
+    results: List[BatchParsedResume]
+
+
+BATCH_SYSTEM_PROMPT = """You are an expert resume parser. You will receive several resumes, each starting with a line "=== DOCUMENT <id> ===".
+
+For every document extract: name, email, phone, company (current or most recent), designation (current or most recent job title) and skills (array of technical and soft skills), plus a confidence score (0.0 to 1.0) per field.
+
+Return one JSON object:
+{{
+    "results": [
+        {{
+            "document_id": "<id>",
+            "data": {{"name": ..., "email": ..., "phone": ..., "company": ..., "designation": ..., "skills": [...]}},
+            "confidence_scores": {{"name": 0.0-1.0, "email": 0.0-1.0, "phone": 0.0-1.0, "company": 0.0-1.0, "designation": 0.0-1.0, "skills": 0.0-1.0}}
+        }}
+    ]
+}}
+
+Return exactly one result per document. Never mix information between documents. If a field cannot be found, set it to null with a confidence score of 0.0.
+"""
+
+
+def _first_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} block in text, ignoring braces inside strings"""
+    start = text.find('{')
+    while start != -1:
+        depth, in_string, escaped = 0, False, False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        start = text.find('{', start + 1)
+    return None
+
+
+def repair_json(text: str) -> Any:
+    """Tolerant JSON parsing: strips markdown fences, leading/trailing prose and trailing commas"""
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        pass
+    
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    candidate = _first_json_object(text)
+    if candidate is None:
+        raise ValueError("No JSON object found in LLM response")
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA_RE.sub(r'\1', candidate))
 
 class ResumeParser:
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0,
-            openai_api_key=Config.OPENAI_API_KEY
+        self.router = ModelRouter()
+        self.ocr = OcrExtractor(
+            cache_dir=Config.OCR_CACHE_FOLDER,
+            max_workers=Config.OCR_WORKERS,
+            max_pages=Config.OCR_MAX_PAGES,
+            dpi=Config.OCR_DPI,
+            page_timeout=Config.OCR_PAGE_TIMEOUT,
+            lang=Config.OCR_LANG
         )
         
     def extract_text_from_pdf(self, file_path: str) -> str:
@@ -30,50 +153,39 @@ class ResumeParser:
                     page_text = page.extract_text()
                     if page_text:
                         text += page_text + "\n"
-                
-                # Check if any text was extracted
-                if not text.strip():
-                    raise ValueError("PDF file contains no extractable text (might be image-based)")
                     
         except PyPDF2.errors.PdfReadError as e:
             raise ValueError(f"Invalid or corrupted PDF file: {str(e)}")
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
         
+        # No text layer: fall back to OCR (only scanned PDFs pay for it)
+        if not text.strip():
+            with timed('resume.ocr'):
+                text = self.ocr.extract_text(file_path)
+        
+        # Check if any text was extracted
+        if not text.strip():
+            raise ValueError("PDF file contains no extractable text (might be image-based)")
+        
         return text.strip()
     
     def extract_text_from_docx(self, file_path: str) -> str:
-        """Extract text from DOCX file"""
-        text = ""
+        """Extract text from DOCX file, streamed in document order up to DOCX_MAX_CHARS"""
         try:
-            doc = docx.Document(file_path)
-            
-            # Check if document has content
-            if len(doc.paragraphs) == 0:
-                raise ValueError("DOCX file has no paragraphs")
-            
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text += paragraph.text + "\n"
-            
-            # Also extract text from tables
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            text += cell.text + "\n"
-            
-            # Check if any text was extracted
-            if not text.strip():
-                raise ValueError("DOCX file contains no extractable text")
-                
-        except docx.opc.exceptions.PackageNotFoundError:
-            raise ValueError("Invalid DOCX file format")
+            text = extract_docx_text(file_path, Config.DOCX_MAX_CHARS)
+        except ValueError:
+            raise
         except Exception as e:
             raise Exception(f"Error extracting text from DOCX: {str(e)}")
         
-        return text.strip()
+        # Check if any text was extracted
+        if not text:
+            raise ValueError("DOCX file contains no extractable text")
+        
+        return text
     
+    @timed_function('resume.extract_text')
     def extract_text(self, file_path: str) -> str:
         _, ext = os.path.splitext(file_path)
         ext = ext.lower()
@@ -85,8 +197,52 @@ class ResumeParser:
         else:
             raise ValueError(f"Unsupported file format: {ext}")
     
-    def parse_resume_with_llm(self, text: str) -> Dict[str, Any]:
+    def prompt_text(self, text: str, sections: Optional[Dict[str, List[List[int]]]] = None) -> str:
+        """The part of a resume the LLM reads: the RESUME_PROMPT_SECTIONS slices, or all of it if unsegmented"""
+        if not Config.RESUME_PROMPT_SECTIONS:
+            return text
+        prompt_text = select(text, segment(text) if sections is None else sections, Config.RESUME_PROMPT_SECTIONS)
+        resume_prompt_chars.inc('extracted', amount=len(text))
+        resume_prompt_chars.inc('prompt', amount=len(prompt_text))
+        return prompt_text
+    
+    def parse_resume_with_llm(self, text: str, route: Optional[str] = None,
+                              sections: Optional[Dict[str, List[List[int]]]] = None) -> Dict[str, Any]:
+        """Extract fields from the resume's prompt sections (see sections.segment; computed if not given)"""
+        if sections is None:
+            sections = segment(text)
+        return self._parse_escalating(self.prompt_text(text, sections), route, extract_fields(text, sections))
+    
+    def _parse_escalating(self, text: str, route: Optional[str], local: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract fields with the routed model, escalating once on a failed or low-confidence answer"""
+        if route is None:
+            route = self.router.route_resume(text, local).route
+        escalations_left = 1 if Config.ROUTING_ENABLED else 0
         
+        while True:
+            started = time.perf_counter()
+            try:
+                result = self._parse_with_route(text, route)
+            except ValueError:
+                self.router.record('resume', route, started, 'invalid')
+                next_route = self.router.escalate(route) if escalations_left else None
+                if next_route is None:
+                    raise
+            except Exception as e:
+                self.router.record('resume', route, started,
+                                   'unavailable' if isinstance(e, LLMUnavailableError) else 'error')
+                raise
+            else:
+                self.router.record('resume', route, started, result=result, local=local)
+                next_route = self.router.escalate(route) if escalations_left else None
+                if next_route is None or mean_confidence(result) >= Config.ROUTING_ESCALATE_BELOW_CONFIDENCE:
+                    return result
+            
+            route_escalations.inc('resume', route, next_route)
+            route = next_route
+            escalations_left -= 1
+    
+    def _parse_with_route(self, text: str, route: str) -> Dict[str, Any]:
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are an expert resume parser. Extract the following information from the resume text and return it as a JSON object.
             
@@ -126,58 +282,203 @@ If a field cannot be found, set it to null and give it a confidence score of 0.0
         ])
         
         try:
-            chain = prompt | self.llm
-            response = chain.invoke({"resume_text": text})
+            chain = prompt | self.router.model(route, schema=ParsedResume)
+            with timed('llm.resume_parse'):
+                response = chain.invoke({"resume_text": text})
             
-            # Parse JSON response
+            # Repair locally first; only pay for another LLM call if that fails
             try:
-                result = json.loads(response.content)
-            except json.JSONDecodeError as e:
-                raise ValueError(f"LLM returned invalid JSON: {str(e)}")
-            
-            # Validate structure
-            if not isinstance(result, dict):
-                raise ValueError("LLM response is not a JSON object")
+                result, outcome = self._parse_response(response, ParsedResume)
+            except ValueError:
+                with timed('llm.resume_parse'):
+                    response = chain.invoke({"resume_text": text})
+                try:
+                    result, _ = self._parse_response(response, ParsedResume)
+                    outcome = 'retried'
+                except ValueError as e:
+                    llm_parse_outcomes.inc('failed')
+                    raise ValueError(f"LLM returned invalid JSON: {str(e)}")
+            llm_parse_outcomes.inc(outcome)
             
-            if 'data' not in result:
-                raise ValueError("LLM response missing 'data' field")
+            return self._validate_result(result)
             
-            data = result.get('data', {})
-            
-            # Ensure at least one identifying field is present
-            has_name = data.get('name') and str(data.get('name')).strip() and str(data.get('name')).lower() != 'null'
-            has_email = data.get('email') and str(data.get('email')).strip() and str(data.get('email')).lower() != 'null'
-            has_phone = data.get('phone') and str(data.get('phone')).strip() and str(data.get('phone')).lower() != 'null'
-            
-            if not (has_name or has_email or has_phone):
-                raise ValueError("Could not extract any identifying information (name, email, or phone) from resume. The resume may be corrupted, image-based, or have invalid content.")
-            
-            # Ensure confidence_scores exists
-            if 'confidence_scores' not in result:
-                result['confidence_scores'] = {
-                    "name": 0.5,
-                    "email": 0.5,
-                    "phone": 0.5,
-                    "company": 0.5,
-                    "designation": 0.5,
-                    "skills": 0.5
-                }
-            
-            # Ensure skills is a list
-            if not isinstance(data.get('skills'), list):
-                data['skills'] = []
-            
-            return result
-            
-        except ValueError as e:
-            # Re-raise validation errors
+        except (ValueError, LLMUnavailableError):
+            # Re-raise validation errors and upstream outages
             raise
         except Exception as e:
             # Return default structure for parsing failures
             raise Exception(f"Error parsing resume with LLM: {str(e)}")
     
-    def parse_resume(self, file_path: str) -> Dict[str, Any]:
-        """Main method to parse resume and extract information"""
+    def _validate_result(self, result: Any) -> Dict[str, Any]:
+        """Check an extraction has identifying data and fill in defaults"""
+        # Validate structure
+        if not isinstance(result, dict):
+            raise ValueError("LLM response is not a JSON object")
+        
+        if 'data' not in result:
+            raise ValueError("LLM response missing 'data' field")
+        
+        data = result.get('data', {})
+        
+        # Ensure at least one identifying field is present
+        has_name = data.get('name') and str(data.get('name')).strip() and str(data.get('name')).lower() != 'null'
+        has_email = data.get('email') and str(data.get('email')).strip() and str(data.get('email')).lower() != 'null'
+        has_phone = data.get('phone') and str(data.get('phone')).strip() and str(data.get('phone')).lower() != 'null'
+        
+        if not (has_name or has_email or has_phone):
+            raise ValueError("Could not extract any identifying information (name, email, or phone) from resume. The resume may be corrupted, image-based, or have invalid content.")
+        
+        # Ensure confidence_scores exists
+        if 'confidence_scores' not in result:
+            result['confidence_scores'] = {
+                "name": 0.5,
+                "email": 0.5,
+                "phone": 0.5,
+                "company": 0.5,
+                "designation": 0.5,
+                "skills": 0.5
+            }
+        
+        # Ensure skills is a list
+        if not isinstance(data.get('skills'), list):
+            data['skills'] = []
+        
+        return result
+    
+    def _parse_response(self, response: Any, schema: type):
+        """Turn a structured-output dict or a plain message into a result dict.
+        
+        Returns (result, outcome) where outcome is 'structured' (tool call
+        matching `schema`), 'plain' (content that was valid JSON as is) or
+        'repaired'. Raises ValueError when nothing usable can be recovered.
+        """
+        if isinstance(response, dict):
+            # with_structured_output(include_raw=True): {'raw', 'parsed', 'parsing_error'}
+            if response.get('parsed') is not None:
+                return response['parsed'].model_dump(), 'structured'
+            raw = response.get('raw')
+            tool_calls = getattr(raw, 'tool_calls', None)
+            if tool_calls:
+                # Arguments that failed the schema once are not trusted unchecked
+                try:
+                    return schema.model_validate(tool_calls[0].get('args')).model_dump(), 'structured'
+                except ValidationError as e:
+                    raise ValueError(f"Tool call does not match {schema.__name__}: {e}")
+            content = getattr(raw, 'content', '') or ''
+        else:
+            content = response.content
+        
+        try:
+            return json.loads(content), 'plain'
+        except (json.JSONDecodeError, TypeError):
+            pass
+        try:
+            return repair_json(content), 'repaired'
+        except (json.JSONDecodeError, TypeError) as e:
+            raise ValueError(str(e))
+    
+    def pack_batches(self, texts: Dict[str, str]) -> List[List[str]]:
+        """Greedily group document IDs so each batch stays under the token budget"""
+        budget = Config.LLM_BATCH_TOKEN_BUDGET
+        batches, current, current_tokens = [], [], 0
+        for doc_id, text in texts.items():
+            tokens = len(text) // 4
+            if current and (current_tokens + tokens > budget or len(current) >= Config.LLM_BATCH_MAX_ITEMS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(doc_id)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def parse_resumes_batch(self, texts: Dict[str, str],
+                            sections: Optional[Dict[str, Dict[str, List[List[int]]]]] = None) -> Dict[str, Any]:
+        """Parse many resume texts with as few LLM requests as possible.
+        
+        Only each resume's prompt sections are sent (`sections` maps
+        document_id to its segmentation; missing ones are computed). Resumes
+        are routed individually, then those sharing a route are packed into
+        one request under LLM_BATCH_TOKEN_BUDGET; items missing from or
+        invalid in a batch response are retried alone.
+        Returns {document_id: result dict or the Exception raised for it}.
+        """
+        results: Dict[str, Any] = {}
+        locals_, prompts = {}, {}
+        for doc_id, text in texts.items():
+            doc_sections = (sections or {}).get(doc_id)
+            if doc_sections is None:
+                doc_sections = segment(text)
+            locals_[doc_id] = extract_fields(text, doc_sections)
+            prompts[doc_id] = self.prompt_text(text, doc_sections)
+        texts = prompts
+        by_route: Dict[str, Dict[str, str]] = {}
+        for doc_id, text in texts.items():
+            route = self.router.route_resume(text, locals_[doc_id]).route
+            by_route.setdefault(route, {})[doc_id] = text
+        
+        for route, route_texts in by_route.items():
+            for batch in self.pack_batches(route_texts):
+                retry_alone = batch
+                if len(batch) > 1:
+                    started = time.perf_counter()
+                    try:
+                        batch_results = self._parse_batch_with_llm({doc_id: texts[doc_id] for doc_id in batch}, route)
+                    except LLMUnavailableError as e:
+                        # The upstream is down; single requests would fail the same way
+                        self.router.record('resume_batch', route, started, 'unavailable')
+                        for doc_id in batch:
+                            results[doc_id] = e
+                        continue
+                    except Exception:
+                        batch_results = {}
+                    self.router.record('resume_batch', route, started, 'success' if batch_results else 'invalid')
+                    
+                    retry_alone = []
+                    for doc_id in batch:
+                        try:
+                            results[doc_id] = self._validate_result(batch_results[doc_id])
+                            self.router.record_accuracy('resume_batch', route, results[doc_id], locals_[doc_id])
+                        except (KeyError, ValueError):
+                            retry_alone.append(doc_id)
+                
+                for doc_id in retry_alone:
+                    try:
+                        results[doc_id] = self._parse_escalating(texts[doc_id], route, locals_[doc_id])
+                    except Exception as e:
+                        results[doc_id] = e
+        return results
+    
+    def _parse_batch_with_llm(self, texts: Dict[str, str], route: str) -> Dict[str, Any]:
+        # Short positional IDs keep the prompt small; map them back afterwards
+        local_ids = {str(i + 1): doc_id for i, doc_id in enumerate(texts)}
+        documents = "\n\n".join(
+            f"=== DOCUMENT {local_id} ===\n{texts[doc_id]}" for local_id, doc_id in local_ids.items()
+        )
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", BATCH_SYSTEM_PROMPT),
+            ("user", "Resumes:\n\n{documents}")
+        ])
+        
+        with timed('llm.resume_parse_batch'):
+            response = (prompt | self.router.model(route, schema=BatchParsedResumes)).invoke({"documents": documents})
+        
+        try:
+            parsed, outcome = self._parse_response(response, BatchParsedResumes)
+        except ValueError:
+            llm_parse_outcomes.inc('failed')
+            raise
+        llm_parse_outcomes.inc(outcome)
+        
+        items = parsed.get('results', []) if isinstance(parsed, dict) else []
+        results = {}
+        for item in items:
+            if isinstance(item, dict) and str(item.get('document_id')) in local_ids:
+                results[local_ids[str(item['document_id'])]] = item
+        return results
+    
+    def load_text(self, file_path: str) -> str:
+        """Validate a stored resume file and return its text"""
         # Validate file exists
         if not os.path.exists(file_path):
             raise ValueError(f"Resume file not found: {file_path}")
@@ -194,6 +495,12 @@ If a field cannot be found, set it to null and give it a confidence score of 0.0
         if len(text) < 50:
             raise ValueError("Resume text is too short (less than 50 characters). Please ensure the file contains valid resume content.")
         
+        return text
+    
+    def parse_resume(self, file_path: str) -> Dict[str, Any]:
+        """Main method to parse resume and extract information"""
+        text = self.load_text(file_path)
+        
         # Parse with LLM
         result = self.parse_resume_with_llm(text)
         
@@ -0,0 +1,158 @@
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import Config
+from llm import build_chat_model
+from local_extractor import extract_fields, filled_fields
+from metrics import registry
+from models import db, Candidate
+
+route_decisions = registry.counter(
+    'traqcheck_llm_route_decisions_total',
+    'Routing decisions by task, route and deciding signal',
+    ('task', 'route', 'reason')
+)
+route_duration = registry.histogram(
+    'traqcheck_llm_route_duration_seconds',
+    'End-to-end LLM latency per task and route',
+    ('task', 'route', 'outcome')
+)
+route_confidence = registry.histogram(
+    'traqcheck_llm_route_confidence',
+    'Mean field confidence of resume extractions per route',
+    ('task', 'route'),
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+)
+route_agreement = registry.counter(
+    'traqcheck_llm_route_agreement_total',
+    'Email/phone fields where the model agrees or disagrees with the local extractor',
+    ('task', 'route', 'result')
+)
+route_escalations = registry.counter(
+    'traqcheck_llm_route_escalations_total',
+    'Extractions re-run on the next route after a failed or low-confidence answer',
+    ('task', 'from_route', 'to_route')
+)
+
+
+class RouteDecision(NamedTuple):
+    route: str
+    model: str
+    reason: str
+
+
+def non_latin_ratio(text: str) -> float:
+    """Share of letters outside the Latin script, a cheap proxy for non-English resumes"""
+    letters = [ch for ch in text if ch.isalpha()]
+    if not letters:
+        return 0.0
+    return sum(1 for ch in letters if ord(ch) > 0x24F) / len(letters)
+
+
+def mean_confidence(result: Dict[str, Any]) -> float:
+    scores = [s for s in (result.get('confidence_scores') or {}).values() if isinstance(s, (int, float))]
+    return sum(scores) / len(scores) if scores else 0.0
+
+
+def company_history_statement(company: str, limit: int = 20):
+    """Confidence scores of the latest candidates from a company, read from ix_candidates_company_id"""
+    return select(Candidate.confidence_scores).where(Candidate.company == company) \
+        .order_by(Candidate.id.desc()).limit(limit)
+
+
+def company_confidence(company: str, limit: int = 20) -> Optional[float]:
+    """Mean extraction confidence of the latest candidates from the same company"""
+    try:
+        rows = db.session.execute(company_history_statement(company, limit)).all()
+    except Exception:
+        # No app context (scripts) or no table yet: no history
+        return None
+    values = [mean_confidence({'confidence_scores': scores}) for (scores,) in rows if isinstance(scores, dict)]
+    return sum(values) / len(values) if values else None
+
+
+class ModelRouter:
+    """Picks a model tier ('fast', 'standard', 'strong') per LLM call from cheap signals.
+
+    Resumes are routed on text length, script, how many fields the local
+    extractor already filled and how well past resumes from the same company
+    extracted. Tiers and thresholds live in Config.LLM_ROUTES / ROUTING_*.
+    """
+
+    def __init__(self, company_history: Optional[Callable[[str], Optional[float]]] = company_confidence):
+        self.routes = Config.LLM_ROUTES
+        self.order = tuple(self.routes)
+        self.company_history = company_history
+        self._models: Dict[Tuple, Any] = {}
+
+    def model(self, route: str, temperature: float = 0, schema: Optional[type] = None):
+        key = (route, temperature, schema)
+        if key not in self._models:
+            self._models[key] = build_chat_model(model=self.routes[route], temperature=temperature, schema=schema)
+        return self._models[key]
+
+    def decide(self, task: str, route: str, reason: str) -> RouteDecision:
+        route_decisions.inc(task, route, reason)
+        return RouteDecision(route, self.routes[route], reason)
+
+    def escalate(self, route: str) -> Optional[str]:
+        """Next tier with a different model (tiers may share one), None from the top"""
+        for higher in self.order[self.order.index(route) + 1:]:
+            if self.routes[higher] != self.routes[route]:
+                return higher
+        return None
+
+    def route_resume(self, text: str, local: Optional[Dict[str, Any]] = None) -> RouteDecision:
+        if not Config.ROUTING_ENABLED:
+            return self.decide('resume', Config.ROUTING_DEFAULT_ROUTE, 'disabled')
+        local = local if local is not None else extract_fields(text)
+
+        if non_latin_ratio(text) > Config.ROUTING_MAX_NON_LATIN_RATIO:
+            route, reason = 'strong', 'language'
+        elif len(text) >= Config.ROUTING_STRONG_MIN_CHARS:
+            route, reason = 'strong', 'length'
+        elif len(text) <= Config.ROUTING_FAST_MAX_CHARS and filled_fields(local) >= Config.ROUTING_FAST_MIN_FIELDS:
+            route, reason = 'fast', 'simple'
+        else:
+            route, reason = Config.ROUTING_DEFAULT_ROUTE, 'default'
+
+        company = local.get('data', {}).get('company')
+        # No higher tier with a different model (top tier, or tiers sharing one): nothing to escalate to
+        higher = self.escalate(route) if company and self.company_history else None
+        if higher is not None:
+            history = self.company_history(company)
+            if history is not None and history < Config.ROUTING_COMPANY_MIN_CONFIDENCE:
+                route, reason = higher, 'company_history'
+        return self.decide('resume', route, reason)
+
+    def route_document_request(self, request_type: str) -> RouteDecision:
+        route = Config.ROUTING_DOCUMENT_REQUEST.get(request_type, Config.ROUTING_DEFAULT_ROUTE)
+        return self.decide('document_request', route, request_type)
+
+    def record(self, task: str, route: str, started: float, outcome: str = 'success',
+               result: Optional[Dict[str, Any]] = None, local: Optional[Dict[str, Any]] = None) -> None:
+        """Feed the per-route latency (and, given a result, accuracy) metrics"""
+        route_duration.observe(time.perf_counter() - started, task, route, outcome)
+        if result is not None:
+            self.record_accuracy(task, route, result, local)
+
+    def record_accuracy(self, task: str, route: str, result: Dict[str, Any],
+                        local: Optional[Dict[str, Any]] = None) -> None:
+        route_confidence.observe(mean_confidence(result), task, route)
+        if local is None:
+            return
+        # Email and phone regexes are high precision: use them as a spot check of the model
+        data, local_data = result.get('data', {}), local.get('data', {})
+        for field in ('email', 'phone'):
+            if local_data.get(field) and data.get(field):
+                same = _normalize(field, local_data[field]) == _normalize(field, data[field])
+                route_agreement.inc(task, route, 'agree' if same else 'disagree')
+
+
+def _normalize(field: str, value: Any) -> str:
+    if field == 'phone':
+        # Ignore formatting and country code
+        return ''.join(ch for ch in str(value) if ch.isdigit())[-10:]
+    return str(value).strip().lower()
@@ -0,0 +1,90 @@
+import re
+from typing import Dict, Iterable, List
+
+CONTACT = 'contact'
+SUMMARY = 'summary'
+EXPERIENCE = 'experience'
+EDUCATION = 'education'
+SKILLS = 'skills'
+OTHER = 'other'
+SECTION_NAMES = (CONTACT, SUMMARY, EXPERIENCE, EDUCATION, SKILLS, OTHER)
+
+# Slices each consumer reads; anything not listed (education, other) is left out.
+# The LLM prompt's are configurable: Config.RESUME_PROMPT_SECTIONS
+SKILL_SECTIONS = (SUMMARY, EXPERIENCE, SKILLS)
+SEARCH_SECTIONS = (SUMMARY, EXPERIENCE, SKILLS)
+
+HEADINGS = {
+    CONTACT: ('contact', 'contact details', 'contact information', 'personal details', 'personal information'),
+    SUMMARY: ('summary', 'professional summary', 'profile', 'professional profile', 'objective',
+              'career objective', 'about', 'about me', 'overview', 'career summary'),
+    EXPERIENCE: ('experience', 'work experience', 'professional experience', 'employment',
+                 'employment history', 'work history', 'career history', 'projects', 'key projects',
+                 'internships', 'relevant experience'),
+    EDUCATION: ('education', 'academic background', 'academics', 'qualifications',
+                'educational qualifications', 'certifications', 'certificates', 'courses', 'training'),
+    SKILLS: ('skills', 'technical skills', 'key skills', 'core skills', 'core competencies', 'competencies',
+             'technologies', 'tools', 'tech stack', 'expertise', 'areas of expertise', 'skill set', 'skillset',
+             'languages', 'programming languages'),
+    OTHER: ('awards', 'achievements', 'honors', 'publications', 'interests', 'hobbies',
+            'references', 'volunteering', 'volunteer experience', 'activities', 'declaration'),
+}
+_HEADING_SECTION = {phrase: name for name, phrases in HEADINGS.items() for phrase in phrases}
+
+# "Skills", "WORK EXPERIENCE:", "## Education", "Skills: Python, SQL" (heading with inline content).
+# Only known headings count: an unknown one stays part of the section before it, so nothing is lost.
+_HEADING_RE = re.compile(r'^[\s#*=\-_|•]*(?P<heading>[A-Za-z][A-Za-z &/]{1,40}?)\s*(?::.*|[\s#*=\-_|:]*)$')
+
+
+def _heading_section(line: str):
+    match = _HEADING_RE.match(line)
+    if match is None:
+        return None
+    phrase = ' '.join(match.group('heading').lower().replace('&', 'and').split())
+    return _HEADING_SECTION.get(phrase)
+
+
+def segment(text: str) -> Dict[str, List[List[int]]]:
+    """Split resume text into sections by their headings.
+
+    Returns {section: [[start, end], ...]} character offsets into `text`, in
+    document order; a range starts at its heading line. Text before the
+    first heading is the contact block. A resume without any recognizable
+    heading gives {}: consumers then use the whole text.
+    """
+    boundaries = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped and len(stripped) <= 120:
+            name = _heading_section(stripped)
+            if name is not None:
+                boundaries.append((offset, name))
+        offset += len(line)
+    if not boundaries:
+        return {}
+
+    if boundaries[0][0] > 0:
+        boundaries.insert(0, (0, CONTACT))
+    sections: Dict[str, List[List[int]]] = {}
+    for index, (start, name) in enumerate(boundaries):
+        end = boundaries[index + 1][0] if index + 1 < len(boundaries) else len(text)
+        ranges = sections.setdefault(name, [])
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end  # consecutive headings of the same kind form one range
+        else:
+            ranges.append([start, end])
+    return sections
+
+
+def section_text(text: str, sections: Dict[str, List[List[int]]], names: Iterable[str]) -> str:
+    """The slices of `text` for the named sections, in document order"""
+    ranges = sorted(r for name in names for r in (sections or {}).get(name, ()))
+    return '\n'.join(text[start:end].strip() for start, end in ranges).strip()
+
+
+def select(text: str, sections: Dict[str, List[List[int]]], names: Iterable[str]) -> str:
+    """section_text(), or the whole text when the resume is unsegmented or none of the sections exist"""
+    if not sections:
+        return text
+    return section_text(text, sections, names) or text
@@ -0,0 +1,201 @@
+import json
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+from sqlalchemy import Text, cast, func, select
+
+from models import Candidate, Document, DocumentRequest
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+
+def _iso_default(obj: Any) -> Any:
+    # Datetimes are ISO 8601 with either provider, matching the to_dict() output
+    if isinstance(obj, date):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's json provider, but datetimes are ISO 8601 and raw JSON column text is decoded"""
+
+    default = staticmethod(_iso_default)
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def raw(self, text: str) -> Any:
+        return json.loads(text)
+
+
+def _orjson_default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """orjson-backed provider: serializes datetimes natively and embeds JSON column text without decoding it"""
+
+    sort_keys = True
+    mimetype = 'application/json'
+
+    def _options(self) -> int:
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self._app.debug:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_orjson_default, option=self._options())
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def raw(self, text: str) -> Any:
+        return orjson.Fragment(text)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def init_app(app) -> None:
+    """Install the JSON provider selected by JSON_PROVIDER ('auto', 'orjson' or 'stdlib')"""
+    choice = app.config['JSON_PROVIDER']
+    if choice == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_PROVIDER=orjson but orjson is not installed")
+    use_orjson = orjson is not None and choice in ('auto', 'orjson')
+    app.json = OrjsonProvider(app) if use_orjson else StdlibJSONProvider(app)
+
+
+def _json_value(provider, text, empty):
+    if text is None or text == '' or text == 'null':
+        return empty
+    return provider.raw(text)
+
+
+def candidate_rows_statement(conditions=(), order_by=None, limit=None):
+    """The candidate row query behind candidate_payloads(), newest first by default"""
+    return (
+        select(Candidate.id, Candidate.name, Candidate.email, Candidate.phone, Candidate.company,
+               Candidate.designation, cast(Candidate.skills, Text), Candidate.resume_filename,
+               Candidate.extraction_status, cast(Candidate.confidence_scores, Text),
+               Candidate.created_at, Candidate.updated_at)
+        .where(*conditions)
+        .order_by(*(order_by or (Candidate.created_at.desc(), Candidate.id.desc())))
+        .limit(limit)
+    )
+
+
+def candidate_payloads(session, provider, conditions=(), order_by=None,
+                       limit=None) -> Tuple[List[Dict[str, Any]], Tuple]:
+    """Serialize candidates straight from row tuples, without hydrating ORM objects.
+
+    Produces the same shape as Candidate.to_dict() in three queries
+    (candidates, documents, document requests), newest first unless
+    `order_by` says otherwise, plus the row versions used for ETags. JSON
+    columns are read as text and handed to the provider, so orjson embeds
+    them as-is.
+    """
+    rows = session.execute(candidate_rows_statement(conditions, order_by, limit)).all()
+    if not rows:
+        return [], ()
+    # A page is looked up by its ids; a full listing by the same conditions, as a subquery
+    candidate_ids = [row[0] for row in rows] if limit else select(Candidate.id).where(*conditions)
+
+    documents = defaultdict(list)
+    for doc_id, candidate_id, document_type, filename, uploaded_at in session.execute(
+        select(Document.id, Document.candidate_id, Document.document_type, Document.filename, Document.uploaded_at)
+        .where(Document.candidate_id.in_(candidate_ids)).order_by(Document.id)
+    ):
+        documents[candidate_id].append({
+            'id': doc_id,
+            'candidate_id': candidate_id,
+            'document_type': document_type,
+            'filename': filename,
+            'uploaded_at': uploaded_at
+        })
+
+    requests = defaultdict(list)
+    for (req_id, candidate_id, message, request_type, status, created_at, opened_at, fulfilled_at, expired_at,
+         reminder_count) in session.execute(
+        select(DocumentRequest.id, DocumentRequest.candidate_id, DocumentRequest.request_message,
+               DocumentRequest.request_type, DocumentRequest.status, DocumentRequest.created_at,
+               DocumentRequest.opened_at, DocumentRequest.fulfilled_at, DocumentRequest.expired_at,
+               DocumentRequest.reminder_count)
+        .where(DocumentRequest.candidate_id.in_(candidate_ids)).order_by(DocumentRequest.id)
+    ):
+        requests[candidate_id].append({
+            'id': req_id,
+            'candidate_id': candidate_id,
+            'request_message': message,
+            'request_type': request_type,
+            'status': status,
+            'created_at': created_at,
+            'opened_at': opened_at,
+            'fulfilled_at': fulfilled_at,
+            'expired_at': expired_at,
+            'reminder_count': reminder_count or 0
+        })
+
+    payloads, versions = [], []
+    for (candidate_id, name, email, phone, company, designation, skills, resume_filename,
+         extraction_status, confidence_scores, created_at, updated_at) in rows:
+        docs, reqs = documents.get(candidate_id, []), requests.get(candidate_id, [])
+        payloads.append({
+            'id': candidate_id,
+            'name': name,
+            'email': email,
+            'phone': phone,
+            'company': company,
+            'designation': designation,
+            'skills': _json_value(provider, skills, []),
+            'resume_filename': resume_filename,
+            'extraction_status': extraction_status,
+            'confidence_scores': _json_value(provider, confidence_scores, {}),
+            'created_at': created_at,
+            'updated_at': updated_at,
+            'documents': docs,
+            'document_requests': reqs
+        })
+        versions.append((
+            candidate_id,
+            updated_at,
+            # Normalization renames a document in place, without touching uploaded_at
+            tuple((doc['id'], doc['uploaded_at'], doc['filename']) for doc in docs),
+            tuple((req['id'], req['status'], req['reminder_count']) for req in reqs)
+        ))
+    return payloads, tuple(versions)
+
+
+def payload_version(session, candidate_id: Optional[int] = None) -> Tuple:
+    """Cheap fingerprint of the rows behind the candidate payloads (all, or one candidate's).
+
+    Row counts, highest ids and the latest candidate updated_at. It changes
+    with every insert and delete of candidates, documents and requests and
+    with every candidate update, whichever process made them; in-place
+    changes to documents and requests do not move it.
+    """
+    probes = []
+    for model, parent, aggregates in ((Candidate, Candidate.id, (Candidate.id, Candidate.updated_at)),
+                                      (Document, Document.candidate_id, (Document.id,)),
+                                      (DocumentRequest, DocumentRequest.candidate_id, (DocumentRequest.id,))):
+        where = (parent == candidate_id,) if candidate_id is not None else ()
+        # One aggregate per subquery, so count(*) and each max() can use their own index shortcut
+        probes.append(select(func.count()).select_from(model).where(*where).scalar_subquery())
+        probes.extend(select(func.max(column)).where(*where).scalar_subquery() for column in aggregates)
+    return tuple(session.execute(select(*probes)).one())
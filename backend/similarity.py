@@ -0,0 +1,225 @@
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select, update
+
+from embeddings import candidate_text, embed_texts, from_bytes, load_vector
+from metrics import timed
+from models import Candidate, Embedding
+from vector_index import VectorIndex, top_k
+
+logger = logging.getLogger(__name__)
+
+
+def _embedded_candidates(model: str):
+    return (select(Candidate.id, Embedding.vector)
+            .join(Embedding, Embedding.content_hash == Candidate.embedding_hash)
+            .where(Embedding.model == model))
+
+
+class SimilarityIndex:
+    """Nearest candidates by embedding: the on-disk VectorIndex plus an exact scan of newer vectors.
+
+    Candidates embedded after the index was built (id above the manifest's
+    max_id) are loaded from the embeddings table into memory as they
+    appear and scanned exactly, so new uploads are searchable at once.
+    Once that tail reaches `rebuild_threshold` vectors a rebuild is started
+    in the background (0 disables; maintenance rebuilds as well).
+    """
+
+    def __init__(self, directory: str, model: str, dim: int, nprobe: int = 8, rebuild_threshold: int = 20000):
+        self.directory = directory
+        self.model = model
+        self.dim = dim
+        self.nprobe = nprobe
+        self.rebuild_threshold = rebuild_threshold
+        self.index = VectorIndex(directory)
+        self._lock = threading.Lock()
+        self._base_id = None
+        self._loaded_id = 0
+        self._tail_ids = np.empty(0, dtype=np.int64)
+        self._tail_vectors = np.empty((0, dim), dtype=np.float32)
+        self._rebuilding = False
+
+    def _usable_manifest(self) -> Optional[dict]:
+        manifest = self.index.refresh()
+        if manifest and manifest['model'] == self.model and manifest['dim'] == self.dim:
+            return manifest
+        return None
+
+    def _sync_tail(self, session, base_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if base_id != self._base_id:
+                keep = self._tail_ids > base_id
+                self._tail_ids, self._tail_vectors = self._tail_ids[keep], self._tail_vectors[keep]
+                self._base_id = base_id
+                self._loaded_id = max(base_id, int(self._tail_ids.max()) if len(self._tail_ids) else base_id)
+            rows = session.execute(
+                _embedded_candidates(self.model).where(Candidate.id > self._loaded_id).order_by(Candidate.id)
+            ).all()
+            if rows:
+                self._tail_ids = np.concatenate([self._tail_ids, np.fromiter((r[0] for r in rows), dtype=np.int64)])
+                self._tail_vectors = np.concatenate([self._tail_vectors, np.stack([from_bytes(r[1]) for r in rows])])
+                self._loaded_id = rows[-1][0]
+            return self._tail_ids, self._tail_vectors
+
+    def search(self, session, vector: np.ndarray, k: int,
+               exclude: Iterable[int] = ()) -> Tuple[List[Tuple[int, float]], int]:
+        """The k most similar (candidate id, cosine score) pairs, best first, and the size of the scanned tail"""
+        exclude = set(exclude)
+        with timed('similarity.search'):
+            manifest = self._usable_manifest()
+            results = self.index.search(vector, k, self.nprobe, exclude) if manifest else []
+            tail_ids, tail_vectors = self._sync_tail(session, manifest['max_id'] if manifest else 0)
+            if len(tail_ids):
+                scores = tail_vectors @ np.asarray(vector, dtype=np.float32)
+                for i in top_k(scores, k + len(exclude)):
+                    if int(tail_ids[i]) not in exclude:
+                        results.append((int(tail_ids[i]), float(scores[i])))
+        results.sort(key=lambda item: -item[1])
+        return results[:k], len(tail_ids)
+
+    def maybe_rebuild(self, app, tail_size: int) -> bool:
+        """Start a background rebuild when the exactly-scanned tail has grown past the threshold"""
+        if not self.rebuild_threshold or tail_size < self.rebuild_threshold:
+            return False
+        with self._lock:
+            if self._rebuilding:
+                return False
+            self._rebuilding = True
+
+        def run():
+            from maintenance import RunLock
+            from models import db
+
+            lock = RunLock(os.path.join(self.directory, '.rebuild.lock'))
+            try:
+                if lock.acquire():
+                    with app.app_context():
+                        rebuild_index(db.session, self.directory, self.model, self.dim)
+                        db.session.remove()
+            except Exception:
+                logger.exception("Vector index rebuild failed")
+            finally:
+                lock.release()
+                self._rebuilding = False
+
+        threading.Thread(target=run, name='vector-index-rebuild', daemon=True).start()
+        return True
+
+
+def unindexed_count(session, directory: str, model: str) -> int:
+    manifest = VectorIndex(directory).refresh()
+    base_id = manifest['max_id'] if manifest and manifest['model'] == model else 0
+    return session.execute(
+        select(func.count()).select_from(_embedded_candidates(model).where(Candidate.id > base_id).subquery())
+    ).scalar()
+
+
+def rebuild_index(session, directory: str, model: str, dim: int, batch_size: int = 5000) -> Optional[dict]:
+    """Build a new index generation from every stored candidate embedding of `model`.
+
+    Vectors are streamed from the database into a memory-mapped staging file,
+    so memory stays flat however many candidates there are.
+    """
+    max_id = session.execute(select(func.max(Candidate.id))).scalar() or 0
+    count = session.execute(select(func.count()).select_from(
+        _embedded_candidates(model).where(Candidate.id <= max_id).subquery()
+    )).scalar()
+    if not count:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    staging = os.path.join(directory, f'staging-{uuid.uuid4().hex[:8]}.npy')
+    try:
+        vectors = np.lib.format.open_memmap(staging, mode='w+', dtype=np.float32, shape=(count, dim))
+        ids = np.empty(count, dtype=np.int64)
+        filled = 0
+        with timed('similarity.rebuild'):
+            rows = session.execute(
+                _embedded_candidates(model).where(Candidate.id <= max_id).order_by(Candidate.id)
+                .execution_options(yield_per=batch_size)
+            )
+            for candidate_id, data in rows:
+                if filled == count:
+                    break
+                ids[filled], vectors[filled] = candidate_id, from_bytes(data)
+                filled += 1
+            vectors.flush()
+            return VectorIndex.build(directory, ids[:filled], vectors[:filled], model)
+    finally:
+        os.remove(staging)
+
+
+def backfill_embeddings(session, embedder, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    """Embed candidates without a vector for the current model (older rows, failed embeds at ingest)"""
+    report = {'scanned': 0, 'embedded': 0}
+    current = select(Embedding.content_hash).where(Embedding.model == embedder.name)
+    missing = (Candidate.embedding_hash.is_(None)) | (Candidate.embedding_hash.not_in(current))
+    last_id = 0
+    while True:
+        rows = session.execute(
+            select(Candidate.id, Candidate.name, Candidate.designation, Candidate.company, Candidate.skills,
+                   Candidate.resume_text, Candidate.resume_sections)
+            .where(missing, Candidate.id > last_id).order_by(Candidate.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return report
+        last_id = rows[-1].id
+        report['scanned'] += len(rows)
+        if dry_run:
+            continue
+        hashes = embed_texts(session, embedder, [candidate_text(*row[1:]) for row in rows])
+        for row, digest in zip(rows, hashes):
+            # updated_at is kept: embeddings are not part of the candidate payloads
+            session.execute(update(Candidate).where(Candidate.id == row.id)
+                            .values(embedding_hash=digest, updated_at=Candidate.updated_at))
+        session.commit()
+        report['embedded'] += len(rows)
+
+
+def candidate_vector(session, embedder, candidate: Candidate) -> np.ndarray:
+    """The candidate's stored vector for the current model, embedding (and storing) it if there is none"""
+    if candidate.embedding_hash:
+        vector = load_vector(session, candidate.embedding_hash)
+        # The hash covers the model name, so a stored vector is always the current model's
+        if vector is not None and len(vector) == embedder.dim:
+            return vector
+    text = candidate_text(candidate.name, candidate.designation, candidate.company, candidate.skills,
+                          candidate.resume_text, candidate.resume_sections)
+    digest = embed_texts(session, embedder, [text])[0]
+    session.execute(update(Candidate).where(Candidate.id == candidate.id)
+                    .values(embedding_hash=digest, updated_at=Candidate.updated_at))
+    session.commit()
+    return load_vector(session, digest)
+
+
+def similar_candidates(session, embedder, similarity_index: SimilarityIndex, candidate: Candidate,
+                       limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Candidates most similar to `candidate`, as summary dicts with a score; also returns the tail size"""
+    vector = candidate_vector(session, embedder, candidate)
+    # Over-fetch: rows deleted since the index was built are dropped below
+    matches, tail_size = similarity_index.search(session, vector, limit + 10, exclude=[candidate.id])
+    if not matches:
+        return [], tail_size
+    rows = {row.id: row for row in session.execute(
+        select(Candidate.id, Candidate.name, Candidate.email, Candidate.company, Candidate.designation,
+               Candidate.skills).where(Candidate.id.in_([candidate_id for candidate_id, _ in matches]))
+    )}
+    results = []
+    for candidate_id, score in matches:
+        row = rows.get(candidate_id)
+        if row is not None:
+            results.append({
+                'id': row.id,
+                'name': row.name,
+                'email': row.email,
+                'company': row.company,
+                'designation': row.designation,
+                'skills': row.skills or [],
+                'score': round(score, 4)
+            })
+    return results[:limit], tail_size
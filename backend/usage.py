@@ -0,0 +1,235 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from flask import g, jsonify, request
+from langchain_core.callbacks import BaseCallbackHandler
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import Config
+from metrics import registry
+from models import db, LlmUsage
+
+logger = logging.getLogger(__name__)
+
+# Conflict target of the aggregate upsert: the columns of the ux_llm_usage_key index
+USAGE_KEY = [LlmUsage.day, func.coalesce(LlmUsage.candidate_id, literal_column('0')), LlmUsage.operation, LlmUsage.model]
+
+# LLM calls made while handling the current request (None outside a request)
+_current_calls: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar('llm_usage_calls', default=None)
+
+llm_call_duration = registry.histogram(
+    'traqcheck_llm_call_duration_seconds',
+    'Wall time of individual LLM calls',
+    ('model', 'outcome')
+)
+llm_tokens = registry.counter(
+    'traqcheck_llm_tokens_total',
+    'Prompt and completion tokens consumed',
+    ('model', 'kind')
+)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """USD cost from Config.LLM_PRICING (per 1M tokens)"""
+    prompt_price, completion_price = Config.LLM_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class LlmUsageCallback(BaseCallbackHandler):
+    """Captures model, tokens, wall time and outcome of every chat model call"""
+
+    def __init__(self):
+        self._runs: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get('invocation_params') or {}
+        model = params.get('model') or params.get('model_name') or (serialized or {}).get('name') or 'unknown'
+        with self._lock:
+            self._runs[run_id] = (model, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model, start = self._pop(run_id)
+        prompt_tokens, completion_tokens = 0, 0
+
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+        if usage:
+            prompt_tokens = usage.get('input_tokens', 0)
+            completion_tokens = usage.get('output_tokens', 0)
+        elif response.llm_output and response.llm_output.get('token_usage'):
+            token_usage = response.llm_output['token_usage']
+            prompt_tokens = token_usage.get('prompt_tokens', 0)
+            completion_tokens = token_usage.get('completion_tokens', 0)
+        if response.llm_output and response.llm_output.get('model_name'):
+            model = response.llm_output['model_name']
+
+        self._record(model, start, 'success', prompt_tokens, completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        model, start = self._pop(run_id)
+        self._record(model, start, 'error', 0, 0)
+
+    def _pop(self, run_id):
+        with self._lock:
+            return self._runs.pop(run_id, ('unknown', time.perf_counter()))
+
+    def _record(self, model, start, outcome, prompt_tokens, completion_tokens):
+        latency = time.perf_counter() - start
+        llm_call_duration.observe(latency, model, outcome)
+        llm_tokens.inc(model, 'prompt', amount=prompt_tokens)
+        llm_tokens.inc(model, 'completion', amount=completion_tokens)
+
+        calls = _current_calls.get()
+        if calls is not None:
+            calls.append({
+                'model': model,
+                'outcome': outcome,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'latency_ms': latency * 1000
+            })
+
+
+usage_callback = LlmUsageCallback()
+
+
+def persist_usage(calls: List[Dict[str, Any]], candidate_id: Optional[int], operation: str) -> None:
+    """Fold a request's LLM calls into the daily aggregate rows"""
+    day = datetime.utcnow().date()
+    by_model: Dict[str, Dict[str, Any]] = {}
+    for call in calls:
+        bucket = by_model.setdefault(call['model'], {
+            'calls': 0, 'errors': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'latency_ms': 0.0
+        })
+        bucket['calls'] += 1
+        bucket['errors'] += call['outcome'] != 'success'
+        bucket['prompt_tokens'] += call['prompt_tokens']
+        bucket['completion_tokens'] += call['completion_tokens']
+        bucket['latency_ms'] += call['latency_ms']
+
+    # One upsert per model with the increments done in SQL, so concurrent requests and
+    # workers add to the same row instead of overwriting each other's counts
+    insert = postgresql.insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    for model, bucket in by_model.items():
+        totals = {
+            'calls': bucket['calls'],
+            'errors': bucket['errors'],
+            'prompt_tokens': bucket['prompt_tokens'],
+            'completion_tokens': bucket['completion_tokens'],
+            'total_latency_ms': bucket['latency_ms'],
+            'cost_usd': estimate_cost(model, bucket['prompt_tokens'], bucket['completion_tokens']),
+        }
+        statement = insert(LlmUsage).values(
+            day=day, candidate_id=candidate_id, operation=operation, model=model, **totals
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=USAGE_KEY,
+            set_={name: getattr(LlmUsage, name) + statement.excluded[name] for name in totals}
+        ))
+    db.session.commit()
+
+
+def attribute_to_candidate(candidate_id: int) -> None:
+    """Attach this request's LLM usage to a candidate created during the request"""
+    g.llm_usage_candidate_id = candidate_id
+
+
+def _usage_query(group_by, since, candidate_id=None):
+    query = db.session.query(
+        *group_by,
+        func.sum(LlmUsage.calls),
+        func.sum(LlmUsage.errors),
+        func.sum(LlmUsage.prompt_tokens),
+        func.sum(LlmUsage.completion_tokens),
+        func.sum(LlmUsage.total_latency_ms),
+        func.sum(LlmUsage.cost_usd)
+    ).filter(LlmUsage.day >= since)
+    if candidate_id is not None:
+        query = query.filter(LlmUsage.candidate_id == candidate_id)
+    return query.group_by(*group_by).order_by(*group_by)
+
+
+def _usage_rows(columns, rows):
+    results = []
+    for row in rows:
+        keys, (calls, errors, prompt_tokens, completion_tokens, latency_ms, cost) = row[:len(columns)], row[len(columns):]
+        item = {name: (value.isoformat() if hasattr(value, 'isoformat') else value) for name, value in zip(columns, keys)}
+        item.update({
+            'calls': calls or 0,
+            'errors': errors or 0,
+            'prompt_tokens': prompt_tokens or 0,
+            'completion_tokens': completion_tokens or 0,
+            'avg_latency_ms': round((latency_ms or 0) / calls, 1) if calls else None,
+            'cost_usd': round(cost or 0, 6)
+        })
+        results.append(item)
+    return results
+
+
+GROUP_BY_COLUMNS = {
+    'day': LlmUsage.day,
+    'candidate': LlmUsage.candidate_id,
+    'operation': LlmUsage.operation,
+    'model': LlmUsage.model
+}
+
+
+def init_app(app) -> None:
+    """Collect LLM calls per request, persist them afterwards and expose usage endpoints"""
+
+    @app.before_request
+    def _start_llm_usage():
+        g.llm_usage_token = _current_calls.set([])
+
+    @app.after_request
+    def _persist_llm_usage(response):
+        calls = _current_calls.get()
+        if calls:
+            candidate_id = g.get('llm_usage_candidate_id') or (request.view_args or {}).get('id')
+            try:
+                persist_usage(calls, candidate_id, request.endpoint or 'unknown')
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to persist LLM usage")
+        return response
+
+    @app.teardown_request
+    def _reset_llm_usage(exc):
+        token = g.pop('llm_usage_token', None)
+        if token is not None:
+            _current_calls.reset(token)
+
+    @app.route('/api/llm-usage', methods=['GET'])
+    def get_llm_usage():
+        """Aggregated LLM usage, e.g. ?group_by=day,operation&days=30"""
+        try:
+            names = [n.strip() for n in request.args.get('group_by', 'day').split(',') if n.strip()]
+            invalid = [n for n in names if n not in GROUP_BY_COLUMNS]
+            if invalid or not names:
+                return jsonify({
+                    "error": f"Invalid group_by. Allowed: {', '.join(GROUP_BY_COLUMNS)}"
+                }), 400
+            days = request.args.get('days', 30, type=int)
+            since = datetime.utcnow().date() - timedelta(days=days)
+            rows = _usage_query([GROUP_BY_COLUMNS[n] for n in names], since).all()
+            return jsonify({"usage": _usage_rows(names, rows)}), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/api/candidates/<int:id>/llm-usage', methods=['GET'])
+    def get_candidate_llm_usage(id):
+        """LLM usage attributed to one candidate, per day/operation/model"""
+        try:
+            days = request.args.get('days', 365, type=int)
+            since = datetime.utcnow().date() - timedelta(days=days)
+            names = ['day', 'operation', 'model']
+            rows = _usage_query([GROUP_BY_COLUMNS[n] for n in names], since, candidate_id=id).all()
+            return jsonify({"candidate_id": id, "usage": _usage_rows(names, rows)}), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+ASSIGN_CHUNK = 65536
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by dot product) of every row, computed in chunks to bound memory"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK], dtype=np.float32)
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, sample_size: int = 100000,
+                    seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a random sample of (normalized) vectors"""
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(len(vectors), size=min(len(vectors), sample_size), replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = np.bincount(labels, minlength=nlist) == 0
+        # Re-seed empty lists with random sample points so every list stays in use
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class VectorIndex:
+    """Approximate nearest-neighbour index over float32 vectors in memory-mapped files (IVF).
+
+    Vectors are clustered with k-means into `nlist` lists and written to disk
+    grouped by list, so a query reads `nprobe` contiguous slices of the
+    memory map and re-scores them exactly. Builds write a new generation of
+    files and then swap manifest.json atomically; every process that has the
+    index open picks up the new generation on its next query.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest = None
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+        # (centroids, offsets, ids, vectors) of the open generation, swapped as one
+        self._state = None
+
+    # --- building ---------------------------------------------------------
+
+    @classmethod
+    def build(cls, directory: str, ids: np.ndarray, vectors: np.ndarray, model: str,
+              nlist: Optional[int] = None, iterations: int = 10, sample_size: int = 100000) -> dict:
+        """Write a new index generation for (ids, vectors) and make it current; returns the manifest.
+
+        `vectors` may itself be a memmap: it is read in chunks, never copied whole.
+        """
+        count, dim = vectors.shape
+        if nlist is None:
+            # ~sqrt(N) lists keeps both the centroid scan and the probed lists small
+            nlist = max(1, min(4096, int(np.sqrt(count))))
+        nlist = min(nlist, count)
+        os.makedirs(directory, exist_ok=True)
+        generation = f"{int(time.time())}-{uuid.uuid4().hex[:6]}"
+        paths = cls._paths(directory, generation)
+
+        started = time.perf_counter()
+        centroids = train_centroids(vectors, nlist, iterations, sample_size)
+        labels = _assign(vectors, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))]).astype(np.int64)
+
+        out = np.lib.format.open_memmap(paths['vectors'], mode='w+', dtype=np.float32, shape=(count, dim))
+        for start in range(0, count, ASSIGN_CHUNK):
+            rows = order[start:start + ASSIGN_CHUNK]
+            # Sorted reads from the source, then scattered back into list order
+            sorted_rows = np.sort(rows)
+            chunk = np.asarray(vectors[sorted_rows], dtype=np.float32)
+            out[start:start + len(rows)] = chunk[np.searchsorted(sorted_rows, rows)]
+        out.flush()
+        del out
+        np.save(paths['ids'], np.asarray(ids, dtype=np.int64)[order])
+        np.save(paths['centroids'], centroids)
+        np.save(paths['offsets'], offsets)
+
+        manifest = {
+            'generation': generation,
+            'model': model,
+            'dim': int(dim),
+            'count': int(count),
+            'nlist': int(nlist),
+            'max_id': int(np.max(ids)) if count else 0,
+            'build_seconds': round(time.perf_counter() - started, 2),
+        }
+        tmp = os.path.join(directory, f'{MANIFEST}.{generation}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        previous = cls._read_manifest(directory)
+        os.replace(tmp, os.path.join(directory, MANIFEST))
+        if previous:
+            # Open memory maps keep the old files readable until their owners reload
+            for path in cls._paths(directory, previous['generation']).values():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        logger.info("Built vector index %s: %d vectors in %d lists (%.1fs)",
+                    generation, count, nlist, manifest['build_seconds'])
+        return manifest
+
+    @staticmethod
+    def _paths(directory: str, generation: str) -> dict:
+        return {name: os.path.join(directory, f'{name}-{generation}.npy')
+                for name in ('vectors', 'ids', 'centroids', 'offsets')}
+
+    @staticmethod
+    def _read_manifest(directory: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(directory, MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # --- querying ---------------------------------------------------------
+
+    def refresh(self) -> Optional[dict]:
+        """(Re)open the current generation if manifest.json changed; returns the manifest or None"""
+        try:
+            mtime = os.stat(os.path.join(self.directory, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime == self._manifest_mtime:
+            return self.manifest
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                manifest = self._read_manifest(self.directory)
+                if manifest is None:
+                    return self.manifest
+                paths = self._paths(self.directory, manifest['generation'])
+                try:
+                    self._state = (np.load(paths['centroids']), np.load(paths['offsets']),
+                                   np.load(paths['ids'], mmap_mode='r'), np.load(paths['vectors'], mmap_mode='r'))
+                except FileNotFoundError:
+                    # Replaced again mid-load; the next query retries
+                    return self.manifest
+                self.manifest, self._manifest_mtime = manifest, mtime
+        return self.manifest
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = 8,
+               exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """The k best (id, cosine score) pairs among the vectors in the `nprobe` closest lists"""
+        state = self._state
+        if state is None:
+            return []
+        centroids, offsets, all_ids, vectors = state
+        query = np.asarray(query, dtype=np.float32)
+        probes = top_k(centroids @ query, min(nprobe, len(centroids)))
+        probes = [p for p in probes if offsets[p + 1] > offsets[p]]
+        if not probes:
+            return []
+        # Probed lists are contiguous in the file: read each as one slice
+        scores = np.concatenate([vectors[offsets[p]:offsets[p + 1]] @ query for p in probes])
+        ids = np.concatenate([all_ids[offsets[p]:offsets[p + 1]] for p in probes])
+        scores[np.isin(ids, np.fromiter(exclude, dtype=np.int64))] = -np.inf
+        return [(int(ids[i]), float(scores[i])) for i in top_k(scores, k) if scores[i] != -np.inf]
@@ -33,6 +33,16 @@ const CandidateProfile = () => {
     fetchCandidate();
   }, [fetchCandidate]);
 
+  // Refresh quietly when another tab or the background pipeline changes this candidate
+  useEffect(() => {
+    const candidateId = Number(id);
+    return candidateService.subscribeToEvents((type, data) => {
+      if (type !== 'candidate.deleted' && data.candidate_id === candidateId) {
+        candidateService.getCandidate(id).then(setCandidate).catch(console.error);
+      }
+    });
+  }, [id]);
+
   const handleRequestDocuments = async () => {
     try {
       setRequesting(true);
@@ -291,8 +301,23 @@ const CandidateProfile = () => {
               <div className="document-list">
                 {candidate.documents.map((doc) => (
                   <div key={doc.id} className="document-item">
+                    {/\.(jpe?g|png|webp)$/i.test(doc.filename) && (
+                      <img
+                        className="document-thumbnail"
+                        src={candidateService.getThumbnailUrl(doc.filename)}
+                        alt={doc.document_type}
+                        loading="lazy"
+                      />
+                    )}
                     <span className="document-type">{doc.document_type.toUpperCase()}</span>
-                    <span className="document-filename">{doc.filename}</span>
+                    <a
+                      className="document-filename"
+                      href={candidateService.getDocumentUrl(doc.filename)}
+                      target="_blank"
+                      rel="noopener noreferrer"
+                    >
+                      {doc.filename}
+                    </a>
                     <span className="document-date">
                       {new Date(doc.uploaded_at).toLocaleDateString()}
                     </span>
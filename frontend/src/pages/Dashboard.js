@@ -23,12 +23,37 @@ const Dashboard = () => {
     }
   };
 
+  // Replace a candidate in place, or add it to the top of the list
+  const upsertCandidate = (candidate) => {
+    setCandidates((current) =>
+      current.some((c) => c.id === candidate.id)
+        ? current.map((c) => (c.id === candidate.id ? candidate : c))
+        : [candidate, ...current]
+    );
+  };
+
   useEffect(() => {
     fetchCandidates();
+
+    // Apply change events to the loaded list instead of reloading it
+    return candidateService.subscribeToEvents(async (type, data) => {
+      if (type === 'reset') {
+        fetchCandidates();
+      } else if (type === 'candidate.deleted') {
+        const deleted = new Set(data.candidate_ids);
+        setCandidates((current) => current.filter((c) => !deleted.has(c.id)));
+      } else {
+        try {
+          upsertCandidate(await candidateService.getCandidate(data.candidate_id));
+        } catch (err) {
+          console.error(err);
+        }
+      }
+    });
   }, []);
 
   const handleUploadSuccess = (newCandidate) => {
-    setCandidates([newCandidate, ...candidates]);
+    upsertCandidate(newCandidate);
   };
 
   return (
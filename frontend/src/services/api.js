@@ -9,6 +9,18 @@ const api = axios.create({
   },
 });
 
+// Change events pushed by GET /api/events
+export const CANDIDATE_EVENTS = [
+  'candidate.created',
+  'candidate.parsed',
+  'candidate.failed',
+  'candidate.deleted',
+  'documents.submitted',
+  'request.generated',
+  'request.updated',
+  'reset',
+];
+
 export const candidateService = {
   // Upload resume
   uploadResume: async (file, onUploadProgress) => {
@@ -30,6 +42,13 @@ export const candidateService = {
     return response.data;
   },
 
+  // Filtered, sorted page of candidates, e.g. queryCandidates('status:completed skill:python sort:-created').
+  // Pass the returned next_cursor back to get the following page.
+  queryCandidates: async (q, { limit = 50, cursor } = {}) => {
+    const response = await api.get('/candidates/query', { params: { q, limit, cursor } });
+    return response.data;
+  },
+
   // Get single candidate
   getCandidate: async (id) => {
     const response = await api.get(`/candidates/${id}`);
@@ -42,6 +61,18 @@ export const candidateService = {
     return response.data;
   },
 
+  // Record that the candidate opened a document request
+  markRequestOpened: async (requestId) => {
+    const response = await api.post(`/document-requests/${requestId}/opened`);
+    return response.data;
+  },
+
+  // Page of a request worklist: overdue, reminders, sent, opened, fulfilled or expired
+  getRequestWorklist: async (name, { limit = 50, cursor } = {}) => {
+    const response = await api.get(`/document-requests/worklists/${name}`, { params: { limit, cursor } });
+    return response.data;
+  },
+
   // Submit documents
   submitDocuments: async (id, panFile, aadhaarFile) => {
     const formData = new FormData();
@@ -55,6 +86,23 @@ export const candidateService = {
     });
     return response.data;
   },
+
+  // Live change events; EventSource reconnects and resumes from the last event id on its own.
+  // Returns a function that closes the stream.
+  subscribeToEvents: (onEvent) => {
+    const source = new EventSource(`${API_BASE_URL}/events`);
+    CANDIDATE_EVENTS.forEach((type) =>
+      source.addEventListener(type, (event) => onEvent(type, JSON.parse(event.data)))
+    );
+    return () => source.close();
+  },
+
+  // URL of a stored document
+  getDocumentUrl: (filename) => `${API_BASE_URL}/documents/${encodeURIComponent(filename)}`,
+
+  // URL of a cached preview thumbnail (image documents only)
+  getThumbnailUrl: (filename, size = 128) =>
+    `${API_BASE_URL}/thumbnails/${encodeURIComponent(filename)}?size=${size}`,
 };
 
 export default api;
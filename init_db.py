@@ -1,6 +1,6 @@
 """
 Initialize database tables for TraqCheck
-Run this script after setting up your PostgreSQL database
+Run this script after setting up your PostgreSQL database (applies all schema migrations)
 """
 import os
 import sys
@@ -9,16 +9,23 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
 
 from app import create_app
+from config import Config
 from models import db
+import migrations
 
 def init_database():
     """Create all database tables"""
-    app = create_app()
+    # Skip create_app's schema check (with AUTO_MIGRATE=false it refuses to start on a pending schema)
+    # and its outbox threads, which would poll tables that do not exist yet
+    class InitConfig(Config):
+        DEFER_BACKGROUND_WORKERS = True
+    
+    app = create_app(InitConfig, check_schema=False)
     
     with app.app_context():
-        print("Creating database tables...")
-        db.create_all()
-        print("✅ Database tables created successfully!")
+        print("Applying schema migrations...")
+        applied = migrations.upgrade(db.engine)
+        print(f"✅ Applied {len(applied)} migration(s)" if applied else "✅ Schema is already up to date")
         
         # Verify tables
         from sqlalchemy import inspect